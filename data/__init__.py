@@ -17,6 +17,17 @@ DATASETS = [
     "peterson",
 ]
 
+# categories of Peterson et al. (2016) and stimulus sets of King et al. (2019)
+CATEGORIES = [
+    "animals",
+    "automobiles",
+    "fruits",
+    "furniture",
+    "various",
+    "vegetables",
+]
+STIMULUS_SETS = ["set1", "set2"]
+
 
 def load_dataset(name: str, data_dir: str, category=None, stimulus_set=None, download=True, transform=None):
     if name == "cifar100-coarse":
@@ -27,6 +38,22 @@ def load_dataset(name: str, data_dir: str, category=None, stimulus_set=None, dow
             download=True,
             transform=transform,
         )
+    elif name == "cifar100-fine":
+        dataset = CIFAR100Triplet(
+            triplet_path=os.path.join(data_dir, "cifar100_fine_triplets.npy"),
+            root=data_dir,
+            train=True,
+            download=True,
+            transform=transform,
+        )
+    elif name == "cifar10":
+        dataset = CIFAR10Triplet(
+            triplet_path=os.path.join(data_dir, "cifar10_triplets.npy"),
+            root=data_dir,
+            train=True,
+            download=True,
+            transform=transform,
+        )
     elif name == "things":
         dataset = THINGSBehavior(
             root=data_dir, aligned=False, download=download, transform=transform
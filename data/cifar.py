@@ -1,8 +1,8 @@
-import os
-
 import numpy as np
 from torchvision.datasets import CIFAR10, CIFAR100
 
+from utils.triplets import load_triplet_file
+
 Array = np.ndarray
 
 
@@ -149,9 +149,8 @@ class CIFAR100Coarse(CIFAR100):
 
 
 def load_triplets(triplet_path: str) -> Array:
-    with open(os.path.join(triplet_path), "rb") as f:
-        triplets = np.load(f).astype(int)
-    return triplets
+    """Memory-mapped triplets with compact (uint16 or uint32) object indices."""
+    return load_triplet_file(triplet_path)
 
 
 class CIFAR100CoarseTriplet(CIFAR100Coarse):
@@ -175,6 +174,10 @@ class CIFAR100Triplet(CIFAR100):
     def get_triplets(self):
         return self.triplets
 
+    def __getitem__(self, item):
+        x, y = super().__getitem__(item)
+        return x
+
 
 class CIFAR10Triplet(CIFAR10):
     def __init__(self, root, triplet_path: str, *args, **kwargs):
@@ -183,3 +186,7 @@ class CIFAR10Triplet(CIFAR10):
 
     def get_triplets(self):
         return self.triplets
+
+    def __getitem__(self, item):
+        x, y = super().__getitem__(item)
+        return x
@@ -11,6 +11,8 @@ import pandas as pd
 import torch
 from PIL import Image
 
+from utils.triplets import load_things_triplets
+
 Array = np.ndarray
 Tensor = torch.Tensor
 
@@ -34,26 +36,20 @@ class THINGSTriplet(torch.utils.data.Dataset):
         else:
             f = os.path.join(self.root, "concepts", "things_concepts.tsv")
 
+        # memory-mapped (uint16) triplets; train and test triplets are stored pre-concatenated
+        store = load_things_triplets(root)
         if self.aligned:
             # load aligned triplets (i.e., triplets correctly predicted by VICE)
-            self.triplets = self.load_triplets(root, file_name="correct_triplets.npy")
+            self.triplets = store["aligned"]
         else:
             # load train and test triplets (i.e., all triplets)
-            train_triplets = self.load_triplets(root, file_name="train_90.npy")
-            val_triplets = self.load_triplets(root, file_name="test_10.npy")
-            self.triplets = np.vstack((train_triplets, val_triplets))
+            self.triplets = store["all"]
 
         things_objects = pd.read_csv(f, sep="\t", encoding="utf-8")
         object_names = things_objects["uniqueID"].values
 
         self.names = list(map(lambda n: n + ".jpg", object_names))
 
-    @staticmethod
-    def load_triplets(root: str, file_name: str) -> Array:
-        with open(os.path.join(root, "triplets", file_name), "rb") as f:
-            triplets = np.load(f).astype(int)
-        return triplets
-
     def __getitem__(self, index: int) -> Tuple[Tensor, Tensor, Tensor, int]:
         triplet = self.triplets[index]
         images = []
@@ -88,26 +84,20 @@ class THINGSBehavior(torch.utils.data.Dataset):
         else:
             concept_file = os.path.join(self.root, "concepts", "things_concepts.tsv")
 
+        # memory-mapped (uint16) triplets; train and test triplets are stored pre-concatenated
+        store = load_things_triplets(root)
         if self.aligned:
             # load aligned triplets (i.e., triplets correctly predicted by VICE)
-            self.triplets = self.load_triplets(root, file_name="correct_triplets.npy")
+            self.triplets = store["aligned"]
         else:
             # load train and test triplets (i.e., all triplets)
-            train_triplets = self.load_triplets(root, file_name="train_90.npy")
-            val_triplets = self.load_triplets(root, file_name="test_10.npy")
-            self.triplets = np.vstack((train_triplets, val_triplets))
+            self.triplets = store["all"]
 
         # load object concept names according to which images have to be sorted
         things_objects = pd.read_csv(concept_file, sep="\t", encoding="utf-8")
         object_names = things_objects["uniqueID"].values
         self.names = list(map(lambda n: n + ".jpg", object_names))
 
-    @staticmethod
-    def load_triplets(root: str, file_name: str) -> Array:
-        with open(os.path.join(root, "triplets", file_name), "rb") as f:
-            triplets = np.load(f).astype(int)
-        return triplets
-
     def __getitem__(self, idx: int) -> Tuple[Tensor, Tensor, Tensor, int]:
         img = os.path.join(self.root, "images", self.names[idx])
         img = Image.open(img)
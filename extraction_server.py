@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import argparse
+import hashlib
+import os
+import tempfile
+import time
+import traceback
+from collections import OrderedDict
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import torch
+
+import utils
+from data import load_dataset
+
+Array = np.ndarray
+
+
+def parseargs():
+    parser = argparse.ArgumentParser()
+
+    def aa(*args, **kwargs):
+        parser.add_argument(*args, **kwargs)
+
+    aa(
+        "--socket",
+        type=str,
+        default=None,
+        help="path/to/unix/socket on which the server listens (defaults to a per-user directory with mode 0700)",
+    )
+    aa("--device", type=str, default="cpu")
+    aa(
+        "--max_models",
+        type=int,
+        default=2,
+        help="number of extractors that are kept in memory (least recently used are evicted first)",
+    )
+    aa(
+        "--max_features",
+        type=int,
+        default=32,
+        help="number of feature matrices that are kept in shared memory for repeated requests",
+    )
+    aa(
+        "--eviction_delay",
+        type=float,
+        default=60.0,
+        help="seconds for which evicted feature files are kept, such that clients can still map them",
+    )
+    aa(
+        "--cache_dir",
+        type=str,
+        default=None,
+        help="directory for memory-mapped features (defaults to /dev/shm if available)",
+    )
+    aa(
+        "--num_workers",
+        type=int,
+        default=0,
+        help="number of background workers that decode and transform images during extraction",
+    )
+    aa("--prefetch", type=int, default=2)
+    aa(
+        "--memory_budget",
+        type=float,
+        default=None,
+        help="peak memory in GB under which batch sizes are tuned (unless requests specify one)",
+    )
+    aa(
+        "--num_threads",
+        type=int,
+        default=4,
+        help="number of threads used for intraop parallelism on CPU; use only if device is CPU",
+    )
+    aa("--verbose", action="store_true")
+    args = parser.parse_args()
+    return args
+
+
+def get_cache_dir(cache_dir: Optional[str]) -> str:
+    """Directory with mode 0700 for the memory-mapped features, which only the current user can read."""
+    if cache_dir is None:
+        root = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+        return tempfile.mkdtemp(prefix="human_alignment_", dir=root)
+    os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+    return cache_dir
+
+
+class ExtractionServer:
+    """Long-lived process that keeps extractors warm and serves features over a Unix socket.
+
+    Extractors are kept in an LRU pool of size <max_models>. Features are written into .npy
+    files in <cache_dir>, which clients memory-map, and the <max_features> most recent ones are
+    kept, such that repeated requests (e.g., one per temperature) do not extract again. Evicted
+    files are deleted after <eviction_delay> seconds, so clients that have just received their
+    path can still map them. Requests are handled one at a time.
+    """
+
+    def __init__(
+        self,
+        address: str,
+        device: str,
+        max_models: int,
+        max_features: int,
+        cache_dir: str,
+        eviction_delay: float = 60.0,
+        num_workers: int = 0,
+        prefetch: int = 2,
+        memory_budget: Optional[float] = None,
+        verbose: bool = False,
+    ):
+        self.address = address
+        self.device = device
+        self.max_models = max_models
+        self.max_features = max_features
+        self.cache_dir = cache_dir
+        self.eviction_delay = eviction_delay
+        self.num_workers = num_workers
+        self.prefetch = prefetch
+        self.memory_budget = memory_budget
+        self.verbose = verbose
+        self.extractors = OrderedDict()
+        self.backends = {}
+        self.batch_sizes = {}
+        self.features = OrderedDict()
+        # (time of eviction, path) of feature files that clients may not have mapped yet
+        self.evicted: List[Tuple[float, str]] = []
+
+    def get_extractor(
+        self, model_name: str, source: str, pretrained: bool, extract_cls_token: bool
+    ) -> Tuple[Tuple[str, str, bool, bool], Any]:
+        key = (model_name, source, pretrained, extract_cls_token)
+        if key in self.extractors:
+            self.extractors.move_to_end(key)
+            return key, self.extractors[key]
+        if len(self.extractors) == self.max_models:
+            evicted, _ = self.extractors.popitem(last=False)
+            self.backends = {k: v for k, v in self.backends.items() if k[0] != evicted}
+            if str(self.device).startswith("cuda"):
+                torch.cuda.empty_cache()
+            if self.verbose:
+                print(f"\nEvicted {evicted[0]} ({evicted[1]}).\n")
+        self.extractors[key] = utils.evaluation.load_extractor(
+            model_name=model_name,
+            source=source,
+            device=self.device,
+            pretrained=pretrained,
+            extract_cls_token=extract_cls_token,
+        )
+        return key, self.extractors[key]
+
+    def remove_evicted(self, delay: float) -> None:
+        """Delete evicted feature files that were evicted more than <delay> seconds ago."""
+        cached_paths = {path for path, _ in self.features.values()}
+        now = time.monotonic()
+        pending = []
+        for evicted_at, path in self.evicted:
+            if now - evicted_at < delay:
+                pending.append((evicted_at, path))
+            elif path not in cached_paths and os.path.exists(path):
+                # clients that already map the file keep access to its content
+                os.remove(path)
+        self.evicted = pending
+
+    def cache_features(
+        self, key: Tuple, features: Array, stats: Dict[str, float]
+    ) -> str:
+        name = hashlib.sha1(repr(key).encode()).hexdigest()
+        path = os.path.join(self.cache_dir, f"{name}.npy")
+        # features are written to a new file, which replaces the path atomically, such that
+        # clients that map an earlier file of the same key are not affected
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".npy")
+        with os.fdopen(fd, "wb") as f:
+            np.save(f, features)
+        os.replace(tmp_path, path)
+        if len(self.features) == self.max_features:
+            _, (evicted_path, _) = self.features.popitem(last=False)
+            self.evicted.append((time.monotonic(), evicted_path))
+        self.features[key] = (path, stats)
+        self.remove_evicted(self.eviction_delay)
+        return path
+
+    def extract(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        features_key = tuple(
+            request[k]
+            for k in (
+                "model_name",
+                "source",
+                "module_name",
+                "dataset",
+                "data_root",
+                "category",
+                "stimulus_set",
+                "pretrained",
+                "extract_cls_token",
+                "backend",
+            )
+        )
+        if features_key in self.features:
+            self.features.move_to_end(features_key)
+            path, stats = self.features[features_key]
+            return {"path": path, "stats": {**stats, "cached": True}}
+
+        model_key, extractor = self.get_extractor(
+            request["model_name"],
+            request["source"],
+            request["pretrained"],
+            request["extract_cls_token"],
+        )
+        dataset = load_dataset(
+            name=request["dataset"],
+            data_dir=request["data_root"],
+            category=request["category"],
+            stimulus_set=request["stimulus_set"],
+            transform=utils.evaluation.get_transformations(
+                extractor=extractor,
+                model_name=request["model_name"],
+                dataset=request["dataset"],
+            ),
+        )
+        backend = None
+        if request["backend"] != "eager":
+            backend_key = (model_key, request["module_name"], request["backend"])
+            if backend_key not in self.backends:
+                self.backends[backend_key] = utils.evaluation.load_backend(
+                    extractor, request["module_name"], request["backend"]
+                )
+            backend = self.backends[backend_key]
+        batch_size = request["batch_size"]
+        batch_size_key = (
+            model_key,
+            request["module_name"],
+            utils.evaluation.get_backend_name(backend),
+        )
+        if batch_size is None:
+            batch_size = self.batch_sizes.get(batch_size_key)
+        batch_size = utils.evaluation.get_batch_size(
+            extractor=extractor,
+            dataset=dataset,
+            model_name=request["model_name"],
+            module_name=request["module_name"],
+            batch_size=batch_size,
+            memory_budget=request["memory_budget"] or self.memory_budget,
+            backend=backend,
+            verbose=self.verbose,
+        )
+        if request["batch_size"] is None:
+            # tuned batch sizes are reused for all datasets of a module and backend
+            self.batch_sizes[batch_size_key] = batch_size
+        stats = {}
+        features = utils.evaluation.extract_features(
+            extractor=extractor,
+            dataset=dataset,
+            model_name=request["model_name"],
+            source=request["source"],
+            module=request["module"],
+            module_name=request["module_name"],
+            batch_size=batch_size,
+            num_workers=self.num_workers,
+            prefetch=self.prefetch,
+            stats=stats,
+            backend=backend,
+        )
+        stats["batch_size"] = batch_size
+        path = self.cache_features(features_key, features, stats)
+        if self.verbose:
+            print(
+                f"\nModel: {request['model_name']}, Dataset: {request['dataset']}, Module: {request['module']}, Extraction: {stats['extraction_time']:.1f}s\n"
+            )
+        return {"path": path, "stats": {**stats, "cached": False}}
+
+    def handle(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        try:
+            if request["command"] == "ping":
+                return {"status": "ok"}
+            elif request["command"] == "extract":
+                return self.extract(request)
+            raise ValueError(f"\nUnknown command: {request['command']}\n")
+        except Exception:
+            return {"error": traceback.format_exc()}
+
+    def serve(self) -> None:
+        if os.path.exists(self.address):
+            # remove the socket of a server that did not shut down cleanly
+            os.remove(self.address)
+        listener = Listener(
+            self.address, family="AF_UNIX", authkey=utils.evaluation.get_authkey()
+        )
+        os.chmod(self.address, 0o600)
+        print(f"\nListening on {self.address}...\n")
+        try:
+            while True:
+                try:
+                    conn = listener.accept()
+                except AuthenticationError:
+                    continue
+                with conn:
+                    try:
+                        request = conn.recv()
+                    except EOFError:
+                        continue
+                    if request["command"] == "shutdown":
+                        conn.send({"status": "ok"})
+                        break
+                    conn.send(self.handle(request))
+        finally:
+            listener.close()
+            for path, _ in self.features.values():
+                os.remove(path)
+            self.remove_evicted(delay=0.0)
+
+
+if __name__ == "__main__":
+    args = parseargs()
+    if args.device.lower().startswith("cpu"):
+        torch.set_num_threads(args.num_threads)
+    server = ExtractionServer(
+        address=args.socket or utils.evaluation.get_default_socket(),
+        device=args.device,
+        max_models=args.max_models,
+        max_features=args.max_features,
+        cache_dir=get_cache_dir(args.cache_dir),
+        eviction_delay=args.eviction_delay,
+        num_workers=args.num_workers,
+        prefetch=args.prefetch,
+        memory_budget=args.memory_budget,
+        verbose=args.verbose,
+    )
+    server.serve()
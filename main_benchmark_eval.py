@@ -0,0 +1,579 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import argparse
+import itertools
+import os
+import random
+import re
+import time
+import warnings
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import torch
+from torch.utils.data import Subset
+from tqdm import tqdm
+
+import utils
+from data import CATEGORIES, DATASETS, STIMULUS_SETS, load_dataset
+
+FrozenDict = Any
+Tensor = torch.Tensor
+Array = np.ndarray
+
+RSA_DATASETS = ["multi-arrangement", "free-arrangement", "peterson"]
+
+
+def parseargs():
+    parser = argparse.ArgumentParser()
+
+    def aa(*args, **kwargs):
+        parser.add_argument(*args, **kwargs)
+
+    aa(
+        "--datasets",
+        type=str,
+        nargs="+",
+        choices=DATASETS,
+        help="datasets on which every model is evaluated",
+    )
+    aa(
+        "--data_roots",
+        type=str,
+        nargs="+",
+        help="path/to/dataset for each dataset (in the same order as --datasets)",
+    )
+    aa(
+        "--stimulus_set",
+        type=str,
+        nargs="+",
+        default=["all"],
+        choices=STIMULUS_SETS + ["all"],
+        help="stimulus sets of King et al. (2019) that are evaluated for the free-arrangement dataset",
+    )
+    aa(
+        "--category",
+        type=str,
+        nargs="+",
+        default=["all"],
+        choices=CATEGORIES + ["all"],
+        help="categories of Peterson et al. (2016) that are evaluated for the peterson dataset",
+    )
+    aa(
+        "--model_names",
+        type=str,
+        nargs="+",
+        help="models for which we want to extract featues",
+    )
+    aa(
+        "--modules",
+        type=str,
+        nargs="+",
+        default=["penultimate"],
+        choices=["logits", "penultimate"],
+        help="modules for which to extract features",
+    )
+    aa("--overall_source", type=str, default="thingsvision")
+    aa(
+        "--sources",
+        type=str,
+        nargs="+",
+        choices=[
+            "custom",
+            "timm",
+            "torchvision",
+            "vissl",
+            "ssl",
+        ],
+        help="Source of (pretrained) models",
+    )
+    aa(
+        "--model_dict_path",
+        type=str,
+        default="/home/space/datasets/things/model_dict.json",
+        help="Path to the model_dict.json",
+    )
+    aa(
+        "--distance",
+        type=str,
+        default="cosine",
+        choices=["cosine", "euclidean", "dot"],
+        help="distance function used to predict the odd-one-out",
+    )
+    aa(
+        "--batch_size",
+        metavar="B",
+        type=int,
+        default=None,
+        help="number of images sampled during each step (i.e., mini-batch size); tuned automatically if not set",
+    )
+    aa(
+        "--memory_budget",
+        type=float,
+        default=None,
+        help="peak memory in GB (RSS on CPU, allocated memory on CUDA) under which the batch size is tuned; defaults to 80% of the device memory",
+    )
+    aa(
+        "--num_workers",
+        type=int,
+        default=0,
+        help="number of background workers that decode and transform images during extraction",
+    )
+    aa(
+        "--prefetch",
+        type=int,
+        default=2,
+        help="number of batches prefetched by each background worker",
+    )
+    aa(
+        "--backend",
+        type=str,
+        default="eager",
+        choices=utils.evaluation.BACKENDS,
+        help="inference backend used for the forward pass during extraction",
+    )
+    aa(
+        "--check_parity",
+        action="store_true",
+        help="compare features of the inference backend against eager mode for the first batch",
+    )
+    aa(
+        "--out_path",
+        type=str,
+        default="/home/space/datasets/things/results/",
+        help="path/to/results",
+    )
+    aa(
+        "--device",
+        type=str,
+        default="cuda",
+        help="whether evaluation should be performed on CPU or GPU (i.e., CUDA).",
+    )
+    aa(
+        "--num_threads",
+        type=int,
+        default=4,
+        help="number of threads used for intraop parallelism on CPU; use only if device is CPU",
+    )
+    aa(
+        "--rnd_seed",
+        type=int,
+        default=42,
+        help="random seed for reproducibility of results",
+    )
+    aa(
+        "--server_socket",
+        type=str,
+        default=None,
+        help="path/to/socket of a running extraction_server.py (defaults to its default socket); features are extracted locally if it is not available",
+    )
+    aa(
+        "--verbose",
+        action="store_true",
+        help="whether to show print statements about model performance",
+    )
+    aa(
+        "--not_pretrained",
+        action="store_true",
+        help="load random model instead of pretrained",
+    )
+    aa(
+        "--extract_cls_token",
+        action="store_true",
+        help="whether to exclusively extract the [cls] token for DINO models",
+    )
+    args = parser.parse_args()
+    return args
+
+
+def get_module_name(model_config: Dict[str, Any], model: str, module: str) -> str:
+    """Get original module name for logits or penultimate layer."""
+    try:
+        return model_config[model][module]["module_name"]
+    except KeyError:
+        raise Exception(
+            f"\nMissing module name for {model}. Check config file and add module name.\nAborting evaluation run...\n"
+        )
+
+
+def get_temperature(
+    model_config: Dict[str, Any], model: str, module: str, objective: str = "cosine"
+) -> float:
+    """Get optimal temperature value for a model and module (defaults to 1)."""
+    try:
+        return model_config[model][module]["temperature"][objective]
+    except KeyError:
+        warnings.warn(
+            f"\nMissing temperature value for {model} and {module} layer.\nSetting temperature value to 1.\n"
+        )
+        return 1.0
+
+
+def get_subsets(args, dataset: str) -> List[Tuple[str, str]]:
+    """Get the categories or stimulus sets that are evaluated for a dataset."""
+    if dataset == "peterson":
+        categories = CATEGORIES if "all" in args.category else args.category
+        return [(category, None) for category in categories]
+    if dataset == "free-arrangement":
+        stimulus_sets = (
+            STIMULUS_SETS if "all" in args.stimulus_set else args.stimulus_set
+        )
+        return [(None, stimulus_set) for stimulus_set in stimulus_sets]
+    return [(None, None)]
+
+
+def score_triplets(
+    features: Array, dataset: Any, temperature: float, distance: str
+) -> Dict[str, Any]:
+    """Predict the odd-one-out for every triplet of a dataset."""
+    if features[0].dtype == np.float16:
+        features = features.astype(np.float32)
+    choices, probas = utils.evaluation.get_predictions(
+        features, dataset.get_triplets(), temperature, distance
+    )
+    entropies = utils.evaluation.ventropy(probas)
+    return {
+        "zero-shot": utils.evaluation.accuracy(choices),
+        "choices": choices.cpu().numpy(),
+        "entropies": entropies.cpu().numpy(),
+        "probas": probas.cpu().numpy(),
+    }
+
+
+def score_rsa(features: Array, rsa: utils.evaluation.RSA) -> Dict[str, float]:
+    """Compare the RDM of a model against the human RDM of a dataset."""
+    rsa_stats = rsa.compare([features])[0]
+    return {
+        "spearman_rho_cosine": rsa_stats["spearman_rho_cosine_kernel"],
+        "pearson_corr_cosine": rsa_stats["pearson_corr_coef_cosine_kernel"],
+        "spearman_rho_correlation": rsa_stats["spearman_rho_corr_kernel"],
+        "pearson_corr_correlation": rsa_stats["pearson_corr_coef_corr_kernel"],
+    }
+
+
+def save_results(
+    results: pd.DataFrame,
+    features: Array,
+    out_path: str,
+    source: str,
+    model: str,
+    module: str,
+) -> None:
+    if not os.path.exists(out_path):
+        os.makedirs(out_path)
+    # summary metrics go to a CSV file and per-triplet arrays to memory-mappable .npy files
+    # load back with utils.evaluation.load_results(/path/to/results)
+    utils.evaluation.save_results(results, out_path)
+    if "choices" in results.columns:
+        failures = utils.evaluation.get_failures(results)
+        failures.to_pickle(os.path.join(out_path, "failures.pkl"))
+    utils.evaluation.save_features(
+        features={source: {model: {module: features}}}, out_path=out_path
+    )
+
+
+def check_parity(
+    extractor: Any,
+    dataset: Any,
+    features: Array,
+    model_name: str,
+    source: str,
+    module: str,
+    module_name: str,
+    batch_size: int,
+    args,
+) -> Tuple[bool, float]:
+    """Compare the features of an inference backend against eager mode for the first batch."""
+    n_images = min(len(dataset), batch_size)
+    reference = utils.evaluation.extract_features(
+        extractor=extractor,
+        dataset=Subset(dataset, indices=range(n_images)),
+        model_name=model_name,
+        source=source,
+        module=module,
+        module_name=module_name,
+        batch_size=batch_size,
+    )
+    parity, max_abs_diff = utils.evaluation.check_parity(reference, features[:n_images])
+    if not parity:
+        warnings.warn(
+            message=f"\nFeatures of the {args.backend} backend deviate from eager mode for {model_name} ({module}); maximum absolute difference: {max_abs_diff:.2e}.\n",
+            category=UserWarning,
+        )
+    return parity, max_abs_diff
+
+
+def get_out_path(
+    args,
+    dataset: str,
+    category: str,
+    stimulus_set: str,
+    source: str,
+    model: str,
+    module: str,
+) -> str:
+    return os.path.join(
+        args.out_path,
+        dataset,
+        *filter(None, (category, stimulus_set)),
+        args.overall_source,
+        source,
+        model,
+        module,
+    )
+
+
+def evaluate_model(
+    args,
+    model_name: str,
+    source: str,
+    tasks: List[Tuple[str, str]],
+    model_config: Dict[str, Any],
+    rsa_engines: Dict[Tuple[str, str, str], Any] = None,
+    client: Optional[Any] = None,
+) -> List[Dict[str, Any]]:
+    """Evaluate a single model on a list of (dataset, module) tasks while loading it only once.
+
+    If an extraction <client> is provided, features are requested from the extraction server.
+    """
+    if rsa_engines is None:
+        rsa_engines = {}
+    data_roots = dict(zip(args.datasets, args.data_roots))
+    modules_per_dataset = defaultdict(list)
+    for dataset_name, module in tasks:
+        modules_per_dataset[dataset_name].append(module)
+    family_name = (
+        "DINO"
+        if re.search(r"dino", model_name)
+        else utils.analyses.get_family_name(model_name)
+    )
+    start = time.perf_counter()
+    # with an extraction server, the model is loaded (and kept warm) by the server
+    extractor = None
+    if client is None:
+        extractor = utils.evaluation.load_extractor(
+            model_name=model_name,
+            source=source,
+            device=args.device,
+            pretrained=not args.not_pretrained,
+            extract_cls_token=args.extract_cls_token,
+        )
+    load_time = time.perf_counter() - start
+    # optimized inference graphs are built once per module and reused across datasets
+    backends = {}
+    # the batch size is tuned for the first task and reused for all others
+    batch_size = args.batch_size
+    timings = []
+    for dataset_name, modules in modules_per_dataset.items():
+        transformations = None
+        if extractor is not None:
+            transformations = utils.evaluation.get_transformations(
+                extractor=extractor, model_name=model_name, dataset=dataset_name
+            )
+        for category, stimulus_set in get_subsets(args, dataset_name):
+            dataset = load_dataset(
+                name=dataset_name,
+                data_dir=data_roots[dataset_name],
+                category=category,
+                stimulus_set=stimulus_set,
+                transform=transformations,
+            )
+            for module in modules:
+                module_name = get_module_name(model_config, model_name, module)
+                stats = {}
+                if client is not None:
+                    features = client.extract_features(
+                        model_name=model_name,
+                        source=source,
+                        module=module,
+                        module_name=module_name,
+                        dataset=dataset_name,
+                        data_root=data_roots[dataset_name],
+                        category=category,
+                        stimulus_set=stimulus_set,
+                        batch_size=args.batch_size,
+                        memory_budget=args.memory_budget,
+                        pretrained=not args.not_pretrained,
+                        extract_cls_token=args.extract_cls_token,
+                        backend=args.backend,
+                        stats=stats,
+                    )
+                    batch_size = stats["batch_size"]
+                    backend = None
+                else:
+                    backend = None
+                    if args.backend != "eager":
+                        if module not in backends:
+                            backends[module] = utils.evaluation.load_backend(
+                                extractor, module_name, args.backend
+                            )
+                        backend = backends[module]
+                    batch_size = utils.evaluation.get_batch_size(
+                        extractor=extractor,
+                        dataset=dataset,
+                        model_name=model_name,
+                        module_name=module_name,
+                        batch_size=batch_size,
+                        memory_budget=args.memory_budget,
+                        backend=backend,
+                        verbose=args.verbose,
+                    )
+                    features = utils.evaluation.extract_features(
+                        extractor=extractor,
+                        dataset=dataset,
+                        model_name=model_name,
+                        source=source,
+                        module=module,
+                        module_name=module_name,
+                        batch_size=batch_size,
+                        num_workers=args.num_workers,
+                        prefetch=args.prefetch,
+                        stats=stats,
+                        backend=backend,
+                    )
+                extraction_time = stats["extraction_time"]
+                parity, max_abs_diff = None, None
+                if backend is not None and args.check_parity:
+                    parity, max_abs_diff = check_parity(
+                        extractor,
+                        dataset,
+                        features,
+                        model_name,
+                        source,
+                        module,
+                        module_name,
+                        batch_size,
+                        args,
+                    )
+
+                start = time.perf_counter()
+                if dataset_name in RSA_DATASETS:
+                    subset = (dataset_name, category, stimulus_set)
+                    if subset not in rsa_engines:
+                        rsa_engines[subset] = utils.evaluation.RSA(
+                            dataset=dataset, data_source=dataset_name
+                        )
+                    scores = score_rsa(features, rsa_engines[subset])
+                else:
+                    scores = score_triplets(
+                        features,
+                        dataset,
+                        get_temperature(model_config, model_name, module),
+                        args.distance,
+                    )
+                scoring_time = time.perf_counter() - start
+
+                if args.verbose:
+                    print(
+                        f"\nModel: {model_name}, Dataset: {dataset_name}, Module: {module}, Load: {load_time:.1f}s, Extraction: {extraction_time:.1f}s (waiting on input: {stats['input_wait_time']:.1f}s), Scoring: {scoring_time:.1f}s\n"
+                    )
+                summary = {
+                    "model": model_name,
+                    **scores,
+                    "source": source,
+                    "family": family_name,
+                    "dataset": dataset_name,
+                    "category": category,
+                    "stimulus_set": stimulus_set,
+                    "module": module,
+                }
+                out_path = get_out_path(
+                    args,
+                    dataset_name,
+                    category,
+                    stimulus_set,
+                    source,
+                    model_name,
+                    module,
+                )
+                save_results(
+                    pd.DataFrame([summary]),
+                    features,
+                    out_path,
+                    source,
+                    model_name,
+                    module,
+                )
+                timings.append(
+                    {
+                        "model": model_name,
+                        "source": source,
+                        "dataset": dataset_name,
+                        "category": category,
+                        "stimulus_set": stimulus_set,
+                        "module": module,
+                        # the model is loaded once, so its load time is shared across tasks
+                        "load_time": load_time,
+                        "extraction_time": extraction_time,
+                        "input_wait_time": stats["input_wait_time"],
+                        "backend": args.backend,
+                        "batch_size": batch_size,
+                        "images_per_second": len(dataset) / extraction_time,
+                        "parity": parity,
+                        "max_abs_diff": max_abs_diff,
+                        "scoring_time": scoring_time,
+                    }
+                )
+    return timings
+
+
+def evaluate(args) -> None:
+    """Evaluate every model on every dataset and module while loading each model only once."""
+    assert len(args.datasets) == len(
+        args.data_roots
+    ), "\nProvide one data root for each dataset.\n"
+    assert len(args.model_names) == len(
+        args.sources
+    ), "\nProvide one source for each model.\n"
+    model_config = utils.evaluation.load_model_config(args.model_dict_path)
+    tasks = list(itertools.product(args.datasets, args.modules))
+    # human RDMs are shared across models and thus cached per dataset and subset
+    rsa_engines = {}
+    client = utils.evaluation.connect(args.server_socket)
+    timings = []
+    for model_name, source in tqdm(
+        zip(args.model_names, args.sources), desc="Model", total=len(args.sources)
+    ):
+        timings.extend(
+            evaluate_model(
+                args, model_name, source, tasks, model_config, rsa_engines, client
+            )
+        )
+
+    timings = pd.DataFrame(timings)
+    if not os.path.exists(args.out_path):
+        os.makedirs(args.out_path)
+    timings.to_csv(os.path.join(args.out_path, "timings.csv"), index=False)
+    print(
+        timings.groupby("dataset")[
+            ["extraction_time", "input_wait_time", "scoring_time"]
+        ].sum()
+    )
+    # throughput per backend and architecture family to pick the fastest backend
+    print(
+        timings.groupby(
+            [
+                timings.backend,
+                timings.model.map(utils.analyses.get_family_name).rename("family"),
+            ]
+        ).images_per_second.mean()
+    )
+    print(
+        f"\nTotal load time: {timings.drop_duplicates('model').load_time.sum():.1f}s\n"
+    )
+
+
+if __name__ == "__main__":
+    # parse arguments and set random seeds
+    args = parseargs()
+    np.random.seed(args.rnd_seed)
+    random.seed(args.rnd_seed)
+    torch.manual_seed(args.rnd_seed)
+    # set number of threads used by PyTorch if device is CPU
+    if args.device.lower().startswith("cpu"):
+        torch.set_num_threads(args.num_threads)
+    # run evaluation script
+    evaluate(args)
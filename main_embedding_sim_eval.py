@@ -161,11 +161,8 @@ def evaluate(args) -> None:
         transforms = utils.evaluation.load_transforms(
             root=args.data_root, type=args.transform_type
         )
-    results = []
     model_features = defaultdict(lambda: defaultdict(dict))
     for model_name, features in tqdm(embeddings.items(), desc="Model"):
-        family_name = utils.analyses.get_family_name(model_name)
-
         if args.use_transforms:
             try:
                 transform = transforms[model_cfg.source][model_name][args.module]
@@ -193,11 +190,20 @@ def evaluate(args) -> None:
                 features = torch.from_numpy(features)
                 features = F.normalize(features, dim=1).cpu().numpy()
 
-        rsa_stats = utils.evaluation.perform_rsa(
-            dataset=dataset,
-            data_source=args.dataset,
-            features=features,
-        )
+        model_features[model_cfg.source][model_name][args.module] = features
+
+    # compare the RDMs of all models against the (cached) human RDM at once
+    rsa = utils.evaluation.RSA(dataset=dataset, data_source=args.dataset)
+    model_names = list(model_features[model_cfg.source].keys())
+    all_rsa_stats = rsa.compare(
+        [
+            model_features[model_cfg.source][model_name][args.module]
+            for model_name in model_names
+        ]
+    )
+    results = []
+    for model_name, rsa_stats in zip(model_names, all_rsa_stats):
+        family_name = utils.analyses.get_family_name(model_name)
         spearman_rho_cosine = rsa_stats["spearman_rho_cosine_kernel"]
         spearman_rho_corr = rsa_stats["spearman_rho_corr_kernel"]
         pearson_corr_coef_cosine = rsa_stats["pearson_corr_coef_cosine_kernel"]
@@ -220,7 +226,6 @@ def evaluate(args) -> None:
             "transform_type": args.transform_type if args.use_transforms else None,
         }
         results.append(summary)
-        model_features[model_cfg.source][model_name][args.module] = features
 
     # convert results into Pandas DataFrame
     results = pd.DataFrame(results)
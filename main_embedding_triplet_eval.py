@@ -178,9 +178,9 @@ def evaluate(args) -> None:
         print("\nCreating output directory...\n")
         os.makedirs(out_path)
 
-    # save dataframe to pickle to preserve data types after loading
-    # load back with pd.read_pickle(/path/to/file/pkl)
-    results.to_pickle(os.path.join(out_path, "results.pkl"))
+    # summary metrics go to a CSV file and per-triplet arrays to memory-mappable .npy files
+    # load back with utils.evaluation.load_results(/path/to/results)
+    utils.evaluation.save_results(results, out_path)
     failures.to_pickle(os.path.join(out_path, "failures.pkl"))
     utils.evaluation.save_features(features=dict(model_features), out_path=out_path)
 
@@ -10,7 +10,6 @@ import numpy as np
 import pandas as pd
 import torch
 from thingsvision import get_extractor
-from thingsvision.utils.data import DataLoader
 from tqdm import tqdm
 
 import utils
@@ -56,8 +55,26 @@ def parseargs():
         "--batch_size",
         metavar="B",
         type=int,
-        default=128,
-        help="number of triplets sampled during each step (i.e., mini-batch size)",
+        default=None,
+        help="number of images sampled during each step (i.e., mini-batch size); tuned automatically if not set",
+    )
+    aa(
+        "--memory_budget",
+        type=float,
+        default=None,
+        help="peak memory in GB (RSS on CPU, allocated memory on CUDA) under which the batch size is tuned; defaults to 80% of the device memory",
+    )
+    aa(
+        "--num_workers",
+        type=int,
+        default=0,
+        help="number of background workers that decode and transform images during extraction",
+    )
+    aa(
+        "--prefetch",
+        type=int,
+        default=2,
+        help="number of batches prefetched by each background worker",
     )
     aa(
         "--out_path",
@@ -113,17 +130,35 @@ def evaluate(args) -> None:
         data_dir=args.data_root,
         transform=extractor.get_transformations(),
     )
-    batches = DataLoader(
+    # the batch size is tuned for the last (i.e., deepest) layer
+    batch_size = utils.evaluation.get_batch_size(
+        extractor=extractor,
         dataset=dataset,
+        model_name=args.model,
+        module_name=args.layers[-1],
         batch_size=args.batch_size,
-        backend=extractor.get_backend(),
+        memory_budget=args.memory_budget,
+        verbose=args.verbose,
+    )
+    # the same (prefetching) loader is reused for every layer
+    batches = utils.evaluation.get_batches(
+        extractor=extractor,
+        dataset=dataset,
+        batch_size=batch_size,
+        num_workers=args.num_workers,
+        prefetch=args.prefetch,
     )
     for module_name in tqdm(args.layers, desc="Layer"):
+        wait_time = getattr(batches, "wait_time", float("nan"))
         features = extractor.extract_features(
             batches=batches,
             module_name=module_name,
             flatten_acts=True,
         )
+        if args.verbose:
+            print(
+                f"\nLayer {module_name}, Waiting on input: {getattr(batches, 'wait_time', float('nan')) - wait_time:.1f}s\n"
+            )
         if len(features.shape) >= 3:
             # global average pooling
             features = features.mean(axis=-1).mean(axis=-1)
@@ -163,9 +198,9 @@ def evaluate(args) -> None:
         print("\nCreating output directory...\n")
         os.makedirs(out_path)
 
-    # save dataframe to pickle to preserve data types after loading
-    # load back with pd.read_pickle(/path/to/file/pkl)
-    results.to_pickle(os.path.join(out_path, "results.pkl"))
+    # summary metrics go to a CSV file and per-triplet arrays to memory-mappable .npy files
+    # load back with utils.evaluation.load_results(/path/to/results)
+    utils.evaluation.save_results(results, out_path)
     utils.evaluation.save_features(features=model_features, out_path=out_path)
 
 
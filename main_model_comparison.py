@@ -9,6 +9,7 @@ from typing import Dict
 import numpy as np
 import pandas as pd
 
+import utils
 from data import DATASETS
 from utils.analyses import CKA
 
@@ -41,7 +42,7 @@ def parseargs():
 
 
 def unpickle_results(results_path: str) -> pd.DataFrame:
-    return pd.read_pickle(os.path.join(results_path, "results.pkl"))
+    return utils.evaluation.load_results(results_path, arrays=["choices"])
 
 
 def get_vice_probas(data_root: str) -> Array:
@@ -88,31 +89,15 @@ def add_vice(
     return pd.concat([results, pd.DataFrame(vice)], axis=0, ignore_index=True)
 
 
-def get_agreement(choices_i, choices_j) -> float:
-    assert (
-        choices_i.shape[0] == choices_j.shape[0]
-    ), "\nNumber of triplets needs to be equivalent to compare model choices.\n"
-    triplet_agreements = np.where(choices_i == choices_j)[0]
-    agreement_frac = triplet_agreements.shape[0] / choices_i.shape[0]
-    return agreement_frac
-
-
 def compare_model_choices(results: pd.DataFrame) -> pd.DataFrame:
     models = results.model.values
-    agreements = pd.DataFrame(index=models, columns=models, dtype=float)
-    for i, model_i in enumerate(models):
-        for j, model_j in enumerate(models):
-            if i != j:
-                if np.isnan(agreements.iloc[i, j]):
-                    choices_i = results[results.model == model_i].choices.values[0]
-                    choices_j = results[results.model == model_j].choices.values[0]
-                    agreement = get_agreement(choices_i, choices_j)
-                else:
-                    continue
-            else:
-                agreement = float(1)
-            agreements.iloc[i, j] = agreement
-            agreements.iloc[j, i] = agreement
+    model_choices = utils.evaluation.stack_model_choices(results)
+    agreements = pd.DataFrame(
+        data=utils.evaluation.compute_agreements(model_choices),
+        index=models,
+        columns=models,
+        dtype=float,
+    )
     return agreements
 
 
@@ -2,6 +2,7 @@
 # -*- coding: utf-8 -*-
 
 import argparse
+import itertools
 import os
 import random
 import warnings
@@ -13,19 +14,22 @@ import pandas as pd
 import torch
 import torch.nn.functional as F
 from ml_collections import config_dict
-from thingsvision import get_extractor
-from thingsvision.utils.data import DataLoader
-from torch.utils.data import Subset
-from torchvision.transforms import Compose, Lambda
 from tqdm import tqdm
 
 import utils
-from data import DATASETS, load_dataset
+from data import CATEGORIES, DATASETS, STIMULUS_SETS, load_dataset
 
 FrozenDict = Any
 Tensor = torch.Tensor
 Array = np.ndarray
 
+RSA_COLUMNS = {
+    "spearman_rho_cosine": "spearman_rho_cosine_kernel",
+    "pearson_corr_cosine": "pearson_corr_coef_cosine_kernel",
+    "spearman_rho_correlation": "spearman_rho_corr_kernel",
+    "pearson_corr_correlation": "pearson_corr_coef_corr_kernel",
+}
+
 
 def parseargs():
     parser = argparse.ArgumentParser()
@@ -44,23 +48,18 @@ def parseargs():
     aa(
         "--stimulus_set",
         type=str,
+        nargs="+",
         default=None,
-        choices=["set1", "set2"],
-        help="Similarity judgments of the dataset from King et al. (2019) were collected for two stimulus sets",
+        choices=STIMULUS_SETS + ["all"],
+        help="Similarity judgments of the dataset from King et al. (2019) were collected for two stimulus sets; pass several sets or 'all' to evaluate them in a single run",
     )
     aa(
         "--category",
         type=str,
+        nargs="+",
         default=None,
-        choices=[
-            "animals",
-            "automobiles",
-            "fruits",
-            "furniture",
-            "various",
-            "vegetables",
-        ],
-        help="Similarity judgments of the dataset from Peterson et al. (2016) were collected for specific categories",
+        choices=CATEGORIES + ["all"],
+        help="Similarity judgments of the dataset from Peterson et al. (2016) were collected for specific categories; pass several categories or 'all' to evaluate them in a single run",
     )
     aa(
         "--model_names",
@@ -99,8 +98,26 @@ def parseargs():
         "--batch_size",
         metavar="B",
         type=int,
-        default=118,
-        help="number of images sampled during each step (i.e., mini-batch size)",
+        default=None,
+        help="number of images sampled during each step (i.e., mini-batch size); tuned automatically if not set",
+    )
+    aa(
+        "--memory_budget",
+        type=float,
+        default=None,
+        help="peak memory in GB (RSS on CPU, allocated memory on CUDA) under which the batch size is tuned; defaults to 80% of the device memory",
+    )
+    aa(
+        "--num_workers",
+        type=int,
+        default=0,
+        help="number of background workers that decode and transform images during extraction",
+    )
+    aa(
+        "--prefetch",
+        type=int,
+        default=2,
+        help="number of batches prefetched by each background worker",
     )
     aa(
         "--out_path",
@@ -137,12 +154,56 @@ def parseargs():
         action="store_true",
         help="load randomly initialized model instead of a pretrained model",
     )
+    aa(
+        "--n_permutations",
+        type=int,
+        default=1000,
+        help="number of stimulus-label permutations for computing p-values of the RSA correlations (0 disables the test)",
+    )
+    aa(
+        "--n_bootstraps",
+        type=int,
+        default=1000,
+        help="number of stimulus bootstraps for confidence intervals of the RSA correlations (0 disables bootstrapping)",
+    )
+    aa(
+        "--quantize",
+        type=str,
+        default=None,
+        choices=["int8"],
+        help="apply post-training quantization for faster CPU extraction (reports the drift against the float model)",
+    )
+    aa(
+        "--quantization_mode",
+        type=str,
+        default="dynamic",
+        choices=["dynamic", "static"],
+        help="dynamic quantization of linear layers or static quantization of linear and conv layers",
+    )
+    aa(
+        "--calibration_root",
+        type=str,
+        default=None,
+        help="path/to/things; THINGS images are used to calibrate static quantization",
+    )
+    aa(
+        "--n_calibration_images",
+        type=int,
+        default=256,
+        help="number of THINGS images used for calibration",
+    )
     aa(
         "--rnd_seed",
         type=int,
         default=42,
         help="random seed for reproducibility of results",
     )
+    aa(
+        "--server_socket",
+        type=str,
+        default=None,
+        help="path/to/socket of a running extraction_server.py (defaults to its default socket); features are extracted locally if it is not available",
+    )
     aa(
         "--verbose",
         action="store_true",
@@ -184,10 +245,35 @@ def create_config_dicts(args) -> Tuple[FrozenDict, FrozenDict]:
     return model_cfg, data_cfg
 
 
+def get_subsets(data_cfg: FrozenDict) -> List[Tuple[str, str]]:
+    """Get all combinations of categories and stimulus sets that should be evaluated."""
+    categories = list(data_cfg.category or [None])
+    if "all" in categories:
+        categories = CATEGORIES
+    stimulus_sets = list(data_cfg.stimulus_set or [None])
+    if "all" in stimulus_sets:
+        stimulus_sets = STIMULUS_SETS
+    return list(itertools.product(categories, stimulus_sets))
+
+
+def apply_transform(
+    features: Array, things_features: Array, transform: Array, args
+) -> Array:
+    """Map features into the space of the transformation learned on THINGS."""
+    features = (features - things_features.mean()) / things_features.std()
+    features = features @ transform
+    if args.transform_type == "with_norm":
+        features = torch.from_numpy(features)
+        features = F.normalize(features, dim=1).cpu().numpy()
+    return features
+
+
 def evaluate(args) -> None:
     """Evaluate the alignment of neural nets with human (pairwise) similarity judgments."""
     device = torch.device(args.device)
     model_cfg, data_cfg = create_config_dicts(args)
+    # every model is loaded once and evaluated on all categories and stimulus sets
+    subsets = get_subsets(data_cfg)
     if args.use_transforms:
         things_features = utils.evaluation.load_features(
             path=args.things_embeddings_path
@@ -195,86 +281,17 @@ def evaluate(args) -> None:
         transforms = utils.evaluation.load_transforms(
             root=args.data_root, type=args.transform_type
         )
-    results = []
-    model_features = defaultdict(lambda: defaultdict(dict))
+    # quantized models are built locally
+    client = None if args.quantize else utils.evaluation.connect(args.server_socket)
+    rsa_engines = {}
+    evaluated_models = defaultdict(list)
+    float_stats = defaultdict(dict)
+    model_features = {
+        subset: defaultdict(lambda: defaultdict(dict)) for subset in subsets
+    }
     for i, (model_name, source) in tqdm(
         enumerate(zip(model_cfg.names, model_cfg.sources)), desc="Model"
     ):
-        if model_name.startswith("OpenCLIP"):
-            name, variant, data = model_name.split("_")
-            model_params = dict(variant=variant, dataset=data)
-        elif model_name.startswith("clip"):
-            name, variant = model_name.split("_")
-            model_params = dict(variant=variant)
-        else:
-            name = model_name
-            model_params = None
-
-        family_name = utils.analyses.get_family_name(model_name)
-        extractor = get_extractor(
-            model_name=name,
-            source=source,
-            device=device,
-            pretrained=not args.not_pretrained,
-            model_parameters=model_params,
-        )
-
-        if model_name.endswith("ecoset"):
-            transformations = extractor.get_transformations(
-                resize_dim=128, crop_dim=128
-            )
-        else:
-            transformations = extractor.get_transformations()
-        if args.dataset == "peterson":
-            transformations = Compose(
-                [Lambda(lambda img: img.convert("RGB")), transformations]
-            )
-
-        dataset = load_dataset(
-            name=args.dataset,
-            data_dir=data_cfg.root,
-            stimulus_set=data_cfg.stimulus_set,
-            category=data_cfg.category,
-            transform=transformations,
-        )
-        batches = DataLoader(
-            dataset=dataset,
-            batch_size=args.batch_size,
-            backend=extractor.get_backend(),
-        )
-        if (
-            source == "torchvision"
-            and args.module == "penultimate"
-            and model_name.startswith("vit")
-        ):
-            num_slices = len(dataset) // 2000
-            subsets = [
-                Subset(dataset, indices=indices)
-                for indices in np.array_split(range(len(dataset)), num_slices)
-            ]
-            features_list = []
-            for subset in subsets:
-                subset_batches = DataLoader(
-                    dataset=subset,
-                    batch_size=args.batch_size,
-                    backend=extractor.get_backend(),
-                )
-                features = extractor.extract_features(
-                    batches=subset_batches,
-                    module_name=model_cfg.modules[i],
-                    flatten_acts=False,
-                )
-                features = features[:, 0].copy()  # select classifier token
-                features_list.append(features)
-            features = np.concatenate(features_list, axis=0)
-            features = features.reshape((features.shape[0], -1))
-        else:
-            features = extractor.extract_features(
-                batches=batches,
-                module_name=model_cfg.modules[i],
-                flatten_acts=True,
-            )
-
         if args.use_transforms:
             try:
                 transform = transforms[source][model_name][args.module]
@@ -294,49 +311,189 @@ def evaluate(args) -> None:
                     category=UserWarning,
                 )
                 continue
-            features = (
-                features - things_features_current_model.mean()
-            ) / things_features_current_model.std()
-            features = features @ transform
-            if args.transform_type == "with_norm":
-                features = torch.from_numpy(features)
-                features = F.normalize(features, dim=1).cpu().numpy()
-        try:
-            rsa_stats = utils.evaluation.perform_rsa(
-                dataset=dataset,
-                data_source=args.dataset,
-                features=features,
+
+        # with an extraction server, images are only loaded (and transformed) by the server
+        transformations = None
+        if client is None:
+            extractor = utils.evaluation.load_extractor(
+                model_name=model_name,
+                source=source,
+                device=device,
+                pretrained=not args.not_pretrained,
             )
-        except:
-            warnings.warn(
-                message=f"\nFound Infs or NaNs in transformation matrix for {model_name}.\nSkipping evaluation for {model_name} and continuing with next model...\n",
-                category=UserWarning,
+            transformations = utils.evaluation.get_transformations(
+                extractor=extractor, model_name=model_name, dataset=args.dataset
+            )
+        backend = None
+        if args.quantize:
+            backend = utils.evaluation.load_quantized_backend(
+                extractor=extractor,
+                module_name=model_cfg.modules[i],
+                mode=args.quantization_mode,
+                # THINGS images are used for calibration
+                calibration_dataset=load_dataset(
+                    name="things",
+                    data_dir=args.calibration_root,
+                    transform=transformations,
+                )
+                if args.quantization_mode == "static"
+                else None,
+                n_calibration_images=args.n_calibration_images,
+                batch_size=args.batch_size,
+                rnd_seed=args.rnd_seed,
             )
-            continue
-        spearman_rho_cosine = rsa_stats["spearman_rho_cosine_kernel"]
-        spearman_rho_corr = rsa_stats["spearman_rho_corr_kernel"]
-        pearson_corr_coef_cosine = rsa_stats["pearson_corr_coef_cosine_kernel"]
-        pearson_corr_coef_corr = rsa_stats["pearson_corr_coef_corr_kernel"]
 
-        if args.verbose:
-            print(
-                f"\nModel: {model_name}, Family: {family_name}, Spearman's rho: {spearman_rho_corr:.4f}, Pearson correlation coefficient: {pearson_corr_coef_corr:.4f}\n"
+        batch_size = args.batch_size
+        for subset in subsets:
+            category, stimulus_set = subset
+            dataset = load_dataset(
+                name=args.dataset,
+                data_dir=data_cfg.root,
+                stimulus_set=stimulus_set,
+                category=category,
+                transform=transformations,
             )
-        summary = {
-            "model": model_name,
-            "spearman_rho_cosine": spearman_rho_cosine,
-            "pearson_corr_cosine": pearson_corr_coef_cosine,
-            "spearman_rho_correlation": spearman_rho_corr,
-            "pearson_corr_correlation": pearson_corr_coef_corr,
-            "source": source,
-            "family": family_name,
-            "dataset": data_cfg.name,
-            "category": data_cfg.category,
-            "transform": args.use_transforms,
-            "transform_type": args.transform_type if args.use_transforms else None,
-        }
-        results.append(summary)
-        model_features[source][model_name][args.module] = features
+            stats = {}
+            if client is not None:
+                features = client.extract_features(
+                    model_name=model_name,
+                    source=source,
+                    module=args.module,
+                    module_name=model_cfg.modules[i],
+                    dataset=args.dataset,
+                    data_root=data_cfg.root,
+                    category=category,
+                    stimulus_set=stimulus_set,
+                    batch_size=args.batch_size,
+                    memory_budget=args.memory_budget,
+                    pretrained=not args.not_pretrained,
+                    stats=stats,
+                )
+            else:
+                # the batch size is tuned for the first subset and reused for all others
+                batch_size = utils.evaluation.get_batch_size(
+                    extractor=extractor,
+                    dataset=dataset,
+                    model_name=model_name,
+                    module_name=model_cfg.modules[i],
+                    batch_size=batch_size,
+                    memory_budget=args.memory_budget,
+                    backend=backend,
+                    verbose=args.verbose,
+                )
+                features = utils.evaluation.extract_features(
+                    extractor=extractor,
+                    dataset=dataset,
+                    model_name=model_name,
+                    source=source,
+                    module=args.module,
+                    module_name=model_cfg.modules[i],
+                    batch_size=batch_size,
+                    num_workers=args.num_workers,
+                    prefetch=args.prefetch,
+                    stats=stats,
+                    backend=backend,
+                )
+            if args.verbose:
+                print(
+                    f"\nModel: {model_name}, Extraction: {stats['extraction_time']:.1f}s, Waiting on input: {stats['input_wait_time']:.1f}s\n"
+                )
+
+            if backend is not None:
+                # features of the float model serve as a reference for the quantized model
+                float_features = utils.evaluation.extract_features(
+                    extractor=extractor,
+                    dataset=dataset,
+                    model_name=model_name,
+                    source=source,
+                    module=args.module,
+                    module_name=model_cfg.modules[i],
+                    batch_size=batch_size,
+                    num_workers=args.num_workers,
+                    prefetch=args.prefetch,
+                )
+
+            if args.use_transforms:
+                features = apply_transform(
+                    features, things_features_current_model, transform, args
+                )
+                if backend is not None:
+                    float_features = apply_transform(
+                        float_features, things_features_current_model, transform, args
+                    )
+            if not np.isfinite(features).all():
+                warnings.warn(
+                    message=f"\nFound Infs or NaNs in transformation matrix for {model_name}.\nSkipping evaluation for {model_name} and continuing with next model...\n",
+                    category=UserWarning,
+                )
+                continue
+            if subset not in rsa_engines:
+                # the human RDM of a subset is identical for every model and thus only loaded once
+                rsa_engines[subset] = utils.evaluation.RSA(
+                    dataset=dataset,
+                    data_source=args.dataset,
+                    n_permutations=args.n_permutations,
+                    n_bootstraps=args.n_bootstraps,
+                    rnd_seed=args.rnd_seed,
+                )
+            if backend is not None:
+                float_stats[subset][(model_name, source)] = rsa_engines[subset].compare(
+                    [float_features], significance=False
+                )[0]
+            evaluated_models[subset].append((model_name, source))
+            model_features[subset][source][model_name][args.module] = features
+
+    results = []
+    for subset, models in evaluated_models.items():
+        category, stimulus_set = subset
+        # compare the RDMs of all models against the human RDM at once
+        all_rsa_stats = rsa_engines[subset].compare(
+            [
+                model_features[subset][source][model_name][args.module]
+                for model_name, source in models
+            ]
+        )
+        for (model_name, source), rsa_stats in zip(models, all_rsa_stats):
+            family_name = utils.analyses.get_family_name(model_name)
+            spearman_rho_cosine = rsa_stats["spearman_rho_cosine_kernel"]
+            spearman_rho_corr = rsa_stats["spearman_rho_corr_kernel"]
+            pearson_corr_coef_cosine = rsa_stats["pearson_corr_coef_cosine_kernel"]
+            pearson_corr_coef_corr = rsa_stats["pearson_corr_coef_corr_kernel"]
+
+            if args.verbose:
+                print(
+                    f"\nModel: {model_name}, Family: {family_name}, Spearman's rho: {spearman_rho_corr:.4f}, Pearson correlation coefficient: {pearson_corr_coef_corr:.4f}\n"
+                )
+            summary = {
+                "model": model_name,
+                "spearman_rho_cosine": spearman_rho_cosine,
+                "pearson_corr_cosine": pearson_corr_coef_cosine,
+                "spearman_rho_correlation": spearman_rho_corr,
+                "pearson_corr_correlation": pearson_corr_coef_corr,
+                "source": source,
+                "family": family_name,
+                "dataset": data_cfg.name,
+                "category": category,
+                "stimulus_set": stimulus_set,
+                "transform": args.use_transforms,
+                "transform_type": args.transform_type if args.use_transforms else None,
+            }
+            # add p-values and confidence intervals next to the point estimates
+            for column, statistic in RSA_COLUMNS.items():
+                for suffix in ["_pval", "_ci_low", "_ci_high"]:
+                    if statistic + suffix in rsa_stats:
+                        summary[column + suffix] = rsa_stats[statistic + suffix]
+            if (model_name, source) in float_stats[subset]:
+                # drift of the quantized against the float model
+                summary["quantize"] = args.quantize
+                for column, statistic in RSA_COLUMNS.items():
+                    reference = float_stats[subset][(model_name, source)][statistic]
+                    summary[column + "_float"] = reference
+                    summary[column + "_drift"] = rsa_stats[statistic] - reference
+                print(
+                    f"\nModel: {model_name}, Float Spearman's rho: {summary['spearman_rho_correlation_float']:.4f}, {args.quantize} Spearman's rho: {spearman_rho_corr:.4f}, Drift: {summary['spearman_rho_correlation_drift']:+.4f}\n"
+                )
+            results.append(summary)
 
     # convert results into Pandas DataFrame
     results = pd.DataFrame(results)
@@ -352,7 +509,19 @@ def evaluate(args) -> None:
     # save dataframe to pickle to preserve data types after loading
     # load back with pd.read_pickle(/path/to/file/pkl)
     results.to_pickle(os.path.join(out_path, "results.pkl"))
-    utils.evaluation.save_features(features=dict(model_features), out_path=out_path)
+    if len(subsets) == 1:
+        utils.evaluation.save_features(
+            features=dict(model_features[subsets[0]]), out_path=out_path
+        )
+    else:
+        # features of different subsets are stored in separate subdirectories
+        for subset in subsets:
+            subset_path = os.path.join(out_path, "_".join(filter(None, subset)))
+            if not os.path.exists(subset_path):
+                os.makedirs(subset_path)
+            utils.evaluation.save_features(
+                features=dict(model_features[subset]), out_path=subset_path
+            )
 
 
 if __name__ == "__main__":
@@ -13,8 +13,6 @@ import numpy as np
 import pandas as pd
 import torch
 from ml_collections import config_dict
-from thingsvision import get_extractor
-from thingsvision.utils.data import DataLoader
 from torch.utils.data import Subset
 from tqdm import tqdm
 
@@ -78,8 +76,26 @@ def parseargs():
         "--batch_size",
         metavar="B",
         type=int,
-        default=128,
-        help="number of triplets sampled during each step (i.e., mini-batch size)",
+        default=None,
+        help="number of images sampled during each step (i.e., mini-batch size); tuned automatically if not set",
+    )
+    aa(
+        "--memory_budget",
+        type=float,
+        default=None,
+        help="peak memory in GB (RSS on CPU, allocated memory on CUDA) under which the batch size is tuned; defaults to 80% of the device memory",
+    )
+    aa(
+        "--num_workers",
+        type=int,
+        default=0,
+        help="number of background workers that decode and transform images during extraction",
+    )
+    aa(
+        "--prefetch",
+        type=int,
+        default=2,
+        help="number of batches prefetched by each background worker",
     )
     aa(
         "--out_path",
@@ -99,12 +115,50 @@ def parseargs():
         default=4,
         help="number of threads used for intraop parallelism on CPU; use only if device is CPU",
     )
+    aa(
+        "--quantize",
+        type=str,
+        default=None,
+        choices=["int8"],
+        help="apply post-training quantization for faster CPU extraction (reports the drift against the float model)",
+    )
+    aa(
+        "--quantization_mode",
+        type=str,
+        default="dynamic",
+        choices=["dynamic", "static"],
+        help="dynamic quantization of linear layers or static quantization of linear and conv layers",
+    )
+    aa(
+        "--calibration_root",
+        type=str,
+        default=None,
+        help="path/to/things; THINGS images are used to calibrate static quantization",
+    )
+    aa(
+        "--n_calibration_images",
+        type=int,
+        default=256,
+        help="number of THINGS images used for calibration",
+    )
+    aa(
+        "--n_drift_triplets",
+        type=int,
+        default=10000,
+        help="number of triplets for which predictions of the quantized and the float model are compared",
+    )
     aa(
         "--rnd_seed",
         type=int,
         default=42,
         help="random seed for reproducibility of results",
     )
+    aa(
+        "--server_socket",
+        type=str,
+        default=None,
+        help="path/to/socket of a running extraction_server.py (defaults to its default socket); features are extracted locally if it is not available",
+    )
     aa(
         "--verbose",
         action="store_true",
@@ -175,46 +229,11 @@ def create_config_dicts(args) -> Tuple[FrozenDict, FrozenDict]:
     return model_cfg, data_cfg
 
 
-def load_extractor(
-    model_name: str, source: str, device: str, pretrained: bool = True, extract_cls_token: bool = False
-):
-    if model_name.startswith("OpenCLIP"):
-        if "laion" in model_name:
-            meta_vars = model_name.split("_")
-            name = meta_vars[0]
-            variant = meta_vars[1]
-            data = "_".join(meta_vars[2:])
-        else:
-            name, variant, data = model_name.split("_")
-        model_params = dict(variant=variant, dataset=data)
-    elif model_name.startswith("clip"):
-        name, variant = model_name.split("_")
-        model_params = dict(variant=variant)
-    elif model_name.startswith("DreamSim"):
-        model_name = model_name.split("_")
-        name = model_name[0]
-        variant = "_".join(model_name[1:])
-        model_params = dict(variant=variant)
-    elif extract_cls_token:
-        name = model_name
-        model_params = dict(extract_cls_token=True)
-    else:
-        name = model_name
-        model_params = None
-
-    extractor = get_extractor(
-        model_name=name,
-        source=source,
-        device=device,
-        pretrained=pretrained,
-        model_parameters=model_params,
-    )
-    return extractor
-
-
 def evaluate(args) -> None:
     """Perform evaluation with optimal temperature values."""
     model_cfg, data_cfg = create_config_dicts(args)
+    # quantized models are built locally
+    client = None if args.quantize else utils.evaluation.connect(args.server_socket)
     for i, (model_name, source) in tqdm(
         enumerate(zip(model_cfg.names, model_cfg.sources)), desc="Model"
     ):
@@ -224,54 +243,81 @@ def evaluate(args) -> None:
             if re.search(r"dino", model_name)
             else utils.analyses.get_family_name(model_name)
         )
-        extractor = load_extractor(
-            model_name=model_name,
-            source=source,
-            device=args.device,
-            pretrained=not args.not_pretrained,
-            extract_cls_token=model_cfg.extract_cls_token,
-        )
-        dataset = load_dataset(
-            name=args.dataset,
-            data_dir=data_cfg.root,
-            transform=extractor.get_transformations(),
-        )
-        batches = DataLoader(
-            dataset=dataset,
-            batch_size=args.batch_size,
-            backend=extractor.get_backend(),
-        )
-        if (
-            source == "torchvision"
-            and args.module == "penultimate"
-            and model_name.startswith("vit")
-        ):
-            num_slices = len(dataset) // 2000
-            subsets = [
-                Subset(dataset, indices=indices)
-                for indices in np.array_split(range(len(dataset)), num_slices)
-            ]
-            features_list = []
-            for subset in subsets:
-                subset_batches = DataLoader(
-                    dataset=subset,
-                    batch_size=args.batch_size,
-                    backend=extractor.get_backend(),
-                )
-                features = extractor.extract_features(
-                    batches=subset_batches,
+        stats = {}
+        if client is not None:
+            # the server keeps models warm across processes (e.g., one process per temperature)
+            dataset = load_dataset(name=args.dataset, data_dir=data_cfg.root)
+            features = client.extract_features(
+                model_name=model_name,
+                source=source,
+                module=args.module,
+                module_name=model_cfg.modules[i],
+                dataset=args.dataset,
+                data_root=data_cfg.root,
+                batch_size=args.batch_size,
+                memory_budget=args.memory_budget,
+                pretrained=not args.not_pretrained,
+                extract_cls_token=model_cfg.extract_cls_token,
+                stats=stats,
+            )
+            backend = None
+        else:
+            extractor = utils.evaluation.load_extractor(
+                model_name=model_name,
+                source=source,
+                device=args.device,
+                pretrained=not args.not_pretrained,
+                extract_cls_token=model_cfg.extract_cls_token,
+            )
+            dataset = load_dataset(
+                name=args.dataset,
+                data_dir=data_cfg.root,
+                transform=extractor.get_transformations(),
+            )
+            backend = None
+            if args.quantize:
+                backend = utils.evaluation.load_quantized_backend(
+                    extractor=extractor,
                     module_name=model_cfg.modules[i],
-                    flatten_acts=False,
+                    mode=args.quantization_mode,
+                    # THINGS images are used for calibration
+                    calibration_dataset=load_dataset(
+                        name="things",
+                        data_dir=args.calibration_root,
+                        transform=extractor.get_transformations(),
+                    )
+                    if args.quantization_mode == "static"
+                    else None,
+                    n_calibration_images=args.n_calibration_images,
+                    batch_size=args.batch_size,
+                    rnd_seed=args.rnd_seed,
                 )
-                features = features[:, 0].copy()  # select classifier token
-                features_list.append(features)
-            features = np.concatenate(features_list, axis=0)
-            features = features.reshape((features.shape[0], -1))
-        else:
-            features = extractor.extract_features(
-                batches=batches,
+            batch_size = utils.evaluation.get_batch_size(
+                extractor=extractor,
+                dataset=dataset,
+                model_name=model_name,
+                module_name=model_cfg.modules[i],
+                batch_size=args.batch_size,
+                memory_budget=args.memory_budget,
+                backend=backend,
+                verbose=args.verbose,
+            )
+            features = utils.evaluation.extract_features(
+                extractor=extractor,
+                dataset=dataset,
+                model_name=model_name,
+                source=source,
+                module=args.module,
                 module_name=model_cfg.modules[i],
-                flatten_acts=True,
+                batch_size=batch_size,
+                num_workers=args.num_workers,
+                prefetch=args.prefetch,
+                stats=stats,
+                backend=backend,
+            )
+        if args.verbose:
+            print(
+                f"\nModel: {model_name}, Extraction: {stats['extraction_time']:.1f}s, Waiting on input: {stats['input_wait_time']:.1f}s\n"
             )
         triplets = dataset.get_triplets()
 
@@ -298,7 +344,33 @@ def evaluate(args) -> None:
             "source": source,
             "family": family_name,
             "dataset": data_cfg.name,
+            "quantize": args.quantize if backend is not None else None,
         }
+        if backend is not None:
+            # compare predictions of the quantized and the float model for a sample of triplets
+            images, drift_triplets = utils.evaluation.sample_triplets(
+                triplets, args.n_drift_triplets, args.rnd_seed
+            )
+            float_features = utils.evaluation.extract_features(
+                extractor=extractor,
+                dataset=Subset(dataset, indices=images),
+                model_name=model_name,
+                source=source,
+                module=args.module,
+                module_name=model_cfg.modules[i],
+                batch_size=batch_size,
+            )
+            drift = utils.evaluation.triplet_drift(
+                float_features,
+                features[images],
+                drift_triplets,
+                model_cfg.temperatures[i],
+                args.distance,
+            )
+            print(
+                f"\nModel: {model_name}, Float accuracy: {drift['zero-shot_float']:.4f}, {args.quantize} accuracy: {drift['zero-shot_int8']:.4f}, Drift: {drift['zero-shot_drift']:+.4f}, Choice agreement: {drift['choice_agreement']:.4f}\n"
+            )
+            summary.update(drift)
         model_features[source][model_name][args.module] = features
 
         # convert results into Pandas DataFrame
@@ -318,9 +390,9 @@ def evaluate(args) -> None:
             print("Creating output directory to save results...\n")
             os.makedirs(out_path)
 
-        # save dataframe to pickle to preserve data types after loading
-        # load back with pd.read_pickle(/path/to/file/pkl)
-        results.to_pickle(os.path.join(out_path, "results.pkl"))
+        # summary metrics go to a CSV file and per-triplet arrays to memory-mappable .npy files
+        # load back with utils.evaluation.load_results(/path/to/results)
+        utils.evaluation.save_results(results, out_path)
         failures.to_pickle(os.path.join(out_path, "failures.pkl"))
         utils.evaluation.save_features(features=dict(model_features), out_path=out_path)
 
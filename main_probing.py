@@ -1,7 +1,8 @@
 import argparse
 import os
 import pickle
-from typing import Any, Callable, Dict, Iterator, List, Tuple
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 import numpy as np
 import pandas as pd
@@ -9,7 +10,6 @@ import torch
 from pytorch_lightning import Trainer, seed_everything
 from pytorch_lightning.callbacks import EarlyStopping, ModelCheckpoint
 from sklearn.model_selection import KFold
-from torch.utils.data import DataLoader
 from tqdm import tqdm
 
 import utils
@@ -78,6 +78,13 @@ def parseargs():
         help="Relative contribution of the regularization term",
         choices=[1.0, 1e-1, 1e-2, 1e-3, 1e-4, 1e-5],
     )
+    aa(
+        "--lmbda_path",
+        type=float,
+        nargs="+",
+        default=None,
+        help="train probes for a decreasing sequence of lambdas, each initialized with the solution for the previous lambda (overrides --lmbda)",
+    )
     aa(
         "--batch_size",
         type=int,
@@ -115,6 +122,20 @@ def parseargs():
         action="store_true",
         help="whether or not to use a bias for the naive transform",
     )
+    aa(
+        "--loader",
+        type=str,
+        default="batched",
+        choices=utils.probing.LOADERS,
+        help="batches of triplet indices (one permutation per epoch) or one-hot encoded triplets collated by a DataLoader",
+    )
+    aa(
+        "--precision",
+        type=str,
+        default="32",
+        choices=["32", "bf16"],
+        help="floating point precision of probe training (bf16 runs the forward pass in bfloat16 autocast with float32 master weights)",
+    )
     aa("--probing_root", type=str, help="path/to/probing")
     aa("--log_dir", type=str, help="directory to checkpoint transformations")
     aa("--rnd_seed", type=int, default=42, help="random seed for reproducibility")
@@ -134,6 +155,8 @@ def create_optimization_config(args) -> Tuple[FrozenDict, FrozenDict]:
     optim_cfg["min_epochs"] = args.burnin
     optim_cfg["patience"] = args.patience
     optim_cfg["use_bias"] = args.use_bias
+    optim_cfg["loader"] = args.loader
+    optim_cfg["precision"] = args.precision
     optim_cfg["ckptdir"] = os.path.join(args.log_dir, args.model, args.module)
     return optim_cfg
 
@@ -145,18 +168,6 @@ def load_features(probing_root: str, subfolder: str = "embeddings") -> Dict[str,
     return features
 
 
-def get_batches(triplets: Tensor, batch_size: int, train: bool) -> Iterator:
-    batches = DataLoader(
-        dataset=triplets,
-        batch_size=batch_size,
-        shuffle=True if train else False,
-        num_workers=0,
-        drop_last=False,
-        pin_memory=True if train else False,
-    )
-    return batches
-
-
 def get_callbacks(optim_cfg: FrozenDict, steps: int = 20) -> List[Callable]:
     if not os.path.exists(optim_cfg["ckptdir"]):
         os.makedirs(optim_cfg["ckptdir"])
@@ -292,6 +303,52 @@ def save_results(
         probing_results.to_pickle(os.path.join(out_path, "probing_results.pkl"))
 
 
+def fit_probe(
+    features: Array,
+    train_batches: Any,
+    val_batches: Any,
+    optim_cfg: FrozenDict,
+    device: str,
+    num_processes: int,
+    callbacks: List[Callable],
+    min_epochs: Optional[int] = None,
+) -> Tuple[Any, Trainer, List[Dict[str, float]], List[int]]:
+    """Train a linear probe, evaluate it on the validation triplets and predict odd-one-out choices."""
+    linear_probe = utils.probing.Linear(
+        features=features,
+        optim_cfg=optim_cfg,
+    )
+    trainer = Trainer(
+        accelerator=device,
+        callbacks=callbacks,
+        # strategy="ddp_spawn" if device == "cpu" else None,
+        strategy="ddp",
+        max_epochs=optim_cfg["max_epochs"],
+        min_epochs=min_epochs or optim_cfg["min_epochs"],
+        devices=num_processes if device == "cpu" else "auto",
+        enable_progress_bar=True,
+        gradient_clip_val=1.0,
+        gradient_clip_algorithm="norm",
+        precision=optim_cfg["precision"],
+    )
+    trainer.fit(linear_probe, train_batches, val_batches)
+    val_performance = trainer.test(
+        linear_probe,
+        dataloaders=val_batches,
+    )
+    predictions = trainer.predict(linear_probe, dataloaders=val_batches)
+    predictions = torch.cat(predictions, dim=0).tolist()
+    return linear_probe, trainer, val_performance, predictions
+
+
+def get_transformation(linear_probe: Any, use_bias: bool) -> Array:
+    transformation = linear_probe.transform_w.data.detach().cpu().numpy()
+    if use_bias:
+        bias = linear_probe.transform_b.data.detach().cpu().numpy()
+        transformation = np.concatenate((transformation, bias[:, None]), axis=1)
+    return transformation
+
+
 def run(
     features: Array,
     data_root: str,
@@ -303,6 +360,8 @@ def run(
 ) -> Tuple[Dict[str, List[float]], Array]:
     """Run optimization process."""
     callbacks = get_callbacks(optim_cfg)
+    epoch_timer = utils.probing.EpochTimer()
+    callbacks.append(epoch_timer)
     triplets = utils.probing.load_triplets(data_root)
     # features -= features.mean(axis=0) # center input features
     # features = utils.probing.standardize(features) # z-transform / standardize input features
@@ -322,80 +381,124 @@ def run(
             triplets=triplets,
             train_objects=train_objects,
         )
-        train_triplets = utils.probing.TripletData(
+        train_batches = utils.probing.get_batches(
             triplets=triplet_partitioning["train"],
             n_objects=n_objects,
-        )
-        val_triplets = utils.probing.TripletData(
-            triplets=triplet_partitioning["val"],
-            n_objects=n_objects,
-        )
-        train_batches = get_batches(
-            triplets=train_triplets,
             batch_size=optim_cfg["batch_size"],
             train=True,
+            loader=optim_cfg["loader"],
+            rnd_seed=rnd_seed,
         )
-        val_batches = get_batches(
-            triplets=val_triplets,
+        val_batches = utils.probing.get_batches(
+            triplets=triplet_partitioning["val"],
+            n_objects=n_objects,
             batch_size=optim_cfg["batch_size"],
             train=False,
+            loader=optim_cfg["loader"],
         )
-        linear_probe = utils.probing.Linear(
+        linear_probe, _, val_performance, predictions = fit_probe(
             features=features,
+            train_batches=train_batches,
+            val_batches=val_batches,
             optim_cfg=optim_cfg,
-        )
-        trainer = Trainer(
-            accelerator=device,
+            device=device,
+            num_processes=num_processes,
             callbacks=callbacks,
-            # strategy="ddp_spawn" if device == "cpu" else None,
-            strategy="ddp",
-            max_epochs=optim_cfg["max_epochs"],
-            min_epochs=optim_cfg["min_epochs"],
-            devices=num_processes if device == "cpu" else "auto",
-            enable_progress_bar=True,
-            gradient_clip_val=1.0,
-            gradient_clip_algorithm="norm",
-        )
-        trainer.fit(linear_probe, train_batches, val_batches)
-        val_performance = trainer.test(
-            linear_probe,
-            dataloaders=val_batches,
         )
-        predictions = trainer.predict(linear_probe, dataloaders=val_batches)
-        predictions = torch.cat(predictions, dim=0).tolist()
         ooo_choices.append(predictions)
         cv_results[f"fold_{k:02d}"] = val_performance
-    transformation = linear_probe.transform_w.data.detach().cpu().numpy()
-    if optim_cfg["use_bias"]:
-        bias = linear_probe.transform_b.data.detach().cpu().numpy()
-        transformation = np.concatenate((transformation, bias[:, None]), axis=1)
+    print(
+        f"\nAverage epoch time ({optim_cfg['loader']} loader, {optim_cfg['precision']} precision): {np.mean(epoch_timer.epoch_times):.2f}s\n"
+    )
+    transformation = get_transformation(linear_probe, optim_cfg["use_bias"])
     ooo_choices = np.concatenate(ooo_choices)
     return ooo_choices, cv_results, transformation
 
 
-if __name__ == "__main__":
-    # parse arguments
-    args = parseargs()
-    # seed everything for reproducibility of results
-    seed_everything(args.rnd_seed, workers=True)
-    features = load_features(args.probing_root)
-    model_features = features[args.source][args.model][args.module]
-    optim_cfg = create_optimization_config(args)
-    ooo_choices, cv_results, transform = run(
-        features=model_features,
-        data_root=args.data_root,
-        n_objects=args.n_objects,
-        device=args.device,
-        optim_cfg=optim_cfg,
-        rnd_seed=args.rnd_seed,
-        num_processes=args.num_processes,
-    )
-    avg_cv_acc = get_mean_cv_acc(cv_results)
-    avg_cv_loss = get_mean_cv_loss(cv_results)
-    save_results(
-        args, probing_acc=avg_cv_acc, probing_loss=avg_cv_loss, ooo_choices=ooo_choices
+def run_path(
+    features: Array,
+    data_root: str,
+    n_objects: int,
+    device: str,
+    optim_cfg: FrozenDict,
+    rnd_seed: int,
+    num_processes: int,
+    lmbdas: List[float],
+) -> Dict[float, Tuple[Array, Dict[str, List[float]], Array]]:
+    """Run the optimization process along a decreasing sequence of lambdas (i.e., a regularization path).
+
+    Within every fold, the probe for each lambda is initialized with the solution for the
+    previous (larger) lambda and trained until early stopping, such that only the first
+    lambda has to be trained from scratch.
+    """
+    triplets = utils.probing.load_triplets(data_root)
+    features = (features - features.mean()) / features.std()
+    optim_cfg["sigma"] = 1e-3
+    ckptdir = optim_cfg["ckptdir"]
+    objects = np.arange(n_objects)
+    kf = KFold(n_splits=optim_cfg["n_folds"], random_state=rnd_seed, shuffle=True)
+    cv_results = defaultdict(dict)
+    ooo_choices = defaultdict(list)
+    transformations = {}
+    epochs = defaultdict(int)
+    for k, (train_idx, _) in tqdm(enumerate(kf.split(objects), start=1), desc="Fold"):
+        triplet_partitioning = utils.probing.partition_triplets(
+            triplets=triplets,
+            train_objects=objects[train_idx],
+        )
+        train_batches = utils.probing.get_batches(
+            triplets=triplet_partitioning["train"],
+            n_objects=n_objects,
+            batch_size=optim_cfg["batch_size"],
+            train=True,
+            loader=optim_cfg["loader"],
+            rnd_seed=rnd_seed,
+        )
+        val_batches = utils.probing.get_batches(
+            triplets=triplet_partitioning["val"],
+            n_objects=n_objects,
+            batch_size=optim_cfg["batch_size"],
+            train=False,
+            loader=optim_cfg["loader"],
+        )
+        optim_cfg["init"] = None
+        for lmbda in lmbdas:
+            optim_cfg["lmbda"] = lmbda
+            optim_cfg["ckptdir"] = os.path.join(ckptdir, str(lmbda))
+            # early stopping starts from scratch for every lambda
+            linear_probe, trainer, val_performance, predictions = fit_probe(
+                features=features,
+                train_batches=train_batches,
+                val_batches=val_batches,
+                optim_cfg=optim_cfg,
+                device=device,
+                num_processes=num_processes,
+                callbacks=get_callbacks(optim_cfg),
+                # the burn-in period is only necessary for the random initialization
+                min_epochs=1 if optim_cfg["init"] is not None else None,
+            )
+            optim_cfg["init"] = linear_probe.get_parameters()
+            epochs[lmbda] += trainer.current_epoch
+            ooo_choices[lmbda].append(predictions)
+            cv_results[lmbda][f"fold_{k:02d}"] = val_performance
+            transformations[lmbda] = get_transformation(
+                linear_probe, optim_cfg["use_bias"]
+            )
+    optim_cfg["ckptdir"] = ckptdir
+    print(
+        f"\nTrained {sum(epochs.values())} epochs along the path ({', '.join(f'{lmbda}: {n}' for lmbda, n in epochs.items())}).\n"
     )
+    return {
+        lmbda: (
+            np.concatenate(ooo_choices[lmbda]),
+            cv_results[lmbda],
+            transformations[lmbda],
+        )
+        for lmbda in lmbdas
+    }
+
 
+def save_transform(args, transform: Array) -> None:
     out_path = os.path.join(
         args.probing_root,
         "results",
@@ -411,3 +514,48 @@ if __name__ == "__main__":
         os.makedirs(out_path, exist_ok=True)
     with open(os.path.join(out_path, "transform.npy"), "wb") as f:
         np.save(file=f, arr=transform)
+
+
+if __name__ == "__main__":
+    # parse arguments
+    args = parseargs()
+    # seed everything for reproducibility of results
+    seed_everything(args.rnd_seed, workers=True)
+    features = load_features(args.probing_root)
+    model_features = features[args.source][args.model][args.module]
+    optim_cfg = create_optimization_config(args)
+    if args.lmbda_path:
+        path = run_path(
+            features=model_features,
+            data_root=args.data_root,
+            n_objects=args.n_objects,
+            device=args.device,
+            optim_cfg=optim_cfg,
+            rnd_seed=args.rnd_seed,
+            num_processes=args.num_processes,
+            lmbdas=sorted(args.lmbda_path, reverse=True),
+        )
+    else:
+        path = {
+            args.lmbda: run(
+                features=model_features,
+                data_root=args.data_root,
+                n_objects=args.n_objects,
+                device=args.device,
+                optim_cfg=optim_cfg,
+                rnd_seed=args.rnd_seed,
+                num_processes=args.num_processes,
+            )
+        }
+    # every point on the regularization path is saved like a single run
+    for lmbda, (ooo_choices, cv_results, transform) in path.items():
+        args.lmbda = lmbda
+        avg_cv_acc = get_mean_cv_acc(cv_results)
+        avg_cv_loss = get_mean_cv_loss(cv_results)
+        save_results(
+            args,
+            probing_acc=avg_cv_acc,
+            probing_loss=avg_cv_loss,
+            ooo_choices=ooo_choices,
+        )
+        save_transform(args, transform)
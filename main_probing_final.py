@@ -8,7 +8,6 @@ import pandas as pd
 import torch
 from pytorch_lightning import Trainer, seed_everything
 from pytorch_lightning.callbacks import EarlyStopping, ModelCheckpoint
-from torch.utils.data import DataLoader
 
 import utils
 
@@ -108,6 +107,20 @@ def parseargs():
         action="store_true",
         help="whether or not to use a bias for the naive transform",
     )
+    aa(
+        "--loader",
+        type=str,
+        default="batched",
+        choices=utils.probing.LOADERS,
+        help="batches of triplet indices (one permutation per epoch) or one-hot encoded triplets collated by a DataLoader",
+    )
+    aa(
+        "--precision",
+        type=str,
+        default="32",
+        choices=["32", "bf16"],
+        help="floating point precision of probe training (bf16 runs the forward pass in bfloat16 autocast with float32 master weights)",
+    )
     aa("--probing_root", type=str, help="path/to/probing")
     aa("--log_dir", type=str, help="directory to checkpoint transformations")
     aa("--rnd_seed", type=int, default=42, help="random seed for reproducibility")
@@ -126,6 +139,8 @@ def create_optimization_config(args) -> Tuple[FrozenDict, FrozenDict]:
     optim_cfg["min_epochs"] = args.burnin
     optim_cfg["patience"] = args.patience
     optim_cfg["use_bias"] = args.use_bias
+    optim_cfg["loader"] = args.loader
+    optim_cfg["precision"] = args.precision
     optim_cfg["ckptdir"] = os.path.join(args.log_dir, args.model, args.module)
     return optim_cfg
 
@@ -253,41 +268,34 @@ def run(
     device: str,
     optim_cfg: FrozenDict,
     num_processes: int,
+    rnd_seed: int,
 ) -> Tuple[Dict[str, List[float]], Array]:
     """Run the optimization process."""
     callbacks = get_callbacks(optim_cfg)
+    epoch_timer = utils.probing.EpochTimer()
+    callbacks.append(epoch_timer)
     # use the original train and validation splits from the THINGS data paper (Hebart et al., 2023)
-    train_triplets = np.load(
-        os.path.join(data_root, "triplets", "train_90.npy")
-    ).tolist()
-    val_triplets = np.load(os.path.join(data_root, "triplets", "test_10.npy")).tolist()
+    triplets = utils.triplets.load_things_triplets(data_root)
+    train_triplets = triplets["train"]
+    val_triplets = triplets["test"]
     # subtract global mean and normalize by global standard deviation
     features = (features - features.mean()) / features.std()
     # initialize transformation with small values
     optim_cfg["sigma"] = 1e-3
-    train_triplets = utils.probing.TripletData(
+    train_batches = utils.probing.get_batches(
         triplets=train_triplets,
         n_objects=n_objects,
+        batch_size=optim_cfg["batch_size"],
+        train=True,
+        loader=optim_cfg["loader"],
+        rnd_seed=rnd_seed,
     )
-    val_triplets = utils.probing.TripletData(
+    val_batches = utils.probing.get_batches(
         triplets=val_triplets,
         n_objects=n_objects,
-    )
-    train_batches = DataLoader(
-        dataset=train_triplets,
         batch_size=optim_cfg["batch_size"],
-        shuffle=True,
-        num_workers=0,
-        drop_last=False,
-        pin_memory=True,
-    )
-    val_batches = DataLoader(
-        dataset=val_triplets,
-        batch_size=optim_cfg["batch_size"],
-        shuffle=False,
-        num_workers=0,
-        drop_last=False,
-        pin_memory=False,
+        train=False,
+        loader=optim_cfg["loader"],
     )
     linear_probe = utils.probing.Linear(
         features=features,
@@ -304,8 +312,12 @@ def run(
         enable_progress_bar=True,
         gradient_clip_val=1.0,
         gradient_clip_algorithm="norm",
+        precision=optim_cfg["precision"],
     )
     trainer.fit(linear_probe, train_batches, val_batches)
+    print(
+        f"\nAverage epoch time ({optim_cfg['loader']} loader, {optim_cfg['precision']} precision): {np.mean(epoch_timer.epoch_times):.2f}s\n"
+    )
     val_performance = trainer.test(
         linear_probe,
         dataloaders=val_batches,
@@ -334,6 +346,7 @@ if __name__ == "__main__":
         device=args.device,
         optim_cfg=optim_cfg,
         num_processes=args.num_processes,
+        rnd_seed=args.rnd_seed,
     )
     probing_acc = val_performance[0]["test_acc"]
     probing_loss = val_performance[0]["test_loss"]
@@ -0,0 +1,279 @@
+import argparse
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+import torch
+from sklearn.model_selection import KFold
+from tqdm import tqdm
+
+import utils
+from main_probing import get_transformation
+
+Array = np.ndarray
+
+# data of a worker process, which is set once by the pool initializer
+_worker = {}
+
+
+def parseargs():
+    parser = argparse.ArgumentParser()
+
+    def aa(*args, **kwargs):
+        parser.add_argument(*args, **kwargs)
+
+    aa("--data_root", type=str, help="path/to/things")
+    aa(
+        "--features_path",
+        type=str,
+        help="path/to/features.pkl written by main_layer_eval.py (features per layer)",
+    )
+    aa(
+        "--layers",
+        type=str,
+        nargs="+",
+        default=None,
+        help="subset of layers for which to train probes (defaults to all layers)",
+    )
+    aa("--model", type=str)
+    aa("--source", type=str, default="torchvision")
+    aa(
+        "--n_objects",
+        type=int,
+        help="Number of object categories in the data",
+        default=1854,
+    )
+    aa(
+        "--n_folds",
+        type=int,
+        default=3,
+        choices=[2, 3, 4, 5],
+        help="Number of folds in k-fold cross-validation.",
+    )
+    aa("--optim", type=str, default="Adam", choices=["Adam", "SGD"])
+    aa("--learning_rate", type=float, default=1e-3)
+    aa(
+        "--lmbda",
+        type=float,
+        default=1e-3,
+        help="Relative contribution of the regularization term",
+    )
+    aa("--batch_size", type=int, default=256)
+    aa(
+        "--epochs",
+        type=int,
+        help="Maximum number of epochs to perform finetuning",
+        default=100,
+    )
+    aa(
+        "--burnin",
+        type=int,
+        help="Minimum number of epochs to perform finetuning",
+        default=10,
+    )
+    aa(
+        "--patience",
+        type=int,
+        help="number of checks with no improvement after which training will be stopped",
+        default=10,
+    )
+    aa(
+        "--use_bias",
+        action="store_true",
+        help="whether or not to use a bias for the naive transform",
+    )
+    aa(
+        "--num_processes",
+        type=int,
+        default=4,
+        help="number of worker processes that train probes for (layer, fold) pairs in parallel",
+    )
+    aa(
+        "--num_threads",
+        type=int,
+        default=1,
+        help="number of threads used for intraop parallelism within each worker",
+    )
+    aa("--out_path", type=str, help="path/to/results")
+    aa("--rnd_seed", type=int, default=42, help="random seed for reproducibility")
+    args = parser.parse_args()
+    return args
+
+
+def load_layer_features(path: str, layers: List[str] = None) -> Dict[str, Array]:
+    """Load features per layer and subtract the global mean and normalize by the global standard deviation."""
+    features = utils.evaluation.load_features(path)
+    layers = layers or list(features.keys())
+    return {
+        layer: (features[layer] - features[layer].mean()) / features[layer].std()
+        for layer in layers
+    }
+
+
+def get_folds(
+    data_root: str, n_objects: int, n_folds: int, rnd_seed: int
+) -> List[Dict[str, Array]]:
+    """Partition triplets into disjoint object sets once for all layers."""
+    triplets = utils.probing.load_triplets(data_root)
+    objects = np.arange(n_objects)
+    kf = KFold(n_splits=n_folds, random_state=rnd_seed, shuffle=True)
+    return [
+        utils.probing.partition_triplets(
+            triplets=triplets, train_objects=objects[train_idx]
+        )
+        for train_idx, _ in kf.split(objects)
+    ]
+
+
+def init_worker(
+    features: Dict[str, Array],
+    folds: List[Dict[str, Array]],
+    n_objects: int,
+    optim_cfg: Dict[str, Any],
+    num_threads: int,
+) -> None:
+    torch.set_num_threads(num_threads)
+    # triplet tensors of every fold are built once per worker and shared across layers
+    _worker.update(
+        features=features,
+        optim_cfg=optim_cfg,
+        batches=[
+            (
+                utils.probing.get_batches(
+                    triplets=fold["train"],
+                    n_objects=n_objects,
+                    batch_size=optim_cfg["batch_size"],
+                    train=True,
+                    rnd_seed=optim_cfg["rnd_seed"],
+                ),
+                utils.probing.get_batches(
+                    triplets=fold["val"],
+                    n_objects=n_objects,
+                    batch_size=optim_cfg["batch_size"],
+                    train=False,
+                ),
+            )
+            for fold in folds
+        ],
+    )
+
+
+def run_probe(layer: str, k: int) -> Tuple[str, int, Dict[str, Any], Array]:
+    """Train and evaluate the probe for a single layer and fold."""
+    optim_cfg = _worker["optim_cfg"]
+    train_batches, val_batches = _worker["batches"][k]
+    # every probe sees the same sequence of per-epoch permutations, regardless of which
+    # probes the worker has trained before
+    train_batches.sampler.epoch = 0
+    torch.manual_seed(optim_cfg["rnd_seed"])
+    linear_probe = utils.probing.Linear(
+        features=_worker["features"][layer], optim_cfg=optim_cfg
+    )
+    optimizer = linear_probe.configure_optimizers()
+    val_loss, val_acc, epochs = utils.probing.fit(
+        linear_probe,
+        optimizer,
+        train_batches,
+        val_batches,
+        max_epochs=optim_cfg["max_epochs"],
+        min_epochs=optim_cfg["min_epochs"],
+        patience=optim_cfg["patience"],
+    )
+    performance = {"test_loss": val_loss, "test_acc": val_acc, "epochs": epochs}
+    return (
+        layer,
+        k,
+        performance,
+        get_transformation(linear_probe, optim_cfg["use_bias"]),
+    )
+
+
+def run(args) -> pd.DataFrame:
+    features = load_layer_features(args.features_path, args.layers)
+    layers = list(features.keys())
+    folds = get_folds(args.data_root, args.n_objects, args.n_folds, args.rnd_seed)
+    optim_cfg = {
+        "optim": args.optim,
+        "lr": args.learning_rate,
+        "lmbda": args.lmbda,
+        "batch_size": args.batch_size,
+        "max_epochs": args.epochs,
+        "min_epochs": args.burnin,
+        "patience": args.patience,
+        "use_bias": args.use_bias,
+        "sigma": 1e-3,
+        "rnd_seed": args.rnd_seed,
+    }
+    performances = {layer: {} for layer in layers}
+    transforms = {}
+    with ProcessPoolExecutor(
+        max_workers=args.num_processes,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_worker,
+        initargs=(features, folds, args.n_objects, optim_cfg, args.num_threads),
+    ) as executor:
+        futures = [
+            executor.submit(run_probe, layer, k)
+            for layer in layers
+            for k in range(args.n_folds)
+        ]
+        for future in tqdm(as_completed(futures), total=len(futures), desc="Probe"):
+            layer, k, performance, transform = future.result()
+            performances[layer][k] = performance
+            # as in main_probing.py, the transform of the last fold is kept
+            if k == args.n_folds - 1:
+                transforms[layer] = transform
+
+    results = pd.DataFrame(
+        [
+            {
+                "model": args.model,
+                "layer": layer,
+                "probing": np.mean(
+                    [p["test_acc"] for p in performances[layer].values()]
+                ),
+                "cross-entropy": np.mean(
+                    [p["test_loss"] for p in performances[layer].values()]
+                ),
+                "epochs": np.mean([p["epochs"] for p in performances[layer].values()]),
+                "source": args.source,
+                "l2_reg": args.lmbda,
+                "optim": args.optim.lower(),
+                "lr": args.learning_rate,
+                "n_folds": args.n_folds,
+                "bias": args.use_bias,
+            }
+            for layer in layers
+        ]
+    )
+    save_results(args, results, transforms)
+    return results
+
+
+def save_results(args, results: pd.DataFrame, transforms: Dict[str, Array]) -> None:
+    out_path = os.path.join(args.out_path, args.source, args.model)
+    if not os.path.exists(out_path):
+        print("\nCreating results directory...\n")
+        os.makedirs(out_path)
+    results.to_pickle(os.path.join(out_path, "probing_results.pkl"))
+    results.to_csv(os.path.join(out_path, "probing_results.csv"), index=False)
+    for layer, transform in transforms.items():
+        layer_path = os.path.join(out_path, layer)
+        if not os.path.exists(layer_path):
+            os.makedirs(layer_path, exist_ok=True)
+        with open(os.path.join(layer_path, "transform.npy"), "wb") as f:
+            np.save(file=f, arr=transform)
+
+
+if __name__ == "__main__":
+    args = parseargs()
+    np.random.seed(args.rnd_seed)
+    torch.manual_seed(args.rnd_seed)
+    results = run(args)
+    # layer-by-accuracy table (i.e., the alignment curve of the model)
+    print(
+        results[["layer", "probing", "cross-entropy", "epochs"]].to_string(index=False)
+    )
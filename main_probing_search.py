@@ -0,0 +1,187 @@
+import argparse
+import itertools
+import json
+import os
+from typing import Any, Dict, List
+
+import numpy as np
+import torch
+from pytorch_lightning import seed_everything
+from sklearn.model_selection import KFold
+
+import utils
+from main_probing import get_transformation, load_features
+
+Array = np.ndarray
+
+
+def parseargs():
+    parser = argparse.ArgumentParser()
+
+    def aa(*args, **kwargs):
+        parser.add_argument(*args, **kwargs)
+
+    aa("--data_root", type=str, help="path/to/things")
+    aa("--model", type=str)
+    aa(
+        "--module",
+        type=str,
+        default="penultimate",
+        help="neural network module for which to learn a linear transform",
+        choices=["penultimate", "logits"],
+    )
+    aa("--source", type=str, default="torchvision")
+    aa(
+        "--n_objects",
+        type=int,
+        help="Number of object categories in the data",
+        default=1854,
+    )
+    aa(
+        "--n_folds",
+        type=int,
+        default=3,
+        choices=[2, 3, 4, 5],
+        help="1/n_folds of the objects are held out for validation during the search",
+    )
+    aa("--optims", type=str, nargs="+", default=["Adam", "SGD"])
+    aa(
+        "--learning_rates",
+        type=float,
+        nargs="+",
+        default=[1e-4, 1e-3, 1e-2],
+    )
+    aa(
+        "--lmbdas",
+        type=float,
+        nargs="+",
+        default=[1.0, 1e-1, 1e-2, 1e-3, 1e-4, 1e-5],
+    )
+    aa("--batch_size", type=int, default=256)
+    aa(
+        "--min_epochs",
+        type=int,
+        default=1,
+        help="epoch budget of the first rung (i.e., of every configuration)",
+    )
+    aa(
+        "--max_epochs",
+        type=int,
+        default=27,
+        help="epoch budget of the last rung",
+    )
+    aa(
+        "--eta",
+        type=int,
+        default=3,
+        help="the best 1/eta trials are promoted to the next rung, which has an eta times larger budget",
+    )
+    aa(
+        "--use_bias",
+        action="store_true",
+        help="whether or not to use a bias for the naive transform",
+    )
+    aa(
+        "--num_processes",
+        type=int,
+        default=4,
+        help="number of worker processes that train trials in parallel",
+    )
+    aa(
+        "--num_threads",
+        type=int,
+        default=1,
+        help="number of threads used for intraop parallelism within each worker",
+    )
+    aa("--probing_root", type=str, help="path/to/probing")
+    aa("--rnd_seed", type=int, default=42, help="random seed for reproducibility")
+    aa("--verbose", action="store_true")
+    args = parser.parse_args()
+    if not 1 <= args.min_epochs <= args.max_epochs:
+        parser.error("--min_epochs must be at least 1 and at most --max_epochs")
+    if args.eta < 2:
+        parser.error("--eta must be at least 2")
+    return args
+
+
+def get_configs(args) -> List[Dict[str, Any]]:
+    return [
+        {"optim": optim, "lr": lr, "lmbda": lmbda}
+        for optim, lr, lmbda in itertools.product(
+            args.optims, args.learning_rates, args.lmbdas
+        )
+    ]
+
+
+def search(args) -> None:
+    triplets = utils.probing.load_triplets(args.data_root)
+    features = load_features(args.probing_root)[args.source][args.model][args.module]
+    # subtract global mean and normalize by global standard deviation
+    features = (features - features.mean()) / features.std()
+    objects = np.arange(args.n_objects)
+    kf = KFold(n_splits=args.n_folds, random_state=args.rnd_seed, shuffle=True)
+    train_idx, _ = next(kf.split(objects))
+    triplet_partitioning = utils.probing.partition_triplets(
+        triplets=triplets, train_objects=objects[train_idx]
+    )
+    history, best_trial = utils.probing.successive_halving(
+        configs=get_configs(args),
+        features=features,
+        train_triplets=triplet_partitioning["train"],
+        val_triplets=triplet_partitioning["val"],
+        n_objects=args.n_objects,
+        batch_size=args.batch_size,
+        use_bias=args.use_bias,
+        min_epochs=args.min_epochs,
+        max_epochs=args.max_epochs,
+        eta=args.eta,
+        num_processes=args.num_processes,
+        num_threads=args.num_threads,
+        rnd_seed=args.rnd_seed,
+        verbose=args.verbose,
+    )
+    print(
+        f"\nBest configuration: {best_trial.config}, validation loss: {best_trial.val_loss:.4f}\n"
+    )
+    print(
+        f"Trained {history.epochs.groupby(history.trial_id).max().sum()} epochs in total (exhaustive search: {len(get_configs(args)) * args.max_epochs}).\n"
+    )
+
+    out_path = os.path.join(
+        args.probing_root,
+        "results",
+        "search",
+        args.source,
+        args.model,
+        args.module,
+    )
+    if not os.path.exists(out_path):
+        os.makedirs(out_path, exist_ok=True)
+    history.to_csv(os.path.join(out_path, "search_history.csv"), index=False)
+    with open(os.path.join(out_path, "best_config.json"), "w") as f:
+        json.dump(
+            {
+                **best_trial.config,
+                "epochs": best_trial.epochs,
+                "val_loss": best_trial.val_loss,
+            },
+            f,
+            indent=2,
+        )
+    linear_probe = utils.probing.Linear(
+        features=features,
+        optim_cfg={
+            **best_trial.config,
+            "use_bias": args.use_bias,
+            "init": best_trial.state[0],
+        },
+    )
+    with open(os.path.join(out_path, "transform.npy"), "wb") as f:
+        np.save(file=f, arr=get_transformation(linear_probe, args.use_bias))
+
+
+if __name__ == "__main__":
+    args = parseargs()
+    seed_everything(args.rnd_seed, workers=True)
+    torch.set_num_threads(args.num_threads)
+    search(args)
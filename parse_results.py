@@ -7,6 +7,7 @@ import pandas as pd
 
 parser = argparse.ArgumentParser()
 parser.add_argument('--results-root', default='resources/results')
+parser.add_argument('--rebuild', action='store_true', help='re-parse all result files instead of only new or changed ones')
 args = parser.parse_args()
 
 DATASETS = ['multi-arrangement', 'free-arrangement/set1', 'free-arrangement/set2', 'things']
@@ -43,7 +44,7 @@ for dataset in DATASETS:
         zero_shot_results['training'] = mapper.get_training_objectives()
 
     else:
-        zero_shot_results = parse_results_dir(join(args.results_root, dataset, 'zero-shot'))
+        zero_shot_results = parse_results_dir(join(args.results_root, dataset, 'zero-shot'), rebuild=args.rebuild, verbose=True)
 
     zero_shot_results = filter_models(zero_shot_results)
     # Write results to csv
@@ -55,7 +56,7 @@ for dataset in DATASETS:
             transform_results = pickle.load(f)
         transform_results['training'] = Mapper(transform_results).get_training_objectives()
     else:
-        transform_results = parse_results_dir(join(args.results_root, dataset, 'transform'))
+        transform_results = parse_results_dir(join(args.results_root, dataset, 'transform'), rebuild=args.rebuild, verbose=True)
 
     transform_results = filter_models(transform_results)
     # Write results to csv
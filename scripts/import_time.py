@@ -0,0 +1,63 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# import statements of (pure-NumPy) entry points and of first attribute accesses
+STATEMENTS = [
+    'import utils',
+    'import utils; utils.analyses.Mapper',
+    'import utils; utils.probing.load_triplets',
+    'import utils; utils.evaluation.get_predictions',
+    'import utils; utils.evaluation.load_results',
+    'from utils.analyses import parse_results_dir',
+    'import utils; utils.probing.Linear',
+    'import utils; utils.plotting.PALETTE',
+    'import search_temp_scaling',
+]
+
+HEAVY_MODULES = ['matplotlib', 'seaborn', 'sklearn', 'pytorch_lightning', 'thingsvision', 'torchvision', 'timm', 'torch']
+
+PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+exec({statement!r})
+elapsed = time.perf_counter() - start
+heavy = [m for m in {heavy!r} if m in sys.modules]
+print(json.dumps({{"time": elapsed, "modules": len(sys.modules), "heavy": heavy}}))
+'''
+
+
+def measure(statement, repeats, cwd):
+    runs = []
+    for _ in range(repeats):
+        # every measurement runs in a fresh interpreter, just like a short sweep process
+        out = subprocess.run([sys.executable, '-c', PROBE.format(statement=statement, heavy=HEAVY_MODULES)],
+                             cwd=cwd, capture_output=True, text=True)
+        if out.returncode != 0:
+            return {'statement': statement, 'error': out.stderr.strip().splitlines()[-1]}
+        runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    return {
+        'statement': statement,
+        'time': statistics.median(run['time'] for run in runs),
+        'modules': runs[-1]['modules'],
+        'heavy': runs[-1]['heavy'],
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure the import time of utils in fresh interpreters.')
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--statements', nargs='+', default=STATEMENTS)
+    args = parser.parse_args()
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    for statement in args.statements:
+        result = measure(statement, args.repeats, root)
+        if 'error' in result:
+            print(f'{statement:<50} failed: {result["error"]}')
+        else:
+            print(f'{statement:<50} {result["time"] * 1e3:8.1f} ms {result["modules"]:5d} modules  '
+                  f'heavy: {", ".join(result["heavy"]) or "-"}')
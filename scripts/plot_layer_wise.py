@@ -1,4 +1,6 @@
-import pickle
+import sys
+
+sys.path.append('.')
 import matplotlib.pyplot as plt
 import argparse
 import os
@@ -6,6 +8,8 @@ import os
 import pandas as pd
 import seaborn as sns
 
+import utils
+
 mapping = {
     'r50-barlowtwins': "ResNet-50-BarlowTwins",
     'vgg19': 'VGG-19',
@@ -18,9 +22,7 @@ mapping = {
 
 
 def load_dataframe(path: str):
-    with open(path, 'rb') as f:
-        data = pickle.load(f)
-    return data
+    return utils.evaluation.load_results(path, arrays=[])
 
 
 LEGEND_FONT_SIZE = 24
@@ -43,7 +45,7 @@ if __name__ == '__main__':
     if args.path is not None:
         results = []
         for subdir in os.listdir(args.path):
-            df = load_dataframe(os.path.join(args.path, subdir, 'results.pkl'))
+            df = load_dataframe(os.path.join(args.path, subdir))
             df['depth'] = df.index.values
             results.append(df)
         df = pd.concat(results)[['model', 'layer', 'accuracy', 'depth']]
@@ -1,21 +1,17 @@
-import evaluation
+import utils
 
-from thingsvision import get_extractor
-from thingsvision.core.extraction.base import BaseExtractor
-from main_model_triplet_eval import evaluate
-from main_embedding_triplet_eval import evaluate as evaluate_embeddings
-from typing import List, Optional
-from matplotlib import pyplot as plt
+from typing import TYPE_CHECKING, List, Optional
 
 import argparse
 import json
 import os
-import timm
 import torch
-import torchvision
 
 import numpy as np
-import pandas as pd
+
+# thingsvision, timm, torchvision, matplotlib and the evaluation scripts are imported where they are used
+if TYPE_CHECKING:
+    from thingsvision.core.extraction.base import BaseExtractor
 
 EMBEDDINGS = ["google", "imagenet", "loss", "vit_same", "vit_best"]
 
@@ -109,6 +105,24 @@ def parseargs():
         choices=["things", "things-aligned"],
         default="things-aligned",
     )
+    aa(
+        "--batch_size",
+        type=int,
+        default=None,
+        help="extraction batch size; tuned automatically if not set",
+    )
+    aa(
+        "--memory_budget",
+        type=float,
+        default=None,
+        help="peak memory in GB under which the batch size is tuned; defaults to 80% of the device memory",
+    )
+    aa(
+        "--server_socket",
+        type=str,
+        default=None,
+        help="path/to/socket of a running extraction_server.py, which keeps models warm across temperatures",
+    )
     args = parser.parse_args()
     return args
 
@@ -154,7 +168,7 @@ def _is_model_name_accepted(name: str):
     return is_ok
 
 
-def get_logit_module_name(extractor: BaseExtractor):
+def get_logit_module_name(extractor: "BaseExtractor"):
     is_clip = "clip" in extractor.model_name
     if is_clip:
         module_name = "visual"
@@ -164,7 +178,7 @@ def get_logit_module_name(extractor: BaseExtractor):
     return module_name
 
 
-def get_penult_module_name(extractor: BaseExtractor):
+def get_penult_module_name(extractor: "BaseExtractor"):
     is_clip = "clip" in extractor.model_name
     if is_clip:
         module_name = "visual"
@@ -193,6 +207,8 @@ def get_model_dict(
     model_names: List[str], dist: str, ssl_models_path: str, source: str
 ):
     """Returns a dictionary with logit and penultimate layer module names for every model."""
+    from thingsvision import get_extractor
+
     device = "cuda" if torch.cuda.is_available() else "cpu"
     model_dict = {
         model_name: {
@@ -298,9 +314,15 @@ def search_temperatures(
     dataset: str,
     source: str,
     embeddings_root: Optional[str],
+    batch_size: Optional[int] = None,
+    memory_budget: Optional[float] = None,
+    server_socket: Optional[str] = None,
 ):
     """Find the temperature scaling with minimal average distance over the VICE-correct triplets and populate the
     dictionary with it."""
+    from main_embedding_triplet_eval import evaluate as evaluate_embeddings
+    from main_model_triplet_eval import evaluate
+
     device = "cuda" if torch.cuda.is_available() else "cpu"
     is_embedding_src = source in EMBEDDINGS
 
@@ -342,7 +364,11 @@ def search_temperatures(
                             "distance": distance,
                             "out_path": model_results_path,
                             "device": device,
-                            "batch_size": 32,
+                            "batch_size": batch_size,
+                            "memory_budget": memory_budget,
+                            "num_workers": 0,
+                            "prefetch": 2,
+                            "server_socket": server_socket,
                             "num_threads": 4,
                             "ssl_models_path": ssl_models_path,
                             "model_dict_path": get_dict_path(out_path, one_hot),
@@ -408,13 +434,16 @@ def search_temperatures(
 
                 print("Processing...", model_name, module_name, temp, flush=True)
 
-                with open(os.path.join(single_result_path, "results.pkl"), "rb") as f:
-                    df = pd.read_pickle(f)
-                    probas = torch.tensor(
+                df = utils.evaluation.load_results(
+                    single_result_path, arrays=["probas"]
+                )
+                probas = torch.tensor(
+                    np.array(
                         df[df.model == model_name]["probas"][
                             df[df.model == model_name].index[0]
                         ]
                     )
+                )
 
                 if probas_vice is None:
                     probas_vice = torch.zeros_like(probas)
@@ -526,6 +555,8 @@ def plot_dist_temp(
     distance: str,
     one_hot: bool,
 ):
+    from matplotlib import pyplot as plt
+
     scaling_results_folder = os.path.join(out_path, "scaling_results")
     distances = {}
     for model_name in model_names:
@@ -610,14 +641,17 @@ if __name__ == "__main__":
 
     if source in EMBEDDINGS:
         embeddings_root = os.path.join(embeddings_root, source)
-        object_names = evaluation.get_things_objects(args.data_root)
-        embeddings = evaluation.load_embeddings(
+        object_names = utils.evaluation.get_things_objects(args.data_root)
+        embeddings = utils.evaluation.load_embeddings(
             embeddings_root=embeddings_root,
             object_names=object_names,
             module="embeddings",
         )
         model_names = embeddings.keys()
     else:
+        import timm
+        import torchvision
+
         model_names = [
             name for name in dir(torchvision.models) if _is_model_name_accepted(name)
         ]
@@ -695,6 +729,9 @@ if __name__ == "__main__":
         dataset,
         source,
         embeddings_root,
+        args.batch_size,
+        args.memory_budget,
+        args.server_socket,
     )
 
     save_dict(model_dict, out_path, overwrite, one_hot)
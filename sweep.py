@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import argparse
+import multiprocessing
+import os
+import traceback
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Iterator, List, Tuple
+
+import pandas as pd
+import torch
+
+import utils
+from data import CATEGORIES, DATASETS, STIMULUS_SETS
+from main_benchmark_eval import evaluate_model, get_out_path, get_subsets
+
+MANIFEST_COLUMNS = ["model", "source", "module", "dataset", "status", "error"]
+
+
+def parseargs():
+    parser = argparse.ArgumentParser()
+
+    def aa(*args, **kwargs):
+        parser.add_argument(*args, **kwargs)
+
+    aa(
+        "--networks_path",
+        type=str,
+        default=None,
+        help="path/to/networks.csv; every row of the model column is evaluated",
+    )
+    aa(
+        "--model_names",
+        type=str,
+        nargs="+",
+        default=None,
+        help="models that are evaluated (alternative to --networks_path)",
+    )
+    aa(
+        "--sources",
+        type=str,
+        nargs="+",
+        default=None,
+        help="source of each model in --model_names",
+    )
+    aa(
+        "--default_source",
+        type=str,
+        default="torchvision",
+        help="source for models in networks.csv without a source column",
+    )
+    aa("--datasets", type=str, nargs="+", choices=DATASETS)
+    aa(
+        "--data_roots",
+        type=str,
+        nargs="+",
+        help="path/to/dataset for each dataset (in the same order as --datasets)",
+    )
+    aa(
+        "--stimulus_set",
+        type=str,
+        nargs="+",
+        default=["all"],
+        choices=STIMULUS_SETS + ["all"],
+    )
+    aa("--category", type=str, nargs="+", default=["all"], choices=CATEGORIES + ["all"])
+    aa(
+        "--modules",
+        type=str,
+        nargs="+",
+        default=["penultimate"],
+        choices=["logits", "penultimate"],
+    )
+    aa("--overall_source", type=str, default="thingsvision")
+    aa(
+        "--model_dict_path",
+        type=str,
+        default="/home/space/datasets/things/model_dict.json",
+        help="Path to the model_dict.json",
+    )
+    aa(
+        "--distance",
+        type=str,
+        default="cosine",
+        choices=["cosine", "euclidean", "dot"],
+    )
+    aa(
+        "--batch_size",
+        metavar="B",
+        type=int,
+        default=None,
+        help="tuned automatically per model if not set",
+    )
+    aa(
+        "--memory_budget",
+        type=float,
+        default=None,
+        help="peak memory in GB per worker process under which batch sizes are tuned",
+    )
+    aa("--num_workers", type=int, default=0, help="image decoding workers per task")
+    aa("--prefetch", type=int, default=2)
+    aa("--backend", type=str, default="eager", choices=utils.evaluation.BACKENDS)
+    aa("--check_parity", action="store_true")
+    aa(
+        "--out_path",
+        type=str,
+        default="/home/space/datasets/things/results/",
+        help="path/to/results",
+    )
+    aa(
+        "--manifest_path",
+        type=str,
+        default=None,
+        help="path/to/manifest.csv (defaults to <out_path>/manifest.csv)",
+    )
+    aa("--device", type=str, default="cpu")
+    aa(
+        "--num_processes",
+        type=int,
+        default=4,
+        help="number of worker processes that evaluate models in parallel",
+    )
+    aa(
+        "--num_threads",
+        type=int,
+        default=4,
+        help="number of threads used for intraop parallelism within each worker",
+    )
+    aa("--not_pretrained", action="store_true")
+    aa("--extract_cls_token", action="store_true")
+    aa(
+        "--server_socket",
+        type=str,
+        default=None,
+        help="path/to/socket of a running extraction_server.py shared by all worker processes (defaults to its default socket)",
+    )
+    aa("--verbose", action="store_true")
+    args = parser.parse_args()
+    return args
+
+
+def get_models(args) -> List[Tuple[str, str]]:
+    """Get (model, source) pairs from networks.csv or from the command line."""
+    if args.networks_path:
+        networks = pd.read_csv(args.networks_path)
+        if "source" not in networks.columns:
+            networks["source"] = args.default_source
+        return list(zip(networks.model, networks.source.fillna(args.default_source)))
+    assert len(args.model_names) == len(
+        args.sources
+    ), "\nProvide one source for each model.\n"
+    return list(zip(args.model_names, args.sources))
+
+
+def is_complete(args, model: str, source: str, module: str, dataset: str) -> bool:
+    """A task is complete iff the results of all of its subsets exist."""
+    return all(
+        utils.evaluation.has_results(
+            get_out_path(args, dataset, category, stimulus_set, source, model, module)
+        )
+        for category, stimulus_set in get_subsets(args, dataset)
+    )
+
+
+def create_manifest(args) -> pd.DataFrame:
+    """Create one task per (model, source, module, dataset) and mark finished tasks."""
+    tasks = []
+    for model, source in get_models(args):
+        for dataset in args.datasets:
+            for module in args.modules:
+                status = (
+                    "done"
+                    if is_complete(args, model, source, module, dataset)
+                    else "pending"
+                )
+                tasks.append((model, source, module, dataset, status, None))
+    return pd.DataFrame(tasks, columns=MANIFEST_COLUMNS)
+
+
+def init_worker(num_threads: int) -> None:
+    torch.set_num_threads(num_threads)
+
+
+def run_model(
+    args, model: str, source: str, tasks: List[Tuple[str, str]]
+) -> Tuple[str, str, List[Dict[str, Any]], str]:
+    """Evaluate all pending tasks of a model; tracebacks are returned rather than raised."""
+    try:
+        model_config = utils.evaluation.load_model_config(args.model_dict_path)
+        client = utils.evaluation.connect(args.server_socket)
+        timings = evaluate_model(
+            args, model, source, tasks, model_config, client=client
+        )
+        return model, source, timings, None
+    except Exception:
+        return model, source, [], traceback.format_exc()
+
+
+def run_pool(
+    args, jobs: Dict[Tuple[str, str], List[Tuple[str, str]]], num_processes: int
+) -> Iterator[Tuple[str, str, List[Dict[str, Any]], str, bool]]:
+    """Evaluate models on a new process pool and yield their results as they complete.
+
+    If a worker process dies (e.g., killed for running out of memory), the pool breaks and every
+    unfinished model is yielded with the traceback of the BrokenProcessPool error and crashed=True.
+    """
+    with ProcessPoolExecutor(
+        max_workers=num_processes,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_worker,
+        initargs=(args.num_threads,),
+    ) as executor:
+        futures = {
+            executor.submit(run_model, args, model, source, tasks): (model, source)
+            for (model, source), tasks in jobs.items()
+        }
+        for future in as_completed(futures):
+            try:
+                yield (*future.result(), False)
+            except BrokenProcessPool:
+                model, source = futures[future]
+                yield model, source, [], traceback.format_exc(), True
+
+
+def run_jobs(
+    args, jobs: Dict[Tuple[str, str], List[Tuple[str, str]]]
+) -> Iterator[Tuple[str, str, List[Dict[str, Any]], str]]:
+    """Evaluate models in parallel and recreate the process pool whenever a worker dies.
+
+    Models that were unfinished when the pool broke are evaluated on a new pool. Models that
+    break the pool again are evaluated one at a time, each in a pool of its own, such that the
+    model whose worker dies is identified (and reported with its traceback) without failing others.
+    """
+    broken = {}
+    for model, source, timings, error, crashed in run_pool(
+        args, jobs, args.num_processes
+    ):
+        if crashed:
+            broken[(model, source)] = jobs[(model, source)]
+        else:
+            yield model, source, timings, error
+    if broken:
+        print(
+            f"\nA worker process died. Recreating the pool for {len(broken)} models...\n"
+        )
+        jobs, broken = broken, {}
+        for model, source, timings, error, crashed in run_pool(
+            args, jobs, args.num_processes
+        ):
+            if crashed:
+                broken[(model, source)] = jobs[(model, source)]
+            else:
+                yield model, source, timings, error
+    for key, tasks in broken.items():
+        for model, source, timings, error, _ in run_pool(args, {key: tasks}, 1):
+            yield model, source, timings, error
+
+
+def sweep(args) -> None:
+    if not os.path.exists(args.out_path):
+        os.makedirs(args.out_path)
+    manifest_path = args.manifest_path or os.path.join(args.out_path, "manifest.csv")
+    if args.memory_budget is None and not args.device.startswith("cuda"):
+        # worker processes share the physical memory of the machine
+        args.memory_budget = round(
+            utils.evaluation.get_default_budget(args.device) / args.num_processes, 1
+        )
+    manifest = create_manifest(args)
+    manifest.to_csv(manifest_path, index=False)
+    pending = manifest[manifest.status != "done"]
+    print(
+        f"\n{len(manifest) - len(pending)} of {len(manifest)} tasks are already complete.\n"
+    )
+    # group pending tasks by model, such that every model is loaded only once
+    jobs = defaultdict(list)
+    for task in pending.itertuples():
+        jobs[(task.model, task.source)].append((task.dataset, task.module))
+
+    timings = []
+    log_path = os.path.join(args.out_path, "sweep_failures.log")
+    for model, source, model_timings, error in run_jobs(args, jobs):
+        timings.extend(model_timings)
+        for dataset, module in jobs[(model, source)]:
+            rows = (
+                (manifest.model == model)
+                & (manifest.source == source)
+                & (manifest.dataset == dataset)
+                & (manifest.module == module)
+            )
+            if is_complete(args, model, source, module, dataset):
+                manifest.loc[rows, "status"] = "done"
+            else:
+                manifest.loc[rows, ["status", "error"]] = ["failed", error]
+        if error is not None:
+            print(f"\nEvaluation of {model} failed. See {log_path}.\n")
+            with open(log_path, "a") as f:
+                f.write(f"{model} ({source})\n{error}\n")
+        # persist progress after every model so that a crash loses no information
+        manifest.to_csv(manifest_path, index=False)
+
+    if timings:
+        timings = pd.DataFrame(timings)
+        timings_path = os.path.join(args.out_path, "timings.csv")
+        if os.path.isfile(timings_path):
+            timings = pd.concat([pd.read_csv(timings_path), timings])
+        timings.to_csv(timings_path, index=False)
+    print(manifest.status.value_counts())
+
+
+if __name__ == "__main__":
+    args = parseargs()
+    sweep(args)
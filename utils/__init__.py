@@ -1 +1,14 @@
-from . import analyses, evaluation, probing, plotting
\ No newline at end of file
+import importlib
+
+__all__ = ["analyses", "evaluation", "probing", "plotting", "triplets"]
+
+
+def __getattr__(name: str):
+    """Import submodules (and their heavy dependencies) on first attribute access (PEP 562)."""
+    if name not in __all__:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return importlib.import_module(f".{name}", __name__)
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
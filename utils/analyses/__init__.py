@@ -1,4 +1,5 @@
 from .cka import CKA
+from .correctness import CorrectnessIndex
 from .failures import Failures
 from .families import Families
 from .helpers import get_family_name, merge_results
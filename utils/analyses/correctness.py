@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from dataclasses import dataclass
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+Array = np.ndarray
+
+# number of set bits for every possible byte
+POPCOUNT = np.array([bin(byte).count("1") for byte in range(256)], dtype=np.uint8)
+
+
+@dataclass
+class CorrectnessIndex:
+    """Bit-packed index of the triplets for which each model chose the same odd-one-out as humans.
+
+    Every row of <bits> holds one packed bitset of length <n_triplets> for a single model,
+    where a set bit marks a correctly predicted triplet (i.e., a hit).
+    """
+
+    models: Array
+    bits: Array
+    n_triplets: int
+
+    def __post_init__(self):
+        self.models = np.asarray(self.models)
+        assert self.bits.shape[0] == self.models.shape[0]
+        # mask that clears the padding bits of the last byte after a negation
+        self.valid = np.packbits(np.ones(self.n_triplets, dtype=bool))
+
+    @classmethod
+    def from_choices(
+        cls, model_choices: Array, models: List[str], target: int = 2
+    ) -> "CorrectnessIndex":
+        """Build the index from an (N x M) matrix of odd-one-out choices."""
+        n_triplets, n_models = model_choices.shape
+        bits = np.empty((n_models, (n_triplets + 7) // 8), dtype=np.uint8)
+        for j in range(n_models):
+            bits[j] = np.packbits(model_choices[:, j] == target)
+        return cls(models=models, bits=bits, n_triplets=n_triplets)
+
+    @classmethod
+    def from_results(cls, results: pd.DataFrame, target: int = 2) -> "CorrectnessIndex":
+        """Build the index from a results dataframe with one row per model."""
+        n_triplets = results.choices.values[0].shape[0]
+        bits = np.empty((results.shape[0], (n_triplets + 7) // 8), dtype=np.uint8)
+        for j, choices in enumerate(results.choices.values):
+            bits[j] = np.packbits(choices == target)
+        return cls(models=results.model.values, bits=bits, n_triplets=n_triplets)
+
+    @classmethod
+    def load(cls, path: str) -> "CorrectnessIndex":
+        with np.load(path, allow_pickle=False) as index:
+            return cls(
+                models=index["models"],
+                bits=index["bits"],
+                n_triplets=int(index["n_triplets"]),
+            )
+
+    def save(self, path: str) -> None:
+        np.savez(
+            path,
+            models=self.models.astype(str),
+            bits=self.bits,
+            n_triplets=self.n_triplets,
+        )
+
+    def select(
+        self, models: Optional[List[str]] = None, rows: Optional[List[int]] = None
+    ) -> Array:
+        """Select the bitsets for a subset of models (by name) or rows (by position)."""
+        if rows is not None:
+            return self.bits[np.asarray(rows)]
+        if models is None:
+            return self.bits
+        return self.bits[np.isin(self.models, models)]
+
+    def negate(self, bitset: Array) -> Array:
+        return np.bitwise_not(bitset) & self.valid
+
+    def hits(
+        self,
+        models: Optional[List[str]] = None,
+        rows: Optional[List[int]] = None,
+        how: str = "all",
+    ) -> Array:
+        """Triplets that all (or any) of the selected models predicted correctly."""
+        assert how in ["all", "any"]
+        bits = self.select(models, rows)
+        if bits.shape[0] == 0:
+            # an empty selection trivially hits all triplets and fails none
+            return self.valid.copy() if how == "all" else np.zeros_like(self.valid)
+        if how == "all":
+            return np.bitwise_and.reduce(bits, axis=0)
+        return np.bitwise_or.reduce(bits, axis=0)
+
+    def failures(
+        self,
+        models: Optional[List[str]] = None,
+        rows: Optional[List[int]] = None,
+        how: str = "all",
+    ) -> Array:
+        """Triplets for which all (or any) of the selected models chose differently than humans."""
+        assert how in ["all", "any"]
+        # every model fails iff no model hits and vice versa
+        return self.negate(
+            self.hits(models, rows, how="any" if how == "all" else "all")
+        )
+
+    def unique_failures(self, models: List[str]) -> Array:
+        """Triplets that every selected model fails while every other model predicts correctly."""
+        others = self.models[~np.isin(self.models, models)]
+        return self.failures(models) & self.hits(others)
+
+    def hit_failure_intersection(
+        self, models_i: List[str], models_j: List[str]
+    ) -> Array:
+        """Triplets that every model in <models_i> predicts correctly and every model in <models_j> fails."""
+        return self.hits(models_i) & self.failures(models_j)
+
+    @staticmethod
+    def count(bitset: Array) -> int:
+        """Population count of a packed bitset."""
+        return int(POPCOUNT[bitset].sum(dtype=np.int64))
+
+    def counts(self) -> Array:
+        """Number of correctly predicted triplets for every model."""
+        return POPCOUNT[self.bits].sum(axis=1, dtype=np.int64)
+
+    def mask(self, bitset: Array) -> Array:
+        return np.unpackbits(bitset, count=self.n_triplets).astype(bool)
+
+    def indices(self, bitset: Array) -> Array:
+        return np.flatnonzero(np.unpackbits(bitset, count=self.n_triplets))
@@ -3,13 +3,13 @@
 
 from collections import defaultdict
 from dataclasses import dataclass
-from functools import partial
-from typing import Dict, List
+from typing import Dict, List, Tuple
 
 import numpy as np
 import pandas as pd
 
 from . import helpers
+from .correctness import CorrectnessIndex
 from .families import Families
 
 Array = np.ndarray
@@ -23,19 +23,26 @@ class Failures:
     iv: str
     concept_importance: str = None
     human_entropies: Array = None
+    n_bootstraps: int = 1000
+    alpha: float = 0.05
+    rnd_seed: int = 42
 
     def __post_init__(self):
         self.models = self.results.model.unique()
         self.families = Families(self.models)
+        self.correctness = CorrectnessIndex.from_results(self.results)
+        self.rng = np.random.default_rng(self.rnd_seed)
         self.classification_errors = dict()
+        self.confidence_intervals = dict()
         self.n_families = 0
 
         assert self.iv in ["dimension", "entropy"]
         if self.iv == "dimension":
             assert self.concept_importance in ["max", "topk"]
-            importance_fun = getattr(helpers, f"get_{self.concept_importance}_dims")
-            self.importance_fun = partial(importance_fun, self.concept_embedding)
-            self.n_triplets_per_bin = self.get_triplets_per_bin(self.triplets)
+            # one row of (top-k) dimensions per triplet
+            self.triplet_assignments = helpers.get_triplet_dimensions(
+                self.concept_embedding, self.triplets, self.concept_importance
+            ).reshape(self.triplets.shape[0], -1)
             self.n_bins = self.concept_embedding.shape[-1]
         else:  # entropy
             self.boundaries = np.arange(0, np.log(3) + 1e-1, 1e-1)
@@ -44,46 +51,128 @@ class Failures:
             ), "\nVICE entropies required to compute zero-one loss per entropy bucket.\n"
             self.triplet_assignments = np.digitize(
                 self.human_entropies, bins=self.boundaries, right=True
-            )
-            self.n_triplets_per_bin = self.get_triplets_per_bin(
-                np.arange(self.triplets.shape[0])
-            )
+            )[:, None]
             self.n_bins = self.boundaries.shape[0] - 1
+        # bins below the smallest assignment are dropped
+        self.offset = self.triplet_assignments.min()
+        self.n_triplets_per_bin = self.get_triplets_per_bin(
+            np.arange(self.triplets.shape[0])
+        )
 
     def get_model_subset(self, family: str) -> List[str]:
         return getattr(self.families, family)
 
-    def get_correct_predictions(self, model_choices: Array) -> Array:
+    def get_family_failures(self, family: str) -> Array:
+        """Get the triplets for which every child of a family responded differently than humans."""
+        model_subset = self.get_model_subset(family)
+        return self.correctness.indices(self.correctness.failures(model_subset))
+
+    def get_correct_predictions(self, row: int) -> Array:
         """Partition triplets into failure and correctly predicted triplets."""
-        correct_predictions = np.where(model_choices == 2)[0]
-        if self.iv == "dimension":
-            correct_predictions = self.triplets[correct_predictions]
+        correct_predictions = self.correctness.indices(
+            self.correctness.hits(rows=[row])
+        )
         return correct_predictions
 
     def get_triplets_per_bin(self, triplets: Array) -> Array:
-        if self.iv == "dimension":
-            triplet_assignments = self.importance_fun(triplets)
-        else:  # entropy
-            triplet_assignments = self.triplet_assignments[triplets]
+        """Count the number of triplets per bin for a subset of triplet indices."""
+        triplet_assignments = self.triplet_assignments[triplets].ravel()
         num_triplets_per_bin = np.bincount(triplet_assignments)[
             triplet_assignments.min() :
         ]
         return num_triplets_per_bin
 
+    def count_hits(self, rows: Array, chunk_size: int = 2**14) -> Tuple[Array, Array]:
+        """Count the hits per bin for several models at once.
+
+        Returns an (R x B) matrix of hits per model and bin, obtained from one 2-D bincount
+        per chunk of triplets, and a (B x R+1) histogram over the number of models that
+        predicted a triplet correctly, which is used for bootstrapping the family average.
+        """
+        assert (
+            chunk_size % 8 == 0
+        ), "\nChunks need to be aligned with the bytes of the bitsets.\n"
+        n_rows, n_bins = len(rows), self.n_triplets_per_bin.shape[0]
+        bits = self.correctness.bits[rows]
+        hits_per_bin = np.zeros(n_bins * n_rows, dtype=np.int64)
+        level_histogram = np.zeros(n_bins * (n_rows + 1), dtype=np.int64)
+        for start in range(0, self.correctness.n_triplets, chunk_size):
+            n_triplets = min(chunk_size, self.correctness.n_triplets - start)
+            # (n x R) boolean matrix of hits for the current chunk
+            hits = np.unpackbits(
+                bits[:, start // 8 : (start + chunk_size) // 8],
+                axis=1,
+                count=n_triplets,
+            ).T.astype(bool)
+            # (n x k) bin assignments for the current chunk
+            assignments = (
+                self.triplet_assignments[start : start + n_triplets] - self.offset
+            )
+            bin_model_pairs = assignments[:, :, None] * n_rows + np.arange(n_rows)
+            hits_per_bin += np.bincount(
+                bin_model_pairs[
+                    np.broadcast_to(hits[:, None, :], bin_model_pairs.shape)
+                ],
+                minlength=n_bins * n_rows,
+            )[: n_bins * n_rows]
+            levels = assignments * (n_rows + 1) + hits.sum(axis=1, keepdims=True)
+            level_histogram += np.bincount(
+                levels.ravel(), minlength=n_bins * (n_rows + 1)
+            )[: n_bins * (n_rows + 1)]
+        hits_per_bin = hits_per_bin.reshape(n_bins, n_rows).T
+        level_histogram = level_histogram.reshape(n_bins, n_rows + 1)
+        return hits_per_bin, level_histogram
+
+    def bootstrap_confidence_intervals(
+        self, hits_per_bin: Array, level_histogram: Array
+    ) -> Tuple[Array, Array]:
+        """Bootstrap confidence intervals for the zero-one loss in every bin.
+
+        Resampling the triplets of a bin with replacement is equivalent to drawing the number of
+        hits from a binomial (per model) or the number of triplets per hit level from a multinomial
+        (family average), so no per-triplet resampling is necessary.
+        """
+        n_rows = hits_per_bin.shape[0]
+        n_triplets = self.n_triplets_per_bin
+        quantiles = [self.alpha / 2, 1 - self.alpha / 2]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            hit_rates = np.where(n_triplets > 0, hits_per_bin / n_triplets, 0.0)
+            samples = self.rng.binomial(
+                n_triplets, hit_rates, size=(self.n_bootstraps, *hit_rates.shape)
+            )
+            model_intervals = np.quantile(1 - samples / n_triplets, quantiles, axis=0)
+            family_samples = np.empty((self.n_bootstraps, n_triplets.shape[0]))
+            for b, histogram in enumerate(level_histogram):
+                if n_triplets[b] == 0:
+                    family_samples[:, b] = np.nan
+                    continue
+                counts = self.rng.multinomial(
+                    n_triplets[b], histogram / histogram.sum(), size=self.n_bootstraps
+                )
+                family_samples[:, b] = 1 - (counts @ np.arange(n_rows + 1)) / (
+                    n_rows * n_triplets[b]
+                )
+        family_interval = np.quantile(family_samples, quantiles, axis=0)
+        # (R x B x 2) intervals per model and (B x 2) interval for the family average
+        return model_intervals.transpose(1, 2, 0), family_interval.T
+
     def compute_classification_errors(self, family: str) -> None:
         children = self.get_model_subset(family)
-        family_subset = self.results[self.results.model.isin(children)]
-        family_subset.reset_index(drop=True, inplace=True)
+        rows = np.flatnonzero(self.results.model.isin(children))
+        hits_per_bin, level_histogram = self.count_hits(rows)
+        binwise_zero_one_losses = 1 - (hits_per_bin / self.n_triplets_per_bin)
+        model_intervals, family_interval = self.bootstrap_confidence_intervals(
+            hits_per_bin, level_histogram
+        )
         classification_errors = defaultdict(dict)
-        for _, child_data in family_subset.iterrows():
-            model_choices = child_data["choices"]
-            # get triplet indices for which a model predictly differently than humans
-            correct_predictions = self.get_correct_predictions(model_choices)
-            num_hits_per_bin = self.get_triplets_per_bin(correct_predictions)
-            binwise_zero_one_loss = 1 - (num_hits_per_bin / self.n_triplets_per_bin)
-            classification_errors[child_data.model][
-                child_data.source
-            ] = binwise_zero_one_loss.tolist()
+        confidence_intervals = defaultdict(dict)
+        for row, zero_one_loss, interval in zip(
+            rows, binwise_zero_one_losses, model_intervals
+        ):
+            model = self.results.model.values[row]
+            source = self.results.source.values[row]
+            classification_errors[model][source] = zero_one_loss.tolist()
+            confidence_intervals[model][source] = interval
 
         # average zero-one losses per dimesions over the children of a family
         family_classification_errors = [
@@ -95,9 +184,13 @@ class Failures:
         family_classification_error = family_classification_errors.mean(axis=0)
 
         classification_errors.update({"overall": {"all": family_classification_error}})
+        confidence_intervals.update({"overall": {"all": family_interval}})
         self.classification_errors.update(
             {self.families.mapping[family]: classification_errors}
         )
+        self.confidence_intervals.update(
+            {self.families.mapping[family]: confidence_intervals}
+        )
 
     def update(self, family: str) -> None:
         self.compute_classification_errors(family)
@@ -106,3 +199,7 @@ class Failures:
     @property
     def family_zero_one_losses(self) -> Dict[str, Array]:
         return self.classification_errors
+
+    @property
+    def family_confidence_intervals(self) -> Dict[str, Array]:
+        return self.confidence_intervals
@@ -1,52 +1,121 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import hashlib
 import os
 import warnings
-from functools import partial
-from typing import List
+from typing import Dict, List, Tuple
 
 import numpy as np
 import pandas as pd
 
+from ..evaluation.results import load_results
+from .correctness import CorrectnessIndex
 from .families import Families
 
 Array = np.ndarray
 
 
-def aggregate_dimensions(concept_embedding: Array, idx_triplet: Array) -> Array:
+# per-triplet dimension assignments, keyed by (triplets, embedding, importance, k)
+TRIPLET_DIMENSIONS: Dict[Tuple[str, str, str, int], Array] = {}
+
+
+def aggregate_dimensions(concept_embedding: Array, idx_triplets: Array) -> Array:
     """Aggregate the histogram of dimensions across the pair of the two most similar objects."""
-    triplet_embedding = concept_embedding[idx_triplet]
-    pair_dimensions = triplet_embedding[:-1].mean(axis=0)
+    triplet_embeddings = concept_embedding[idx_triplets]
+    pair_dimensions = triplet_embeddings[..., :-1, :].mean(axis=-2)
     return pair_dimensions
 
 
-def get_max_dims(concept_embedding: Array, triplets: Array) -> Array:
+def get_max_dims(
+    concept_embedding: Array, triplets: Array, chunk_size: int = 2**18
+) -> Array:
     """Get most important dimension for the most similar object pair in a triplet."""
-    aggregate = partial(aggregate_dimensions, concept_embedding)
-
-    def get_max_dim(triplet: Array) -> Array:
-        pair_dimensions = aggregate(triplet)
-        return np.argmax(pair_dimensions)
-
-    return np.apply_along_axis(get_max_dim, axis=1, arr=triplets)
+    max_dims = np.empty(triplets.shape[0], dtype=np.int64)
+    for start in range(0, triplets.shape[0], chunk_size):
+        pair_dimensions = aggregate_dimensions(
+            concept_embedding, triplets[start : start + chunk_size]
+        )
+        max_dims[start : start + chunk_size] = pair_dimensions.argmax(axis=1)
+    return max_dims
 
 
-def get_topk_dims(concept_embedding: Array, triplets: Array, k: int = 2) -> Array:
+def get_topk_dims(
+    concept_embedding: Array, triplets: Array, k: int = 2, chunk_size: int = 2**18
+) -> Array:
     """Get top-k most important dimension for the most similar object pair in a triplet."""
-    aggregate = partial(aggregate_dimensions, concept_embedding)
-
-    def get_topks(k: int, triplet: Array) -> Array:
-        aggregated_dimensions = aggregate(triplet)
-        return np.argsort(-aggregated_dimensions)[:k]
-
-    return np.apply_along_axis(partial(get_topks, k), axis=1, arr=triplets).flatten()
+    topk_dims = np.empty((triplets.shape[0], k), dtype=np.int64)
+    for start in range(0, triplets.shape[0], chunk_size):
+        pair_dimensions = aggregate_dimensions(
+            concept_embedding, triplets[start : start + chunk_size]
+        )
+        topk = np.argpartition(-pair_dimensions, k - 1, axis=1)[:, :k]
+        # sort the top-k dimensions by decreasing importance
+        order = np.argsort(-np.take_along_axis(pair_dimensions, topk, axis=1), axis=1)
+        topk_dims[start : start + chunk_size] = np.take_along_axis(topk, order, axis=1)
+    return topk_dims.flatten()
+
+
+def fingerprint(arr: Array) -> str:
+    """Hash the shape, dtype and content of an array."""
+    arr = np.ascontiguousarray(arr)
+    digest = hashlib.sha1(f"{arr.shape}{arr.dtype}".encode())
+    digest.update(arr.view(np.uint8).reshape(-1))
+    return digest.hexdigest()
+
+
+def get_triplet_dimensions(
+    concept_embedding: Array,
+    triplets: Array,
+    concept_importance: str = "max",
+    k: int = 2,
+    cache_dir: str = None,
+) -> Array:
+    """Get the (cached) concept dimension assignment of every triplet.
+
+    Assignments are computed once per set of triplets, concept embedding and k
+    and reused across analyses. If <cache_dir> is given, they are stored on disk too.
+    """
+    assert concept_importance in ["max", "topk"]
+    key = (
+        fingerprint(triplets),
+        fingerprint(concept_embedding),
+        concept_importance,
+        k if concept_importance == "topk" else 1,
+    )
+    if key in TRIPLET_DIMENSIONS:
+        return TRIPLET_DIMENSIONS[key]
+    cache_file = None
+    if cache_dir:
+        cache_file = os.path.join(
+            cache_dir, "dimensions_{}_{}_{}_{}.npy".format(key[0][:16], *key[1:])
+        )
+    if cache_file and os.path.isfile(cache_file):
+        triplet_dimensions = np.load(cache_file)
+    else:
+        if concept_importance == "max":
+            triplet_dimensions = get_max_dims(concept_embedding, triplets)
+        else:
+            triplet_dimensions = get_topk_dims(concept_embedding, triplets, k=k)
+        if cache_file:
+            os.makedirs(cache_dir, exist_ok=True)
+            np.save(cache_file, triplet_dimensions)
+    triplet_dimensions.setflags(write=False)
+    TRIPLET_DIMENSIONS[key] = triplet_dimensions
+    return triplet_dimensions
 
 
 def get_failures(triplets: Array, model_choices: Array, target: int = 2) -> Array:
-    """Partition triplets into failure and correctly predicted triplets."""
-    model_failures = np.where(model_choices != target)[0]
-    failure_triplets = triplets[model_failures]
+    """Partition triplets into failure and correctly predicted triplets.
+
+    If <model_choices> is an (N x M) matrix, return the triplets every model failed.
+    """
+    if model_choices.ndim == 1:
+        model_choices = model_choices[:, None]
+    correctness = CorrectnessIndex.from_choices(
+        model_choices, models=np.arange(model_choices.shape[1]), target=target
+    )
+    failure_triplets = triplets[correctness.indices(correctness.failures())]
     return failure_triplets
 
 
@@ -82,7 +151,7 @@ def merge_results(
 
 
 def get_results(root: str) -> pd.DataFrame:
-    return pd.read_pickle(os.path.join(root, "results.pkl"))
+    return load_results(root, arrays=["choices", "probas", "entropies"])
 
 
 def map_model_name(name: str) -> str:
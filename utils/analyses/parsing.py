@@ -1,7 +1,14 @@
+import json
 import os
-import pickle
+import shutil
+import tempfile
+import warnings
 import pandas as pd
 from utils.analyses.training_mapping import Mapper
+from utils.evaluation.results import LEGACY_FILE, SUMMARY_FILE, load_results
+
+CACHE_DIR = '.parse_cache'
+CACHE_FILES = ['index.csv', 'results.pkl', 'training.json']
 
 
 def exclude_models(results):
@@ -32,18 +39,100 @@ def exclude_ecoset_models(results):
     return results[~results.model.isin(blacklist)]
 
 
-def parse_results_dir(base_dir, modules=['logits', 'penultimate']):
-    data = []
-    for dir in os.listdir(base_dir):
-        path = os.path.join(base_dir, dir)
+def get_training_objectives(results, cache=None):
+    """Map (model, family, source) to training objectives, reusing the mappings in <cache> if given."""
+    cache = {} if cache is None else cache
+    keys = ['|'.join(key) for key in zip(results.model, results.family, results.source)]
+    missing = results[[key not in cache for key in keys]].drop_duplicates(['model', 'family', 'source'])
+    if not missing.empty:
+        keys_missing = ['|'.join(key) for key in zip(missing.model, missing.family, missing.source)]
+        cache.update(zip(keys_missing, Mapper(missing).get_training_objectives()))
+    return [cache[key] for key in keys]
+
+
+def find_result_files(base_dir, modules):
+    """Find the result file of every (model directory, module) pair together with its mtime and size."""
+    files = []
+    for dir in sorted(os.listdir(base_dir)):
+        if dir.startswith('.'):
+            continue
         for module in modules:
-            if os.path.exists(os.path.join(path, module)):
-                with open(os.path.join(path, module, 'results.pkl'), 'rb') as f:
-                    df = pickle.load(f)
-                    df['module'] = module
-                    data.append(df)
-    results = pd.concat(data)
-    mapper = Mapper(results)
-    results['training'] = mapper.get_training_objectives()
+            module_path = os.path.join(base_dir, dir, module)
+            for file in (SUMMARY_FILE, LEGACY_FILE):
+                if os.path.isfile(os.path.join(module_path, file)):
+                    stat = os.stat(os.path.join(module_path, file))
+                    files.append((os.path.join(dir, module, file), module, stat.st_mtime_ns, stat.st_size))
+                    break
+    return pd.DataFrame(files, columns=['path', 'module', 'mtime', 'size'])
+
+
+def load_cache(cache_dir):
+    """Load a parse cache; returns None (i.e., a cache miss) if any of its files is missing."""
+    if not all(os.path.isfile(os.path.join(cache_dir, file)) for file in CACHE_FILES):
+        return None
+    index = pd.read_csv(os.path.join(cache_dir, 'index.csv'))
+    results = pd.read_pickle(os.path.join(cache_dir, 'results.pkl'))
+    with open(os.path.join(cache_dir, 'training.json'), 'r') as f:
+        training_cache = json.load(f)
+    return index, results, training_cache
+
+
+def save_cache(cache_dir, index, results, training_cache):
+    """Write the files of a parse cache to a temporary directory and rename it into place.
+
+    Results directories may be shared or read-only; if the cache cannot be written, parsing
+    still succeeds without it.
+    """
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(cache_dir)), exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(cache_dir)))
+        try:
+            results.to_pickle(os.path.join(tmp_dir, 'results.pkl'))
+            index.to_csv(os.path.join(tmp_dir, 'index.csv'), index=False)
+            with open(os.path.join(tmp_dir, 'training.json'), 'w') as f:
+                json.dump(training_cache, f)
+            if os.path.isdir(cache_dir):
+                # replace a stale cache
+                shutil.rmtree(cache_dir)
+            os.rename(tmp_dir, cache_dir)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    except OSError as error:
+        warnings.warn(
+            message=f'\nCould not write parse cache to <{cache_dir}>: {error}.\n',
+            category=UserWarning,
+        )
+
+
+def parse_results_dir(base_dir, modules=['logits', 'penultimate'], rebuild=False, verbose=False, cache_dir=None):
+    """Consolidate the results of all models in <base_dir> into a single table.
+
+    An index of the parsed files (path, mtime, size), the consolidated table and the mapping to
+    training objectives are cached in <cache_dir> (defaults to <base_dir>/.parse_cache), such that
+    only new or changed result files are parsed again. Pass rebuild=True to ignore the cache.
+    """
+    cache_dir = cache_dir or os.path.join(base_dir, CACHE_DIR)
+    index = files = find_result_files(base_dir, modules)
+    cached, training_cache = None, {}
+    cache = None if rebuild else load_cache(cache_dir)
+    if cache is not None:
+        cached_index, cached, training_cache = cache
+        unchanged = files.merge(cached_index, on=['path', 'module', 'mtime', 'size']).path
+        # drop cached rows of removed or changed result files
+        cached = cached[cached._path.isin(unchanged)]
+        files = files[~files.path.isin(unchanged)]
+    data = [] if cached is None else [cached]
+    for path, module in zip(files.path, files.module):
+        # summary metrics only; per-triplet arrays are not needed for the consolidated tables
+        df = load_results(os.path.join(base_dir, os.path.dirname(path)), arrays=())
+        df['module'] = module
+        df['_path'] = path
+        data.append(df)
+    if verbose:
+        print(f'Parsed {len(files)} new or changed result files in {base_dir}')
+    results = pd.concat(data).sort_values('_path', kind='stable')
+    results['training'] = get_training_objectives(results, training_cache)
     # results = results[results.source != 'vit_best']
-    return results
+
+    save_cache(cache_dir, index, results, training_cache)
+    return results.drop(columns=['_path'])
@@ -3,13 +3,14 @@
 
 import random
 from dataclasses import dataclass
-from functools import partial
+from functools import cached_property
 from typing import List, Tuple
 
 import numpy as np
 import pandas as pd
 
 from . import helpers
+from .correctness import CorrectnessIndex
 from .families import Families
 
 Array = np.ndarray
@@ -29,14 +30,12 @@ class Partition:
 
     def __post_init__(self):
         assert self.concept_importance in ["max", "topk"]
-        importance_fun = getattr(helpers, f"get_{self.concept_importance}_dims")
-        self.importance_fun = partial(importance_fun, self.concept_embedding)
         self.models = self.results.model.unique()
         self.families = Families(self.models)
         self.triplets = self.triplet_dataset.triplets
-        self.triplet_dimensions = self.importance_fun(self.triplets)
-        self.familywise_failure_differences = self.get_failure_differences()
-        self.familywise_hit_failure_intersection = self.get_hit_failure_intersection()
+        self.triplet_dimensions = helpers.get_triplet_dimensions(
+            self.concept_embedding, self.triplets, self.concept_importance
+        )
 
     def get_model_subset(self, family: str) -> List[str]:
         return getattr(self.families, family)
@@ -55,103 +54,97 @@ class Partition:
         ooo_choices = np.where(firt_conversion < 0, 2, firt_conversion)
         return ooo_choices
 
-    def get_model_choices(self) -> Array:
-        """Get the odd-one-out choices for every triplet for every model."""
-        """
-        model_choices = np.stack(
-            [
-                self.results[self.results.model == model]
-                .probas.apply(self.convert_choices)
-                .values[0]
-                for model in self.models
-            ],
-            axis=1,
+    @cached_property
+    def model_choices(self) -> Array:
+        """Compact (N x M) matrix of the odd-one-out choices for every triplet for every model."""
+        model_rows = [
+            np.flatnonzero(self.results.model.values == model)[0]
+            for model in self.models
+        ]
+        choices = self.results.choices.values
+        model_choices = np.empty(
+            (choices[model_rows[0]].shape[0], len(self.models)), dtype=np.int8
         )
-        """
-        model_choices = np.stack(
-            [
-                self.results[self.results.model == model].choices.values[0]
-                for model in self.models
-            ],
-            axis=1,
+        for j, row in enumerate(model_rows):
+            model_choices[:, j] = choices[row]
+        return model_choices
+
+    @cached_property
+    def correctness(self) -> CorrectnessIndex:
+        return CorrectnessIndex.from_choices(
+            self.model_choices, models=self.models, target=self.target
         )
 
-        return model_choices
+    def get_model_choices(self) -> Array:
+        """Get the odd-one-out choices for every triplet for every model."""
+        return self.model_choices
 
     def get_children_choices(self, model_subset):
         """Compute the choices of the children belonging to a family."""
-        model_choices = self.get_model_choices()
-        children_choices = model_choices[:, self.results.model.isin(model_subset)]
+        children_choices = self.model_choices[:, np.isin(self.models, model_subset)]
         return children_choices
 
-    @property
+    @cached_property
     def family_i_hits(self) -> Array:
         model_subset = self.get_model_subset(self.family_i)
-        children_family_i_choices = self.get_children_choices(model_subset)
-        family_i_hits = np.where(
-            np.sum(children_family_i_choices, axis=1)
-            == (self.target * len(model_subset))
-        )[0]
+        family_i_hits = self.correctness.indices(self.correctness.hits(model_subset))
         return family_i_hits
 
-    def filter_failures(self, model_choices: Array) -> Tuple[List[int], Array]:
-        failures, choices = zip(
-            *list(filter(lambda kv: self.target not in kv[1], enumerate(model_choices)))
-        )
-        return failures, np.asarray(choices)
+    def filter_failures(
+        self, model_subset: List[str], children_choices: Array
+    ) -> Tuple[Array, Array]:
+        """Filter for triplets where every child of a family responded differently than humans."""
+        failures = self.correctness.indices(self.correctness.failures(model_subset))
+        return failures, children_choices[failures]
+
+    def get_unique_failures(self, family: str) -> Array:
+        """Find the triplets that every child of a family fails but every other model predicts correctly."""
+        model_subset = self.get_model_subset(family)
+        return self.correctness.indices(self.correctness.unique_failures(model_subset))
+
+    @staticmethod
+    def is_unanimous(children_choices: Array) -> Array:
+        """Check for every row whether all children made the same choice."""
+        if children_choices.shape[1] == 0:
+            return np.zeros(children_choices.shape[0], dtype=bool)
+        return np.all(children_choices == children_choices[:, :1], axis=1)
 
     @staticmethod
     def get_intersection(family_failures: pd.DataFrame) -> Array:
         """Find the intersection of failures between the children belonging to a family."""
-
-        def equality_condition(children_choices: Array) -> bool:
-            def is_equal(children_choices: Array) -> bool:
-                return np.unique(children_choices).shape[0] == 1
-
-            return is_equal(children_choices)
-
-        return np.apply_along_axis(equality_condition, axis=1, arr=family_failures)
+        return Partition.is_unanimous(family_failures.to_numpy())
 
     def get_family_failures(self, family: str) -> pd.DataFrame:
         """Get examples for which the children belonging to a family responded differently than humans."""
         model_subset = self.get_model_subset(family)
         children_choices = self.get_children_choices(model_subset)
-        failures, choices = self.filter_failures(children_choices)
+        failures, choices = self.filter_failures(model_subset, children_choices)
         children_failures = pd.DataFrame(
             data=choices, index=failures, columns=model_subset
         )
         return children_failures
 
-    @property
-    def family_j_failures(self) -> pd.DataFrame:
+    @cached_property
+    def family_j_failures(self) -> pd.Series:
         family_failures = self.get_family_failures(self.family_j)
         intersection = self.get_intersection(family_failures)
-        examples = family_failures.index[np.where(intersection == True)[0]].to_numpy()
-        failures = family_failures.filter(items=examples, axis=0)
-        # aggregate choices (take the set over family choices)
-        failures = failures.apply(lambda x: x.unique()[0], axis="columns")
+        # aggregate choices (the children of a family agree on every remaining triplet)
+        failures = family_failures.iloc[:, 0][intersection]
         return failures
 
-    @staticmethod
-    def _is_different(family_i_choices: Array, family_j_choices: Array) -> bool:
-        return np.all(
-            [
-                family_i_choices.shape[0] == 1,
-                family_j_choices.shape[0] == 1,
-                np.all(family_i_choices != family_j_choices),
-            ]
-        )
-
-    def get_differences(self, model_failures: Array) -> Array:
+    def get_differences(self, model_failures: pd.DataFrame) -> Array:
+        """Find the failures for which each family is unanimous but the two families disagree."""
         children_i_cols = self.get_children_columns(model_failures, self.family_i)
         children_j_cols = self.get_children_columns(model_failures, self.family_j)
-
-        def check_choice_difference(model_failure: Array) -> bool:
-            family_i_choices = np.unique(model_failure[children_i_cols])
-            family_j_choices = np.unique(model_failure[children_j_cols])
-            return self._is_different(family_i_choices, family_j_choices)
-
-        return np.apply_along_axis(check_choice_difference, axis=1, arr=model_failures)
+        choices = model_failures.to_numpy()
+        family_i_choices = choices[:, children_i_cols]
+        family_j_choices = choices[:, children_j_cols]
+        differences = self.is_unanimous(family_i_choices) & self.is_unanimous(
+            family_j_choices
+        )
+        if children_i_cols and children_j_cols:
+            differences &= family_i_choices[:, 0] != family_j_choices[:, 0]
+        return differences
 
     def get_failure_differences(self) -> pd.DataFrame:
         model_failures = self.get_family_failures("models")
@@ -160,9 +153,7 @@ class Partition:
             random.choices(self.get_model_subset(self.family_i)).pop(),
             random.choices(self.get_model_subset(self.family_j)).pop(),
         ]
-        difference_triplets = model_failures.index[
-            np.where(failure_differences == True)[0]
-        ].to_numpy()
+        difference_triplets = model_failures.index[failure_differences].to_numpy()
         failure_differences = model_failures.loc[difference_triplets, family_types]
         failure_differences = failure_differences.rename(
             columns={
@@ -179,21 +170,23 @@ class Partition:
         """
         children_family_i_hits = self.family_i_hits
         children_family_j_failures = self.family_j_failures
-        intersection = np.array(
-            list(
-                set(children_family_i_hits).intersection(
-                    set(children_family_j_failures.index.values)
-                )
-            )
-        )
+        intersection = children_family_j_failures.index.isin(children_family_i_hits)
         hit_failure_intersection = children_family_j_failures[intersection].to_frame(
             self.families.mapping[self.family_j]
         )
-        hit_failure_intersection[self.families.mapping[self.family_i]] = np.full_like(
-            intersection, self.target, dtype=int
+        hit_failure_intersection[self.families.mapping[self.family_i]] = np.full(
+            hit_failure_intersection.shape[0], self.target, dtype=int
         )
         return hit_failure_intersection
 
+    @cached_property
+    def familywise_failure_differences(self) -> pd.DataFrame:
+        return self.get_failure_differences()
+
+    @cached_property
+    def familywise_hit_failure_intersection(self) -> pd.DataFrame:
+        return self.get_hit_failure_intersection()
+
     def dimwise_hit_failure_intersection(self, dimension: int) -> pd.DataFrame:
         return self.familywise_hit_failure_intersection.filter(
             items=np.where(self.triplet_dimensions == dimension)[0], axis=0
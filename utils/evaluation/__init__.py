@@ -1 +1,50 @@
-from .helpers import *
+import importlib
+
+# attributes are imported from their submodules on first access (PEP 562), such that
+# thingsvision and torchvision are only loaded by scripts that extract features
+_EXPORTS = {
+    "DEFAULT_BATCH_SIZE": "autotune",
+    "get_backend_name": "autotune",
+    "get_batch_size": "autotune",
+    "get_default_budget": "autotune",
+    "ExtractionClient": "client",
+    "connect": "client",
+    "get_authkey": "client",
+    "get_default_socket": "client",
+    "PrefetchLoader": "extraction",
+    "extract_features": "extraction",
+    "get_batches": "extraction",
+    "get_transformations": "extraction",
+    "load_extractor": "extraction",
+    "BACKENDS": "inference",
+    "InferenceBackend": "inference",
+    "check_parity": "inference",
+    "load_backend": "inference",
+    "QUANTIZATION_MODES": "quantization",
+    "load_quantized_backend": "quantization",
+    "sample_triplets": "quantization",
+    "triplet_drift": "quantization",
+    "ARRAY_DTYPES": "results",
+    "has_results": "results",
+    "load_results": "results",
+    "save_results": "results",
+    "RSA": "rsa",
+}
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name: str):
+    if name.startswith("__"):
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    # all other public names are exported from .helpers
+    module = importlib.import_module(f".{_EXPORTS.get(name, 'helpers')}", __name__)
+    try:
+        value = getattr(module, name)
+    except AttributeError:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}") from None
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
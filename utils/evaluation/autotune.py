@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import resource
+import sys
+import threading
+import time
+import warnings
+from typing import Any, Dict, Optional
+
+import torch
+
+from .inference import InferenceBackend
+
+Tensor = torch.Tensor
+
+CACHE_PATH = os.path.join(
+    os.path.expanduser("~"), ".cache", "human_alignment", "batch_sizes.json"
+)
+DEFAULT_BATCH_SIZE = 64
+MAX_BATCH_SIZE = 1024
+
+
+def get_rss() -> int:
+    """Current resident set size of this process in bytes."""
+    try:
+        with open("/proc/self/statm") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # peak rather than current RSS; reported in bytes on macOS and in kilobytes elsewhere
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+def get_default_budget(device: str) -> float:
+    """80% of the physical memory of a device in GB."""
+    if str(device).startswith("cuda") and torch.cuda.is_available():
+        total = torch.cuda.get_device_properties(torch.device(device)).total_memory
+    else:
+        total = os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    return round(0.8 * total / 2**30, 1)
+
+
+class MemoryMonitor:
+    """Peak memory during a block; device memory on CUDA and the RSS (polled) on CPU."""
+
+    def __init__(self, device: str, interval: float = 0.005):
+        self.cuda = str(device).startswith("cuda") and torch.cuda.is_available()
+        self.device = device
+        self.interval = interval
+        self.peak = 0
+
+    def poll(self) -> None:
+        while not self.done.is_set():
+            self.peak = max(self.peak, get_rss())
+            time.sleep(self.interval)
+
+    def __enter__(self) -> "MemoryMonitor":
+        if self.cuda:
+            torch.cuda.synchronize(self.device)
+            torch.cuda.reset_peak_memory_stats(self.device)
+        else:
+            self.peak = get_rss()
+            self.done = threading.Event()
+            self.thread = threading.Thread(target=self.poll, daemon=True)
+            self.thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        if self.cuda:
+            torch.cuda.synchronize(self.device)
+            self.peak = torch.cuda.max_memory_allocated(self.device)
+        else:
+            self.done.set()
+            self.thread.join()
+            self.peak = max(self.peak, get_rss())
+
+
+def is_oom(error: BaseException) -> bool:
+    return isinstance(error, MemoryError) or "out of memory" in str(error).lower()
+
+
+def probe_batch_size(
+    extractor: Any,
+    dataset: Any,
+    module_name: str,
+    memory_budget: float,
+    backend: Optional[InferenceBackend] = None,
+    max_batch_size: int = MAX_BATCH_SIZE,
+    n_images: int = 16,
+    n_repeats: int = 3,
+    patience: int = 2,
+) -> Dict[str, float]:
+    """Find the batch size with the highest throughput whose peak memory stays below a budget (in GB).
+
+    Batch sizes are doubled until the (extrapolated) peak memory of the next batch size would
+    exceed the budget, the forward pass runs out of memory, or throughput has not improved
+    by more than 5% for <patience> doublings. Each batch size is timed as the fastest of
+    <n_repeats> forward passes. Batches repeat the first <n_images> images of the dataset.
+    """
+    budget = memory_budget * 2**30
+    device = extractor.device
+    images = [dataset[i] for i in range(min(len(dataset), n_images))]
+
+    def forward(batch: Tensor) -> None:
+        if backend is not None:
+            backend(batch)
+        else:
+            extractor.extract_features(
+                batches=[batch], module_name=module_name, flatten_acts=True
+            )
+        if str(device).startswith("cuda") and torch.cuda.is_available():
+            torch.cuda.synchronize(device)
+
+    def make_batch(batch_size: int) -> Tensor:
+        return torch.stack([images[i % len(images)] for i in range(batch_size)])
+
+    # the first forward pass includes lazy initialization (e.g., tracing or cuDNN autotuning)
+    forward(make_batch(1))
+    best = {"batch_size": 1, "images_per_second": 0.0, "peak_memory": float("nan")}
+    previous_peak = None
+    batch_size = 1
+    stalled = 0
+    while batch_size <= max_batch_size:
+        batch = make_batch(batch_size)
+        try:
+            with MemoryMonitor(device) as monitor:
+                elapsed = float("inf")
+                for _ in range(n_repeats):
+                    start = time.perf_counter()
+                    forward(batch)
+                    elapsed = min(elapsed, time.perf_counter() - start)
+        except (RuntimeError, MemoryError) as error:
+            if not is_oom(error):
+                raise
+            del batch
+            if str(device).startswith("cuda") and torch.cuda.is_available():
+                torch.cuda.empty_cache()
+            break
+        del batch
+        if monitor.peak > budget:
+            if batch_size == 1:
+                warnings.warn(
+                    message=f"\nA single image exceeds the memory budget of {memory_budget:.1f}GB (peak memory: {monitor.peak / 2**30:.1f}GB).\n",
+                    category=UserWarning,
+                )
+            break
+        images_per_second = batch_size / elapsed
+        if images_per_second > 1.05 * best["images_per_second"]:
+            best = {
+                "batch_size": batch_size,
+                "images_per_second": images_per_second,
+                "peak_memory": monitor.peak / 2**30,
+            }
+            stalled = 0
+        else:
+            stalled += 1
+            if stalled == patience:
+                # larger batches cost memory without improving throughput
+                break
+        if previous_peak is not None:
+            # memory grows (roughly) linearly in the batch size
+            next_peak = monitor.peak + 2 * (monitor.peak - previous_peak)
+            if next_peak > budget:
+                break
+        previous_peak = monitor.peak
+        batch_size *= 2
+    return best
+
+
+def load_cache(cache_path: str = CACHE_PATH) -> Dict[str, Dict[str, float]]:
+    if not os.path.isfile(cache_path):
+        return {}
+    try:
+        with open(cache_path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_cache(key: str, entry: Dict[str, float], cache_path: str = CACHE_PATH) -> None:
+    """Add an entry to the cache; the file is replaced atomically since parallel processes may share it."""
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    cache = load_cache(cache_path)
+    cache[key] = entry
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(cache, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, cache_path)
+
+
+def get_backend_name(backend: Optional[InferenceBackend]) -> str:
+    """Name of the extraction path, which differs in speed and memory between backends."""
+    if backend is None:
+        # forward hooks of the thingsvision extractor
+        return "extractor"
+    if backend.quantization is not None:
+        return f"{backend.backend}-int8-{backend.quantization}"
+    return backend.backend
+
+
+def get_batch_size(
+    extractor: Any,
+    dataset: Any,
+    model_name: str,
+    module_name: str,
+    batch_size: Optional[int] = None,
+    memory_budget: Optional[float] = None,
+    backend: Optional[InferenceBackend] = None,
+    cache_path: str = CACHE_PATH,
+    verbose: bool = False,
+) -> int:
+    """Get the extraction batch size for a model.
+
+    A user-defined <batch_size> takes precedence. Otherwise, the batch size is looked up
+    in a local cache per (model, module, input size, device, backend) and memory budget, or determined by
+    probing the model if it has not been cached yet.
+    """
+    if batch_size is not None:
+        return batch_size
+    if extractor.get_backend() != "pt":
+        warnings.warn(
+            message=f"\nBatch sizes can only be tuned for PyTorch models.\nUsing a batch size of {DEFAULT_BATCH_SIZE} for {model_name}...\n",
+            category=UserWarning,
+        )
+        return DEFAULT_BATCH_SIZE
+    device = str(extractor.device)
+    if memory_budget is None:
+        memory_budget = get_default_budget(device)
+    input_dim = "x".join(map(str, dataset[0].shape))
+    key = f"{model_name}|{module_name}|{input_dim}|{device}|{get_backend_name(backend)}"
+    cached = load_cache(cache_path).get(key)
+    if cached is not None and cached["memory_budget"] == memory_budget:
+        return cached["batch_size"]
+    entry = probe_batch_size(
+        extractor=extractor,
+        dataset=dataset,
+        module_name=module_name,
+        memory_budget=memory_budget,
+        backend=backend,
+    )
+    entry["memory_budget"] = memory_budget
+    save_cache(key, entry, cache_path)
+    if verbose:
+        print(
+            f"\nModel: {model_name}, Batch size: {entry['batch_size']} ({entry['images_per_second']:.1f} images/s, peak memory: {entry['peak_memory']:.1f}GB of {memory_budget:.1f}GB)\n"
+        )
+    return entry["batch_size"]
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import secrets
+import stat
+import tempfile
+import warnings
+from multiprocessing.connection import Client
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+Array = np.ndarray
+
+AUTHKEY_FILE = "authkey"
+SOCKET_FILE = "extraction.sock"
+
+
+def get_runtime_dir() -> str:
+    """Per-user directory (mode 0700) for the socket and the authentication key of the extraction server."""
+    path = os.path.join(tempfile.gettempdir(), f"human_alignment_{os.getuid()}")
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    info = os.stat(path)
+    if info.st_uid != os.getuid() or stat.S_IMODE(info.st_mode) & 0o077:
+        raise PermissionError(
+            f"\nRuntime directory <{path}> must be owned by the current user and have mode 0700.\n"
+        )
+    return path
+
+
+def get_default_socket() -> str:
+    return os.path.join(get_runtime_dir(), SOCKET_FILE)
+
+
+def get_authkey() -> bytes:
+    """Random per-user key, which authenticates clients of the extraction server, kept in a 0600 file."""
+    path = os.path.join(get_runtime_dir(), AUTHKEY_FILE)
+    if not os.path.isfile(path):
+        # the key is written to a temporary file (mode 0600) and linked atomically, such that
+        # concurrent processes never read a partially written key
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(secrets.token_bytes(32))
+            os.link(tmp_path, path)
+        except FileExistsError:
+            # another process has written the key concurrently
+            pass
+        finally:
+            os.remove(tmp_path)
+    with open(path, "rb") as f:
+        return f.read()
+
+
+class ExtractionClient:
+    """Client of a local extraction server (see extraction_server.py).
+
+    The server keeps extractors warm across processes and writes features into memory-mapped
+    .npy files (in /dev/shm if available), which the client maps copy-on-write instead of
+    receiving them through the socket.
+    """
+
+    def __init__(self, address: str, authkey: Optional[bytes] = None):
+        self.address = address
+        self.authkey = authkey or get_authkey()
+
+    def request(self, command: str, **kwargs) -> Dict[str, Any]:
+        with Client(self.address, family="AF_UNIX", authkey=self.authkey) as conn:
+            conn.send({"command": command, **kwargs})
+            response = conn.recv()
+        if "error" in response:
+            raise RuntimeError(f"\nExtraction server failed:\n{response['error']}\n")
+        return response
+
+    def ping(self) -> bool:
+        try:
+            return self.request("ping")["status"] == "ok"
+        except (OSError, EOFError, RuntimeError):
+            return False
+
+    def extract_features(
+        self,
+        model_name: str,
+        source: str,
+        module: str,
+        module_name: str,
+        dataset: str,
+        data_root: str,
+        category: Optional[str] = None,
+        stimulus_set: Optional[str] = None,
+        batch_size: Optional[int] = None,
+        memory_budget: Optional[float] = None,
+        pretrained: bool = True,
+        extract_cls_token: bool = False,
+        backend: str = "eager",
+        stats: Optional[Dict[str, float]] = None,
+    ) -> Array:
+        """Request the features of a dataset for the module of a model.
+
+        Extraction statistics of the server are written into <stats> if provided.
+        """
+        response = self.request(
+            "extract",
+            model_name=model_name,
+            source=source,
+            module=module,
+            module_name=module_name,
+            dataset=dataset,
+            data_root=os.path.abspath(data_root),
+            category=category,
+            stimulus_set=stimulus_set,
+            batch_size=batch_size,
+            memory_budget=memory_budget,
+            pretrained=pretrained,
+            extract_cls_token=extract_cls_token,
+            backend=backend,
+        )
+        if stats is not None:
+            stats.update(response["stats"])
+        return np.load(response["path"], mmap_mode="c")
+
+    def shutdown(self) -> None:
+        self.request("shutdown")
+
+
+def connect(address: Optional[str] = None) -> Optional[ExtractionClient]:
+    """Connect to a running extraction server; returns None (i.e., local extraction) if there is none.
+
+    Without an address, the default socket of extraction_server.py is tried, and scripts fall
+    back to local extraction silently if no server is listening there.
+    """
+    if address is None:
+        try:
+            address = get_default_socket()
+        except PermissionError:
+            return None
+        if not os.path.exists(address):
+            return None
+        client = ExtractionClient(address)
+        return client if client.ping() else None
+    client = ExtractionClient(address)
+    if not os.path.exists(address) or not client.ping():
+        warnings.warn(
+            message=f"\nNo extraction server is listening on {address}.\nFalling back to local extraction...\n",
+            category=UserWarning,
+        )
+        return None
+    return client
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import time
+from typing import Any, Dict, Iterator, Optional
+
+import numpy as np
+import torch
+from thingsvision import get_extractor
+from thingsvision.utils.data import DataLoader
+from torch.utils.data import Subset
+from torchvision.transforms import Compose, Lambda
+
+from .inference import InferenceBackend
+
+Array = np.ndarray
+Tensor = torch.Tensor
+
+
+class PrefetchLoader:
+    """Batches of images that are decoded and transformed by background workers.
+
+    While the model performs a forward pass for the current batch, up to <prefetch> batches
+    per worker are prepared in the background. For CUDA devices, batches are copied into a
+    small ring of reusable pinned buffers, which makes host-to-device copies faster without
+    allocating page-locked memory for every batch. The time the consumer spends waiting for
+    input is accumulated in <wait_time>; if it is a large fraction of the extraction time,
+    extraction is decode-bound and more workers should be used.
+    """
+
+    def __init__(
+        self,
+        dataset: Any,
+        batch_size: int,
+        num_workers: int = 0,
+        prefetch: int = 2,
+        device: str = "cpu",
+        num_buffers: int = 2,
+    ):
+        loader_kwargs = {}
+        if num_workers > 0:
+            loader_kwargs.update(prefetch_factor=prefetch, persistent_workers=True)
+        self.loader = torch.utils.data.DataLoader(
+            dataset,
+            batch_size=batch_size,
+            shuffle=False,
+            num_workers=num_workers,
+            **loader_kwargs,
+        )
+        self.batch_size = batch_size
+        self.pin_memory = str(device).startswith("cuda") and torch.cuda.is_available()
+        self.num_buffers = num_buffers
+        self.buffers = []
+        self.wait_time = 0.0
+
+    def __len__(self) -> int:
+        return len(self.loader)
+
+    def pin(self, batch: Tensor, step: int) -> Tensor:
+        """Copy a batch into a reusable pinned buffer."""
+        if len(self.buffers) < self.num_buffers:
+            self.buffers.append(
+                torch.empty(batch.shape, dtype=batch.dtype).pin_memory()
+            )
+        buffer = self.buffers[step % self.num_buffers]
+        if buffer.shape[1:] != batch.shape[1:] or buffer.shape[0] < batch.shape[0]:
+            buffer = torch.empty(batch.shape, dtype=batch.dtype).pin_memory()
+            self.buffers[step % self.num_buffers] = buffer
+        # the last batch may be smaller than the buffer
+        pinned = buffer[: batch.shape[0]]
+        pinned.copy_(batch)
+        return pinned
+
+    def __iter__(self) -> Iterator[Tensor]:
+        batches = iter(self.loader)
+        step = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                batch = next(batches)
+            except StopIteration:
+                break
+            if self.pin_memory:
+                batch = self.pin(batch, step)
+            self.wait_time += time.perf_counter() - start
+            step += 1
+            yield batch
+
+
+def get_batches(
+    extractor: Any,
+    dataset: Any,
+    batch_size: int,
+    num_workers: int = 0,
+    prefetch: int = 2,
+):
+    """Get an iterable over batches of a dataset for the backend of an extractor."""
+    if extractor.get_backend() != "pt":
+        return DataLoader(
+            dataset=dataset,
+            batch_size=batch_size,
+            backend=extractor.get_backend(),
+        )
+    return PrefetchLoader(
+        dataset=dataset,
+        batch_size=batch_size,
+        num_workers=num_workers,
+        prefetch=prefetch,
+        device=extractor.device,
+    )
+
+
+def load_extractor(
+    model_name: str,
+    source: str,
+    device: str,
+    pretrained: bool = True,
+    extract_cls_token: bool = False,
+):
+    """Load a thingsvision extractor and parse model parameters from the model name."""
+    if model_name.startswith("OpenCLIP"):
+        if "laion" in model_name:
+            meta_vars = model_name.split("_")
+            name = meta_vars[0]
+            variant = meta_vars[1]
+            data = "_".join(meta_vars[2:])
+        else:
+            name, variant, data = model_name.split("_")
+        model_params = dict(variant=variant, dataset=data)
+    elif model_name.startswith("clip"):
+        name, variant = model_name.split("_")
+        model_params = dict(variant=variant)
+    elif model_name.startswith("DreamSim"):
+        model_name = model_name.split("_")
+        name = model_name[0]
+        variant = "_".join(model_name[1:])
+        model_params = dict(variant=variant)
+    elif extract_cls_token:
+        name = model_name
+        model_params = dict(extract_cls_token=True)
+    else:
+        name = model_name
+        model_params = None
+
+    extractor = get_extractor(
+        model_name=name,
+        source=source,
+        device=device,
+        pretrained=pretrained,
+        model_parameters=model_params,
+    )
+    return extractor
+
+
+def get_transformations(extractor: Any, model_name: str, dataset: str) -> Any:
+    """Get the image transformations of an extractor for a specific dataset."""
+    if model_name.endswith("ecoset"):
+        transformations = extractor.get_transformations(resize_dim=128, crop_dim=128)
+    else:
+        transformations = extractor.get_transformations()
+    if dataset == "peterson":
+        transformations = Compose(
+            [Lambda(lambda img: img.convert("RGB")), transformations]
+        )
+    return transformations
+
+
+def extract_features(
+    extractor: Any,
+    dataset: Any,
+    model_name: str,
+    source: str,
+    module: str,
+    module_name: str,
+    batch_size: int,
+    num_workers: int = 0,
+    prefetch: int = 2,
+    stats: Optional[Dict[str, float]] = None,
+    backend: Optional[InferenceBackend] = None,
+) -> Array:
+    """Extract the features of a dataset for the module of a (warm) extractor.
+
+    If <stats> is provided, the extraction time and the time the forward pass waited on
+    input are written into it. If an inference <backend> is provided, it replaces the
+    (eager) forward pass of the extractor.
+    """
+
+    def run(batches, flatten_acts: bool) -> Array:
+        if backend is not None:
+            return backend.extract_features(batches=batches, flatten_acts=flatten_acts)
+        return extractor.extract_features(
+            batches=batches, module_name=module_name, flatten_acts=flatten_acts
+        )
+
+    start = time.perf_counter()
+    if (
+        source == "torchvision"
+        and module == "penultimate"
+        and model_name.startswith("vit")
+    ):
+        num_slices = max(len(dataset) // 2000, 1)
+        subsets = [
+            Subset(dataset, indices=indices)
+            for indices in np.array_split(range(len(dataset)), num_slices)
+        ]
+        features_list = []
+        batches_list = []
+        for subset in subsets:
+            subset_batches = get_batches(
+                extractor, subset, batch_size, num_workers, prefetch
+            )
+            features = run(subset_batches, flatten_acts=False)
+            features = features[:, 0].copy()  # select classifier token
+            features_list.append(features)
+            batches_list.append(subset_batches)
+        features = np.concatenate(features_list, axis=0)
+        features = features.reshape((features.shape[0], -1))
+    else:
+        batches = get_batches(extractor, dataset, batch_size, num_workers, prefetch)
+        features = run(batches, flatten_acts=True)
+        batches_list = [batches]
+    if stats is not None:
+        stats["extraction_time"] = time.perf_counter() - start
+        stats["input_wait_time"] = sum(
+            getattr(batches, "wait_time", float("nan")) for batches in batches_list
+        )
+    return features
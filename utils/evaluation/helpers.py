@@ -10,12 +10,12 @@ from typing import Any, Dict, List, Tuple, Union
 
 import numpy as np
 import pandas as pd
-import scipy
 import torch
 import torch.nn.functional as F
 from functorch import vmap
-from thingsvision.core.rsa import compute_rdm, correlate_rdms
-from thingsvision.core.rsa.helpers import correlation_matrix, cosine_matrix
+
+from ..analyses.correctness import CorrectnessIndex
+from .rsa import RSA
 
 Array = np.ndarray
 Tensor = torch.Tensor
@@ -111,6 +111,8 @@ def get_predictions(
 ) -> Tuple[Tensor, Tensor]:
     """Get the odd-one-out choices for a given model."""
     features = torch.from_numpy(features)
+    # compact (e.g., uint16) object indices are cast to int64 before indexing torch tensors
+    triplets = np.asarray(triplets, dtype=np.int64)
     indices = {0, 1, 2}
     pairs = list(itertools.combinations(indices, r=2))
     choices = torch.zeros(triplets.shape[0])
@@ -156,12 +158,44 @@ def get_model_choices(results: pd.DataFrame) -> Array:
     return model_choices
 
 
+def stack_model_choices(results: pd.DataFrame) -> Array:
+    """Stack the odd-one-out choices of every row in the results into a compact (N x M) int8 matrix."""
+    n_triplets = results.choices.values[0].shape[0]
+    model_choices = np.empty((n_triplets, results.shape[0]), dtype=np.int8)
+    for j, choices in enumerate(results.choices.values):
+        assert (
+            choices.shape[0] == n_triplets
+        ), "\nNumber of triplets needs to be equivalent to compare model choices.\n"
+        model_choices[:, j] = choices
+    return model_choices
+
+
+def compute_agreements(
+    model_choices: Array, labels: Tuple[int] = (-1, 0, 1, 2), chunk_size: int = 2**16
+) -> Array:
+    """Compute the fraction of triplets for which any two models made the same choice.
+
+    Agreements are accumulated as one-hot matrix products over chunks of triplets,
+    which yields the full (M x M) agreement matrix in a single pass over the choices.
+    """
+    n_triplets, n_models = model_choices.shape
+    agreements = np.zeros((n_models, n_models), dtype=np.float64)
+    for start in range(0, n_triplets, chunk_size):
+        chunk = model_choices[start : start + chunk_size]
+        for label in labels:
+            # float32 sums are exact for chunks with fewer than 2^24 triplets
+            one_hots = (chunk == label).astype(np.float32)
+            agreements += one_hots.T @ one_hots
+    return agreements / n_triplets
+
+
 def filter_failures(model_choices: Array, target: int = 2):
     """Filter for triplets where every model predicted differently than humans."""
-    failures, choices = zip(
-        *list(filter(lambda kv: target not in kv[1], enumerate(model_choices)))
+    correctness = CorrectnessIndex.from_choices(
+        model_choices, models=np.arange(model_choices.shape[1]), target=target
     )
-    return failures, np.asarray(choices)
+    failures = correctness.indices(correctness.failures())
+    return failures, model_choices[failures]
 
 
 def get_failures(results: pd.DataFrame) -> pd.DataFrame:
@@ -212,49 +246,5 @@ def load_transforms(
 
 
 def perform_rsa(dataset: Any, data_source: str, features: Array) -> Dict[str, float]:
-    if data_source == "free-arrangement":
-        cosine_rdm_dnn = compute_rdm(features, method="cosine")
-        corr_rdm_dnn = compute_rdm(features, method="correlation")
-        triu_inds = np.triu_indices(corr_rdm_dnn.shape[0], k=1)
-        pairwise_dists_cosine = cosine_rdm_dnn[triu_inds]
-        pairwise_dists_corr = corr_rdm_dnn[triu_inds]
-        pairwise_dists_human = dataset.pairwise_dists
-        spearman_rho_cosine = scipy.stats.spearmanr(
-            pairwise_dists_cosine, pairwise_dists_human
-        )[0]
-        pearson_corr_coef_cosine = scipy.stats.pearsonr(
-            pairwise_dists_cosine, pairwise_dists_human
-        )[0]
-        spearman_rho_corr = scipy.stats.spearmanr(
-            pairwise_dists_corr, pairwise_dists_human
-        )[0]
-        pearson_corr_coef_corr = scipy.stats.pearsonr(
-            pairwise_dists_corr, pairwise_dists_human
-        )[0]
-    else:
-        if data_source == "peterson":
-            cosine_rdm_dnn = cosine_matrix(features)
-            corr_rdm_dnn = correlation_matrix(features)
-            rdm_humans = dataset.get_rsm()
-        else:
-            cosine_rdm_dnn = compute_rdm(features, method="cosine")
-            corr_rdm_dnn = compute_rdm(features, method="correlation")
-            rdm_humans = dataset.get_rdm()
-        spearman_rho_cosine = correlate_rdms(
-            cosine_rdm_dnn, rdm_humans, correlation="spearman"
-        )
-        pearson_corr_coef_cosine = correlate_rdms(
-            cosine_rdm_dnn, rdm_humans, correlation="pearson"
-        )
-        spearman_rho_corr = correlate_rdms(
-            corr_rdm_dnn, rdm_humans, correlation="spearman"
-        )
-        pearson_corr_coef_corr = correlate_rdms(
-            corr_rdm_dnn, rdm_humans, correlation="pearson"
-        )
-    rsa_stats = {}
-    rsa_stats["spearman_rho_cosine_kernel"] = spearman_rho_cosine
-    rsa_stats["spearman_rho_corr_kernel"] = spearman_rho_corr
-    rsa_stats["pearson_corr_coef_cosine_kernel"] = pearson_corr_coef_cosine
-    rsa_stats["pearson_corr_coef_corr_kernel"] = pearson_corr_coef_corr
-    return rsa_stats
+    """Perform RSA for the features of a single model (see <RSA> for evaluating many models)."""
+    return RSA(dataset=dataset, data_source=data_source).compare([features])[0]
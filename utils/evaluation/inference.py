@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import copy
+import io
+import warnings
+from typing import Iterable, Optional, Tuple
+
+import numpy as np
+import torch
+import torch.nn as nn
+from torchvision.models.feature_extraction import create_feature_extractor
+
+Array = np.ndarray
+Tensor = torch.Tensor
+
+BACKENDS = ["eager", "channels_last", "torchscript", "compile", "onnx"]
+
+
+class InferenceBackend:
+    """Optimized CPU inference for the output of a single module of a model.
+
+    The model is traced into an FX graph that ends at <module_name> (such that no forward hooks
+    are necessary) and executed in inference mode. Every backend other than eager uses the
+    channels_last memory format; "torchscript" additionally freezes the traced graph, which
+    fuses operators such as convolutions and batch norms, "compile" uses torch.compile
+    (if available), and "onnx" runs the exported graph in ONNX Runtime. Graphs are traced,
+    compiled or exported lazily for the first batch.
+    """
+
+    def __init__(
+        self,
+        model: nn.Module,
+        module_name: str,
+        backend: str = "eager",
+        device: str = "cpu",
+    ):
+        assert backend in BACKENDS, f"\nBackend must be one of {BACKENDS}.\n"
+        self.backend = backend
+        self.device = device
+        self.module_name = module_name
+        self.graph = create_feature_extractor(
+            model.eval(), return_nodes={module_name: "features"}
+        )
+        self.channels_last = backend != "eager"
+        if self.channels_last:
+            # the traced graph shares its parameters with the model of the extractor, which
+            # must remain unchanged for eager extraction (e.g., parity checks)
+            self.graph = copy.deepcopy(self.graph).to(memory_format=torch.channels_last)
+        # post-training quantization mode (see quantization.py), if any
+        self.quantization = None
+        self.runner = None
+        self.session = None
+
+    def to_input(self, batch: Tensor) -> Tensor:
+        batch = batch.to(self.device)
+        if self.channels_last and batch.dim() == 4:
+            batch = batch.contiguous(memory_format=torch.channels_last)
+        return batch
+
+    def prepare(self, example: Tensor) -> None:
+        """Trace, compile or export the graph for an example batch."""
+        backend = self.backend
+        if backend == "compile" and not hasattr(torch, "compile"):
+            warnings.warn(
+                message=f"\ntorch.compile is not available in PyTorch {torch.__version__}.\nFalling back to the TorchScript backend...\n",
+                category=UserWarning,
+            )
+            backend = "torchscript"
+        if backend == "torchscript":
+            with torch.no_grad():
+                traced = torch.jit.trace(self.graph, example, strict=False)
+                self.runner = torch.jit.optimize_for_inference(
+                    torch.jit.freeze(traced.eval())
+                )
+        elif backend == "compile":
+            self.runner = torch.compile(self.graph)
+        elif backend == "onnx":
+            try:
+                import onnxruntime
+            except ImportError:
+                raise ImportError(
+                    "\nThe ONNX backend requires onnxruntime. Install it via pip install onnxruntime.\n"
+                )
+            graph = io.BytesIO()
+            torch.onnx.export(
+                self.graph,
+                example,
+                graph,
+                input_names=["images"],
+                output_names=["features"],
+                dynamic_axes={"images": {0: "batch"}, "features": {0: "batch"}},
+                opset_version=14,
+            )
+            self.session = onnxruntime.InferenceSession(
+                graph.getvalue(), providers=["CPUExecutionProvider"]
+            )
+        else:
+            self.runner = self.graph
+
+    def __call__(self, batch: Tensor) -> Tensor:
+        batch = self.to_input(batch)
+        if self.runner is None and self.session is None:
+            self.prepare(batch)
+        if self.session is not None:
+            (features,) = self.session.run(None, {"images": batch.cpu().numpy()})
+            return torch.from_numpy(features)
+        with torch.inference_mode():
+            return self.runner(batch)["features"]
+
+    def extract_features(
+        self, batches: Iterable[Tensor], flatten_acts: bool = True
+    ) -> Array:
+        features = []
+        for batch in batches:
+            batch_features = self(batch).float().cpu()
+            if flatten_acts:
+                batch_features = batch_features.flatten(start_dim=1)
+            features.append(batch_features.numpy())
+        return np.concatenate(features, axis=0)
+
+
+def load_backend(
+    extractor, module_name: str, backend: str
+) -> Optional[InferenceBackend]:
+    """Build an inference backend for the (PyTorch) model of a thingsvision extractor.
+
+    Models that cannot be traced symbolically fall back to eager extraction (i.e., None).
+    """
+    try:
+        return InferenceBackend(
+            model=extractor.model,
+            module_name=module_name,
+            backend=backend,
+            device=extractor.device,
+        )
+    except Exception as error:
+        warnings.warn(
+            message=f"\nCould not build the {backend} backend for {module_name}: {error}\nFalling back to eager extraction...\n",
+            category=UserWarning,
+        )
+        return None
+
+
+def check_parity(
+    reference: Array, features: Array, rtol: float = 1e-3, atol: float = 1e-4
+) -> Tuple[bool, float]:
+    """Compare features of an optimized backend against features of eager mode."""
+    if reference.shape != features.shape:
+        return False, float("inf")
+    max_abs_diff = float(np.abs(reference - features).max())
+    return np.allclose(reference, features, rtol=rtol, atol=atol), max_abs_diff
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import warnings
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+import numpy as np
+import torch
+import torch.nn as nn
+from torch.utils.data import Subset
+
+from .autotune import DEFAULT_BATCH_SIZE
+from .extraction import get_batches
+from .helpers import accuracy, get_predictions
+from .inference import InferenceBackend, load_backend
+
+Array = np.ndarray
+Tensor = torch.Tensor
+
+QUANTIZATION_MODES = ["dynamic", "static"]
+
+
+def quantize_backend(
+    backend: InferenceBackend,
+    mode: str = "dynamic",
+    calibration_batches: Optional[Iterable[Tensor]] = None,
+) -> InferenceBackend:
+    """Apply post-training INT8 quantization to the graph of an inference backend.
+
+    Dynamic quantization converts the weights of linear layers to INT8 and quantizes
+    activations on the fly. Static quantization additionally quantizes convolutions (and
+    fuses them with batch norms and ReLUs), for which activation ranges are calibrated on
+    <calibration_batches>.
+    """
+    assert mode in QUANTIZATION_MODES, f"\nMode must be one of {QUANTIZATION_MODES}.\n"
+    assert (
+        str(backend.device) == "cpu"
+    ), "\nQuantized models can only be executed on CPU.\n"
+    if mode == "static":
+        assert (
+            calibration_batches is not None
+        ), "\nStatic quantization requires calibration data.\n"
+        from torch.ao.quantization import get_default_qconfig_mapping
+        from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+        calibration_batches = iter(calibration_batches)
+        example = next(calibration_batches)
+        prepared = prepare_fx(
+            backend.graph,
+            get_default_qconfig_mapping("fbgemm"),
+            example_inputs=(example,),
+        )
+        # observe activation ranges on the calibration images
+        with torch.inference_mode():
+            prepared(example)
+            for batch in calibration_batches:
+                prepared(batch)
+        backend.graph = convert_fx(prepared)
+    else:
+        backend.graph = torch.ao.quantization.quantize_dynamic(
+            backend.graph, {nn.Linear}, dtype=torch.qint8
+        )
+    backend.quantization = mode
+    return backend
+
+
+def get_calibration_batches(
+    extractor,
+    dataset: Any,
+    n_images: int = 256,
+    batch_size: Optional[int] = None,
+    rnd_seed: int = 42,
+) -> Iterable[Tensor]:
+    """Sample images of a dataset (e.g., THINGS) to calibrate activation ranges for static quantization."""
+    rng = np.random.default_rng(rnd_seed)
+    indices = rng.choice(len(dataset), size=min(n_images, len(dataset)), replace=False)
+    return get_batches(
+        extractor=extractor,
+        dataset=Subset(dataset, indices=np.sort(indices)),
+        batch_size=batch_size or DEFAULT_BATCH_SIZE,
+    )
+
+
+def load_quantized_backend(
+    extractor,
+    module_name: str,
+    mode: str = "dynamic",
+    calibration_dataset: Optional[Any] = None,
+    n_calibration_images: int = 256,
+    batch_size: Optional[int] = None,
+    rnd_seed: int = 42,
+) -> Optional[InferenceBackend]:
+    """Build an INT8 inference backend for the model of a thingsvision extractor.
+
+    Static quantization is calibrated on <n_calibration_images> images of <calibration_dataset>.
+    Returns None (i.e., float extraction) if the model cannot be traced or quantized.
+    """
+    backend = load_backend(extractor, module_name, backend="eager")
+    if backend is None:
+        return None
+    calibration_batches = None
+    if mode == "static":
+        calibration_batches = get_calibration_batches(
+            extractor,
+            calibration_dataset,
+            n_images=n_calibration_images,
+            batch_size=batch_size,
+            rnd_seed=rnd_seed,
+        )
+    try:
+        return quantize_backend(backend, mode, calibration_batches)
+    except Exception as error:
+        warnings.warn(
+            message=f"\nCould not quantize {module_name} ({mode}): {error}\nFalling back to float extraction...\n",
+            category=UserWarning,
+        )
+        return None
+
+
+def sample_triplets(
+    triplets: Array, n_triplets: int, rnd_seed: int = 42
+) -> Tuple[Array, Array]:
+    """Sample triplets and re-index them into the subset of images they contain."""
+    rng = np.random.default_rng(rnd_seed)
+    triplets = np.asarray(triplets)
+    if n_triplets < triplets.shape[0]:
+        triplets = triplets[
+            rng.choice(triplets.shape[0], size=n_triplets, replace=False)
+        ]
+    images, local_triplets = np.unique(triplets, return_inverse=True)
+    return images, local_triplets.reshape(triplets.shape)
+
+
+def triplet_drift(
+    float_features: Array,
+    quantized_features: Array,
+    triplets: Array,
+    temperature: float,
+    distance: str,
+) -> Dict[str, float]:
+    """Change of zero-shot odd-one-out accuracy caused by quantization."""
+    float_choices, _ = get_predictions(
+        float_features.astype(np.float32), triplets, temperature, distance
+    )
+    quantized_choices, _ = get_predictions(
+        quantized_features.astype(np.float32), triplets, temperature, distance
+    )
+    float_acc = accuracy(float_choices)
+    quantized_acc = accuracy(quantized_choices)
+    return {
+        "zero-shot_float": float_acc,
+        "zero-shot_int8": quantized_acc,
+        "zero-shot_drift": round(quantized_acc - float_acc, 4),
+        "choice_agreement": (float_choices == quantized_choices).float().mean().item(),
+    }
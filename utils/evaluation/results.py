@@ -0,0 +1,76 @@
+import os
+from typing import Sequence
+
+import numpy as np
+import pandas as pd
+
+Array = np.ndarray
+
+# per-triplet arrays are kept out of the summary table and stored with compact dtypes
+ARRAY_DTYPES = {"choices": np.int8, "entropies": np.float32, "probas": np.float32}
+ARRAY_DIR = "arrays"
+SUMMARY_FILE = "results.csv"
+# results of earlier runs were pickled DataFrames with arrays inside cells
+LEGACY_FILE = "results.pkl"
+
+
+def has_results(out_path: str) -> bool:
+    return os.path.isfile(os.path.join(out_path, SUMMARY_FILE)) or os.path.isfile(
+        os.path.join(out_path, LEGACY_FILE)
+    )
+
+
+def save_results(results: pd.DataFrame, out_path: str) -> pd.DataFrame:
+    """Save summary metrics to a CSV file and per-triplet arrays to separate .npy files.
+
+    The summary table references the array of every row by a path relative to <out_path>
+    (e.g., column "choices_path"). Returns the summary table.
+    """
+    array_columns = [column for column in ARRAY_DTYPES if column in results.columns]
+    summary = results.drop(columns=array_columns).reset_index(drop=True)
+    if array_columns:
+        os.makedirs(os.path.join(out_path, ARRAY_DIR), exist_ok=True)
+    for column in array_columns:
+        paths = []
+        for i, array in enumerate(results[column].values):
+            path = os.path.join(ARRAY_DIR, f"{column}_{i:03d}.npy")
+            np.save(
+                os.path.join(out_path, path),
+                np.asarray(array).astype(ARRAY_DTYPES[column]),
+            )
+            paths.append(path)
+        summary[f"{column}_path"] = paths
+    summary.to_csv(os.path.join(out_path, SUMMARY_FILE), index=False)
+    return summary
+
+
+def load_results(
+    out_path: str,
+    arrays: Sequence[str] = tuple(ARRAY_DTYPES),
+    mmap_mode: str = "r",
+) -> pd.DataFrame:
+    """Load the summary table and memory-map the requested per-triplet arrays into its cells.
+
+    Pass arrays=() to load summary metrics only. Falls back to the pickled results of earlier runs.
+    """
+    if not os.path.isfile(os.path.join(out_path, SUMMARY_FILE)):
+        results = pd.read_pickle(os.path.join(out_path, LEGACY_FILE))
+        return results.drop(
+            columns=[
+                column
+                for column in ARRAY_DTYPES
+                if column in results.columns and column not in arrays
+            ]
+        )
+    results = pd.read_csv(os.path.join(out_path, SUMMARY_FILE))
+    for column in arrays:
+        if f"{column}_path" in results.columns:
+            results[column] = pd.Series(
+                [
+                    np.load(os.path.join(out_path, path), mmap_mode=mmap_mode)
+                    for path in results[f"{column}_path"]
+                ],
+                index=results.index,
+                dtype=object,
+            )
+    return results
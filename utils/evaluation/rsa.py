@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from dataclasses import dataclass
+from typing import Any, Dict, List
+
+import numpy as np
+from scipy.stats import rankdata
+
+Array = np.ndarray
+
+KERNELS = ["cosine", "corr"]
+STATISTICS = {"spearman": "spearman_rho", "pearson": "pearson_corr_coef"}
+
+
+@dataclass
+class RSA:
+    """Batched representational similarity analysis against the human RDM of a dataset.
+
+    The upper triangle of the human RDM is extracted, ranked and centered once per dataset,
+    so that comparing a model only requires computing its RDM and a few dot products.
+    """
+
+    dataset: Any
+    data_source: str
+    batch_size: int = 16
+    n_permutations: int = 0
+    n_bootstraps: int = 0
+    alpha: float = 0.05
+    chunk_size: int = 16
+    rnd_seed: int = 42
+
+    def __post_init__(self):
+        if self.data_source == "free-arrangement":
+            # human dissimilarities are already stored as a flattened triangle
+            pairwise_dists_human = np.asarray(
+                self.dataset.pairwise_dists, dtype=np.float64
+            )
+        else:
+            if self.data_source == "peterson":
+                rdm_humans = self.dataset.get_rsm()
+            else:
+                rdm_humans = self.dataset.get_rdm()
+            triu_inds = np.triu_indices(rdm_humans.shape[0], k=1)
+            pairwise_dists_human = np.asarray(rdm_humans[triu_inds], dtype=np.float64)
+        # number of objects n for which n * (n - 1) / 2 pairwise dissimilarities exist
+        self.n_objects = int(
+            round((1 + np.sqrt(1 + 8 * pairwise_dists_human.shape[0])) / 2)
+        )
+        self.triu_inds = np.triu_indices(self.n_objects, k=1)
+        # Peterson et al. (2016) provide similarities rather than dissimilarities, hence
+        # model RSMs are compared against them and model RDMs against every other dataset
+        self.sign = 1.0 if self.data_source == "peterson" else -1.0
+        self.pairwise_dists_human = pairwise_dists_human
+        self.human_pearson = self.standardize(pairwise_dists_human)
+        self.human_spearman = self.standardize(rankdata(pairwise_dists_human))
+        self.rng = np.random.default_rng(self.rnd_seed)
+
+    def to_square(self, vectors: Array) -> Array:
+        """Convert flattened upper triangles into symmetric matrices with a zero diagonal."""
+        squares = np.zeros((*vectors.shape[:-1], self.n_objects, self.n_objects))
+        squares[..., self.triu_inds[0], self.triu_inds[1]] = vectors
+        squares[..., self.triu_inds[1], self.triu_inds[0]] = vectors
+        return squares
+
+    @staticmethod
+    def standardize(vectors: Array) -> Array:
+        """Center vectors along the last axis and scale them to unit norm."""
+        centered = vectors - vectors.mean(axis=-1, keepdims=True)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return centered / np.linalg.norm(centered, axis=-1, keepdims=True)
+
+    @staticmethod
+    def normalize(features: Array) -> Array:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return features / np.linalg.norm(features, axis=1, keepdims=True)
+
+    def get_model_vectors(self, features: List[Array]) -> Array:
+        """Compute the flattened upper triangles of the model RDMs for both kernels.
+
+        Features of different dimensionality are zero-padded, which leaves cosine similarities
+        unchanged, so that the RSMs of many models are obtained from one batched matmul.
+        """
+        n_features = max(X.shape[1] for X in features)
+        kernels = np.zeros((len(KERNELS), len(features), self.n_objects, n_features))
+        for m, X in enumerate(features):
+            assert (
+                X.shape[0] == self.n_objects
+            ), f"\nNumber of objects in the features ({X.shape[0]}) does not match the human RDM ({self.n_objects}).\n"
+            X = X.astype(np.float64)
+            kernels[0, m, :, : X.shape[1]] = self.normalize(X)
+            # the correlation kernel is the cosine kernel of row-centered features
+            kernels[1, m, :, : X.shape[1]] = self.normalize(
+                X - X.mean(axis=1, keepdims=True)
+            )
+        rsms = np.matmul(kernels, kernels.transpose(0, 1, 3, 2)).clip(min=-1.0, max=1.0)
+        return self.sign * rsms[..., self.triu_inds[0], self.triu_inds[1]]
+
+    def correlate(self, model_vectors: Array) -> Dict[str, Array]:
+        """Compute Spearman and Pearson correlations between model and human dissimilarities."""
+        pearson = self.standardize(model_vectors) @ self.human_pearson
+        spearman = (
+            self.standardize(rankdata(model_vectors, axis=-1)) @ self.human_spearman
+        )
+        return {"spearman": spearman, "pearson": pearson}
+
+    def permutation_test(
+        self, model_vectors: Array, correlations: Dict[str, Array]
+    ) -> Dict[str, Array]:
+        """One-sided p-values from permuting the stimulus labels of the human RDM.
+
+        Permuting stimuli only reorders the entries of the (standardized) upper triangle, so
+        every null correlation is a dot product with a gathered copy of the cached human vector.
+        """
+        human_squares = {
+            "spearman": self.to_square(self.human_spearman),
+            "pearson": self.to_square(self.human_pearson),
+        }
+        model_vectors = {
+            "spearman": self.standardize(rankdata(model_vectors, axis=-1)),
+            "pearson": self.standardize(model_vectors),
+        }
+        exceedances = {
+            name: np.zeros(values.shape) for name, values in correlations.items()
+        }
+        for start in range(0, self.n_permutations, self.chunk_size):
+            n_draws = min(self.chunk_size, self.n_permutations - start)
+            permutations = np.argsort(
+                self.rng.random((n_draws, self.n_objects)), axis=1
+            )
+            rows = permutations[:, self.triu_inds[0]]
+            cols = permutations[:, self.triu_inds[1]]
+            for name, observed in correlations.items():
+                # (K x M x T) @ (T x P) correlations under the null hypothesis
+                null = model_vectors[name] @ human_squares[name][rows, cols].T
+                exceedances[name] += (null >= observed[..., None] - 1e-12).sum(axis=-1)
+        return {
+            name: (1 + exceeded) / (1 + self.n_permutations)
+            for name, exceeded in exceedances.items()
+        }
+
+    @staticmethod
+    def masked_correlation(x: Array, y: Array, mask: Array) -> Array:
+        """Pearson correlation along the last axis that only considers entries within <mask>."""
+        weights = mask.astype(np.float64)
+        n_valid = weights.sum(axis=-1, keepdims=True)
+        x_c = (x - (x * weights).sum(axis=-1, keepdims=True) / n_valid) * weights
+        y_c = (y - (y * weights).sum(axis=-1, keepdims=True) / n_valid) * weights
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return (x_c * y_c).sum(axis=-1) / np.sqrt(
+                (x_c**2).sum(axis=-1) * (y_c**2).sum(axis=-1)
+            )
+
+    def bootstrap(self, model_vectors: Array) -> Dict[str, Array]:
+        """Percentile confidence intervals from resampling stimuli with replacement.
+
+        Pairs of a stimulus with its own copy are excluded, and ranks are recomputed per sample
+        with excluded pairs pushed to the end, so that they do not affect the ranks of valid pairs.
+        """
+        human_square = self.to_square(self.pairwise_dists_human)
+        model_squares = self.to_square(model_vectors)
+        samples = {
+            name: np.empty((self.n_bootstraps, *model_vectors.shape[:-1]))
+            for name in STATISTICS
+        }
+        for start in range(0, self.n_bootstraps, self.chunk_size):
+            n_draws = min(self.chunk_size, self.n_bootstraps - start)
+            draws = self.rng.integers(0, self.n_objects, size=(n_draws, self.n_objects))
+            rows = draws[:, self.triu_inds[0]]
+            cols = draws[:, self.triu_inds[1]]
+            valid = rows != cols
+            human = human_square[rows, cols]
+            # (K x M x B x T) resampled model dissimilarities
+            model = model_squares[..., rows, cols]
+            human_ranks = rankdata(np.where(valid, human, np.inf), axis=-1)
+            model_ranks = rankdata(np.where(valid, model, np.inf), axis=-1)
+            samples["spearman"][start : start + n_draws] = np.moveaxis(
+                self.masked_correlation(model_ranks, human_ranks, valid), -1, 0
+            )
+            samples["pearson"][start : start + n_draws] = np.moveaxis(
+                self.masked_correlation(model, human, valid), -1, 0
+            )
+        quantiles = [self.alpha / 2, 1 - self.alpha / 2]
+        # (K x M x 2) lower and upper bounds
+        return {
+            name: np.moveaxis(np.nanquantile(values, quantiles, axis=0), 0, -1)
+            for name, values in samples.items()
+        }
+
+    def compare(
+        self, features: List[Array], significance: bool = True
+    ) -> List[Dict[str, float]]:
+        """Perform RSA for the features of many models at once.
+
+        If <significance> is set and <n_permutations> or <n_bootstraps> is positive, p-values
+        and confidence intervals are reported next to every correlation coefficient.
+        """
+        rsa_stats = []
+        for start in range(0, len(features), self.batch_size):
+            batch = features[start : start + self.batch_size]
+            model_vectors = self.get_model_vectors(batch)
+            correlations = self.correlate(model_vectors)
+            statistics = {"": correlations}
+            if significance and self.n_permutations > 0:
+                statistics["_pval"] = self.permutation_test(model_vectors, correlations)
+            if significance and self.n_bootstraps > 0:
+                intervals = self.bootstrap(model_vectors)
+                statistics["_ci_low"] = {
+                    name: bounds[..., 0] for name, bounds in intervals.items()
+                }
+                statistics["_ci_high"] = {
+                    name: bounds[..., 1] for name, bounds in intervals.items()
+                }
+            for m, X in enumerate(batch):
+                # models with Infs or NaNs in their features cannot be evaluated
+                is_finite = np.isfinite(X).all()
+                rsa_stats.append(
+                    {
+                        f"{STATISTICS[name]}_{kernel}_kernel{suffix}": float(
+                            values[k, m] if is_finite else np.nan
+                        )
+                        for suffix, statistic in statistics.items()
+                        for name, values in statistic.items()
+                        for k, kernel in enumerate(KERNELS)
+                    }
+                )
+        return rsa_stats
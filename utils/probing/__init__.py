@@ -1,5 +1,37 @@
-from .data import TripletData
-from .helpers import (get_temperature, load_model_config, load_triplets,
-                      partition_triplets, standardize)
-from .transforms import Linear
-from .triplet_loss import TripletLoss
+import importlib
+
+# attributes are imported from their submodules on first access (PEP 562), such that
+# pytorch_lightning is only loaded by scripts that train probes
+_EXPORTS = {
+    "EpochTimer": "callbacks",
+    "LOADERS": "data",
+    "TripletBatchSampler": "data",
+    "TripletData": "data",
+    "TripletIndices": "data",
+    "get_batches": "data",
+    "get_temperature": "helpers",
+    "load_model_config": "helpers",
+    "load_triplets": "helpers",
+    "partition_triplets": "helpers",
+    "standardize": "helpers",
+    "Trial": "search",
+    "get_rungs": "search",
+    "successive_halving": "search",
+    "fit": "training",
+    "Linear": "transforms",
+    "FusedTripletLoss": "triplet_loss",
+    "TripletLoss": "triplet_loss",
+}
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name: str):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{_EXPORTS[name]}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
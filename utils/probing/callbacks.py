@@ -0,0 +1,19 @@
+import time
+
+import pytorch_lightning as pl
+
+
+class EpochTimer(pl.Callback):
+    """Log the wall-clock time of every training epoch."""
+
+    def __init__(self):
+        super().__init__()
+        self.epoch_times = []
+
+    def on_train_epoch_start(self, trainer, pl_module) -> None:
+        self.start = time.perf_counter()
+
+    def on_train_epoch_end(self, trainer, pl_module) -> None:
+        epoch_time = time.perf_counter() - self.start
+        self.epoch_times.append(epoch_time)
+        pl_module.log("epoch_time", epoch_time, on_epoch=True)
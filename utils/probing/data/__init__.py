@@ -1 +1,2 @@
-from .dataset import TripletData
\ No newline at end of file
+from .batches import LOADERS, TripletBatchSampler, TripletIndices, get_batches
+from .dataset import TripletData
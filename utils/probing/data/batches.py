@@ -0,0 +1,93 @@
+import math
+from typing import Iterator
+
+import numpy as np
+import torch
+from torch.utils.data import DataLoader
+
+from .dataset import TripletData
+
+Tensor = torch.Tensor
+Array = np.ndarray
+
+LOADERS = ["batched", "onehot"]
+
+
+class TripletIndices(torch.utils.data.Dataset):
+    """Triplets stored as a single contiguous tensor of object indices that is indexed per batch."""
+
+    def __init__(self, triplets: Array):
+        super(TripletIndices, self).__init__()
+        # compact (e.g., uint16) object indices are cast to int64 for indexing
+        self.triplets = torch.from_numpy(np.asarray(triplets, dtype=np.int64))
+
+    def __getitem__(self, indices: Tensor) -> Tensor:
+        return self.triplets[indices]
+
+    def __len__(self) -> int:
+        return self.triplets.shape[0]
+
+
+class TripletBatchSampler(torch.utils.data.Sampler):
+    """Yield (shuffled) slices of triplet indices, one per batch.
+
+    Triplets are shuffled by a single permutation per epoch, such that a batch is gathered
+    from the triplet tensor with a single indexing operation rather than one call per triplet.
+    """
+
+    def __init__(
+        self, n_triplets: int, batch_size: int, shuffle: bool, rnd_seed: int = 42
+    ):
+        self.n_triplets = n_triplets
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.rnd_seed = rnd_seed
+        self.epoch = 0
+
+    def __iter__(self) -> Iterator[Tensor]:
+        if self.shuffle:
+            # every process draws the same permutation for a given epoch
+            generator = torch.Generator()
+            generator.manual_seed(self.rnd_seed + self.epoch)
+            self.epoch += 1
+            indices = torch.randperm(self.n_triplets, generator=generator)
+        else:
+            indices = torch.arange(self.n_triplets)
+        yield from indices.split(self.batch_size)
+
+    def __len__(self) -> int:
+        return math.ceil(self.n_triplets / self.batch_size)
+
+
+def get_batches(
+    triplets: Array,
+    n_objects: int,
+    batch_size: int,
+    train: bool,
+    loader: str = "batched",
+    rnd_seed: int = 42,
+) -> DataLoader:
+    """Get batches of triplets, either as object indices or (the former) one-hot encodings."""
+    assert loader in LOADERS, f"\nLoader must be one of {LOADERS}.\n"
+    if loader == "onehot":
+        return DataLoader(
+            dataset=TripletData(triplets=triplets, n_objects=n_objects),
+            batch_size=batch_size,
+            shuffle=train,
+            num_workers=0,
+            drop_last=False,
+            pin_memory=train,
+        )
+    # automatic batching is disabled, since the sampler yields entire batches
+    return DataLoader(
+        dataset=TripletIndices(triplets),
+        sampler=TripletBatchSampler(
+            n_triplets=len(triplets),
+            batch_size=batch_size,
+            shuffle=train,
+            rnd_seed=rnd_seed,
+        ),
+        batch_size=None,
+        num_workers=0,
+        pin_memory=train,
+    )
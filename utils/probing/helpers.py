@@ -1,31 +1,28 @@
 import json
 import os
 import warnings
-from collections import defaultdict
 from typing import Dict, List
 
 import numpy as np
 
+from ..triplets import load_things_triplets
+
 Array = np.ndarray
 
 
 def load_triplets(data_root: str) -> Array:
-    """Load original train and test splits for THINGS from disk and concatenate them."""
-    train_triplets = np.load(os.path.join(data_root, "triplets", "train_90.npy"))
-    val_triplets = np.load(os.path.join(data_root, "triplets", "test_10.npy"))
-    triplets = np.concatenate((train_triplets, val_triplets), axis=0)
-    return triplets.astype(int)
+    """Load the (pre-concatenated) original train and test splits for THINGS as a memory-mapped uint16 array."""
+    return load_things_triplets(data_root)["all"]
 
 
-def partition_triplets(triplets: Array, train_objects: Array) -> Dict[str, List[int]]:
+def partition_triplets(triplets: Array, train_objects: Array) -> Dict[str, Array]:
     """Partition triplets into two disjoint object sets for training and validation."""
-    triplet_partitioning = defaultdict(list)
-    for triplet in triplets:
-        splits = list(
-            map(lambda obj: "train" if obj in train_objects else "val", triplet)
-        )
-        if len(set(splits)) == 1:
-            triplet_partitioning[splits.pop()].append(triplet.tolist())
+    is_train = np.isin(triplets, train_objects)
+    # triplets with objects from both sets are discarded
+    triplet_partitioning = {
+        "train": triplets[is_train.all(axis=1)],
+        "val": triplets[(~is_train).all(axis=1)],
+    }
     return triplet_partitioning
 
 
@@ -0,0 +1,176 @@
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import torch
+
+from .data import get_batches
+from .training import evaluate, get_state, train_epochs
+from .transforms import Linear
+
+Array = np.ndarray
+
+# data of a worker process, which is set once by the pool initializer
+_worker = {}
+
+
+@dataclass
+class Trial:
+    trial_id: int
+    config: Dict[str, Any]
+    epochs: int = 0
+    state: Optional[Any] = None
+    val_loss: float = float("inf")
+
+
+def get_rungs(min_epochs: int, max_epochs: int, eta: int) -> List[int]:
+    """Epoch budgets of the rungs: min_epochs * eta^r up to max_epochs."""
+    # integer arithmetic, since the floating-point logarithm rounds exact powers of eta down
+    rungs = [min_epochs]
+    while rungs[-1] * eta <= max_epochs:
+        rungs.append(rungs[-1] * eta)
+    return rungs
+
+
+def init_worker(
+    features: Array,
+    train_triplets: Array,
+    val_triplets: Array,
+    n_objects: int,
+    batch_size: int,
+    use_bias: bool,
+    num_threads: int,
+    rnd_seed: int,
+) -> None:
+    torch.set_num_threads(num_threads)
+    _worker.update(
+        features=features,
+        use_bias=use_bias,
+        rnd_seed=rnd_seed,
+        train_batches=get_batches(
+            triplets=train_triplets,
+            n_objects=n_objects,
+            batch_size=batch_size,
+            train=True,
+            rnd_seed=rnd_seed,
+        ),
+        val_batches=get_batches(
+            triplets=val_triplets,
+            n_objects=n_objects,
+            batch_size=batch_size,
+            train=False,
+        ),
+    )
+
+
+def run_trial(
+    trial_id: int,
+    config: Dict[str, Any],
+    state: Optional[Any],
+    epochs: int,
+    n_epochs: int,
+) -> Dict[str, Any]:
+    """Train a trial for <n_epochs> more epochs (resuming from its state) and evaluate it."""
+    optim_cfg = {
+        **config,
+        "use_bias": _worker["use_bias"],
+        "sigma": 1e-3,
+        "init": None if state is None else state[0],
+    }
+    torch.manual_seed(_worker["rnd_seed"] + trial_id)
+    probe = Linear(features=_worker["features"], optim_cfg=optim_cfg)
+    optimizer = probe.configure_optimizers()
+    if state is not None:
+        optimizer.load_state_dict(state[1])
+    # continue the sequence of per-epoch permutations where the previous rung stopped
+    _worker["train_batches"].sampler.epoch = epochs
+    start = time.perf_counter()
+    train_loss = train_epochs(probe, optimizer, _worker["train_batches"], n_epochs)
+    val_loss, val_acc = evaluate(probe, _worker["val_batches"])
+    return {
+        "trial_id": trial_id,
+        "train_loss": train_loss,
+        "val_loss": val_loss if np.isfinite(val_loss) else float("inf"),
+        "val_acc": val_acc,
+        "time": time.perf_counter() - start,
+        "state": get_state(probe, optimizer),
+    }
+
+
+def successive_halving(
+    configs: List[Dict[str, Any]],
+    features: Array,
+    train_triplets: Array,
+    val_triplets: Array,
+    n_objects: int,
+    batch_size: int = 256,
+    use_bias: bool = False,
+    min_epochs: int = 1,
+    max_epochs: int = 27,
+    eta: int = 3,
+    num_processes: int = 4,
+    num_threads: int = 1,
+    rnd_seed: int = 42,
+    verbose: bool = False,
+) -> Tuple[pd.DataFrame, Trial]:
+    """Search hyperparameters of linear probes by successive halving.
+
+    All configurations are trained for <min_epochs> epochs. After every rung, the best
+    1/<eta> of the trials (by validation cross-entropy) are promoted and trained further
+    (from where they stopped) until the next epoch budget, up to <max_epochs>. Trials are
+    trained in parallel on a local process pool. Returns the history of all trials and
+    rungs and the best trial of the final rung.
+    """
+    trials = [Trial(trial_id, config) for trial_id, config in enumerate(configs)]
+    history = []
+    with ProcessPoolExecutor(
+        max_workers=num_processes,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_worker,
+        initargs=(
+            features,
+            train_triplets,
+            val_triplets,
+            n_objects,
+            batch_size,
+            use_bias,
+            num_threads,
+            rnd_seed,
+        ),
+    ) as executor:
+        rungs = get_rungs(min_epochs, max_epochs, eta)
+        for rung, budget in enumerate(rungs):
+            futures = [
+                executor.submit(
+                    run_trial,
+                    trial.trial_id,
+                    trial.config,
+                    trial.state,
+                    trial.epochs,
+                    budget - trial.epochs,
+                )
+                for trial in trials
+            ]
+            for trial, future in zip(trials, futures):
+                result = future.result()
+                trial.state = result.pop("state")
+                trial.epochs = budget
+                trial.val_loss = result["val_loss"]
+                history.append(
+                    {**result, **trial.config, "rung": rung, "epochs": budget}
+                )
+            trials = sorted(trials, key=lambda trial: trial.val_loss)
+            if rung < len(rungs) - 1:
+                trials = trials[: max(1, len(trials) // eta)]
+            promoted = {trial.trial_id for trial in trials}
+            for row in history[-len(futures) :]:
+                row["promoted"] = row["trial_id"] in promoted
+            if verbose:
+                print(
+                    f"\nRung {rung} ({budget} epochs): best validation loss {trials[0].val_loss:.4f}, {len(promoted)} of {len(futures)} trials promoted\n"
+                )
+    return pd.DataFrame(history), trials[0]
@@ -0,0 +1,90 @@
+from typing import Any, Iterable, Tuple
+
+import numpy as np
+import torch
+
+from .transforms import Linear
+
+Tensor = torch.Tensor
+
+
+def train_epochs(
+    probe: Linear,
+    optimizer: torch.optim.Optimizer,
+    train_batches: Iterable[Tensor],
+    n_epochs: int,
+    max_norm: float = 1.0,
+) -> float:
+    """Train a linear probe without a Lightning trainer and return the training loss of the last epoch.
+
+    Every step computes the same objective and applies the same gradient clipping as
+    Linear.training_step under the Lightning trainer of main_probing.py.
+    """
+    probe.train()
+    for _ in range(n_epochs):
+        losses = []
+        for batch in train_batches:
+            optimizer.zero_grad()
+            anchor, positive, negative = probe.unbind(probe(batch))
+            dots = probe.compute_similarities(anchor, positive, negative)
+            c_entropy, _, _ = probe.loss_fun(dots)
+            loss = c_entropy + probe.regularization()
+            loss.backward()
+            torch.nn.utils.clip_grad_norm_(probe.parameters(), max_norm=max_norm)
+            optimizer.step()
+            losses.append(c_entropy.item())
+    return float(np.mean(losses))
+
+
+@torch.no_grad()
+def evaluate(probe: Linear, val_batches: Iterable[Tensor]) -> Tuple[float, float]:
+    """Cross-entropy and odd-one-out accuracy of a linear probe, averaged over triplets."""
+    probe.eval()
+    losses, accs, sizes = [], [], []
+    for batch in val_batches:
+        loss, acc = probe._shared_eval_step(batch, batch_idx=0)
+        losses.append(loss.item())
+        accs.append(float(acc))
+        sizes.append(batch.shape[0])
+    return (
+        float(np.average(losses, weights=sizes)),
+        float(np.average(accs, weights=sizes)),
+    )
+
+
+def fit(
+    probe: Linear,
+    optimizer: torch.optim.Optimizer,
+    train_batches: Iterable[Tensor],
+    val_batches: Iterable[Tensor],
+    max_epochs: int,
+    min_epochs: int = 1,
+    patience: int = 10,
+    min_delta: float = 1e-4,
+) -> Tuple[float, float, int]:
+    """Train a linear probe with early stopping on the validation cross-entropy.
+
+    Mirrors the EarlyStopping callback of main_probing.py: training stops after <patience>
+    epochs without an improvement of at least <min_delta>, but not before <min_epochs>.
+    Returns the validation loss and accuracy of the final probe and the number of epochs.
+    """
+    best_loss = float("inf")
+    wait = 0
+    for epoch in range(1, max_epochs + 1):
+        train_epochs(probe, optimizer, train_batches, n_epochs=1)
+        val_loss, val_acc = evaluate(probe, val_batches)
+        if not np.isfinite(val_loss):
+            break
+        if val_loss < best_loss - min_delta:
+            best_loss = val_loss
+            wait = 0
+        else:
+            wait += 1
+        if wait >= patience and epoch >= min_epochs:
+            break
+    return val_loss, val_acc, epoch
+
+
+def get_state(probe: Linear, optimizer: torch.optim.Optimizer) -> Any:
+    """Parameters of a probe and the state of its optimizer (to resume training)."""
+    return probe.get_parameters(), optimizer.state_dict()
@@ -1,11 +1,10 @@
 from typing import Any, Dict, List, Tuple
 
-import numpy as np
 import pytorch_lightning as pl
 import torch
 import torch.nn.functional as F
 
-from .triplet_loss import TripletLoss
+from .triplet_loss import FusedTripletLoss
 
 FrozenDict = Any
 Tensor = torch.Tensor
@@ -27,7 +26,7 @@ class Linear(pl.LightningModule):
         self.lr = optim_cfg["lr"]
         self.lmbda = optim_cfg["lmbda"]
         self.use_bias = optim_cfg["use_bias"]
-        self.loss_fun = TripletLoss(temperature=1.0)
+        self.loss_fun = FusedTripletLoss(temperature=1.0)
         initialization = self.get_initialization(optim_cfg)
         if self.use_bias:
             self.transform_w = torch.nn.Parameter(
@@ -46,6 +45,9 @@ class Linear(pl.LightningModule):
 
     def get_initialization(self, optim_cfg: Dict[str, Any]) -> Tensor:
         """Initialize the transformation matrix."""
+        if optim_cfg.get("init") is not None:
+            # warm start from a previous solution (e.g., for a neighbouring lambda)
+            return optim_cfg["init"]
         # initialize the transformation matrix with values drawn from a tight Gaussian with very small width
         weights = torch.normal(
             mean=torch.zeros(self.feature_dim, self.feature_dim),
@@ -57,11 +59,22 @@ class Linear(pl.LightningModule):
             return weights, bias
         return weights
 
-    def forward(self, one_hots: Tensor) -> Tensor:
+    def get_parameters(self) -> Any:
+        """Copy the current transformation (to initialize another probe)."""
+        weights = self.transform_w.data.detach().cpu().clone()
+        if self.use_bias:
+            return weights, self.transform_b.data.detach().cpu().clone()
+        return weights
+
+    def forward(self, batch: Tensor) -> Tensor:
+        """Embed a batch of triplets given as object indices or one-hot encodings."""
         embedding = self.features @ self.transform_w
         if self.use_bias:
             embedding += self.transform_b
-        batch_embeddings = one_hots @ embedding
+        if batch.is_floating_point():
+            return batch @ embedding
+        # gather rows of the embedding rather than multiplying with one-hot vectors
+        batch_embeddings = embedding[batch]
         return batch_embeddings
 
     @staticmethod
@@ -85,29 +98,8 @@ class Linear(pl.LightningModule):
         sim_k = torch.sum(positive * negative, dim=1)
         return (sim_i, sim_j, sim_k)
 
-    @staticmethod
-    def break_ties(probas: Tensor) -> Tensor:
-        return torch.tensor(
-            [
-                -1
-                if (
-                    torch.unique(pmf).shape[0] != pmf.shape[0]
-                    or torch.unique(pmf.round(decimals=2)).shape[0] == 1
-                )
-                else torch.argmax(pmf)
-                for pmf in probas
-            ]
-        )
-
-    def accuracy_(self, probas: Tensor, batching: bool = True) -> Tensor:
-        choices = self.break_ties(probas)
-        argmax = np.where(choices == 0, 1, 0)
-        acc = argmax.mean() if batching else argmax.tolist()
-        return acc
-
-    def choice_accuracy(self, similarities: float) -> float:
-        probas = F.softmax(torch.stack(similarities, dim=-1), dim=1)
-        choice_acc = self.accuracy_(probas)
+    def choice_accuracy(self, similarities: Tuple[Tensor, Tensor, Tensor]) -> Tensor:
+        _, _, choice_acc = self.loss_fun(similarities)
         return choice_acc
 
     @staticmethod
@@ -135,11 +127,10 @@ class Linear(pl.LightningModule):
         batch_embeddings = self(one_hots)
         anchor, positive, negative = self.unbind(batch_embeddings)
         dots = self.compute_similarities(anchor, positive, negative)
-        c_entropy = self.loss_fun(dots)
+        c_entropy, _, acc = self.loss_fun(dots)
         # apply l1 and l2 regularization during training to prevent overfitting to train objects
         complexity_loss = self.regularization()
         loss = c_entropy + complexity_loss
-        acc = self.choice_accuracy(dots)
         self.log("train_loss", c_entropy, on_epoch=True)
         self.log("train_acc", acc, on_epoch=True)
         return loss
@@ -160,8 +151,7 @@ class Linear(pl.LightningModule):
         batch_embeddings = self(one_hots)
         anchor, positive, negative = self.unbind(batch_embeddings)
         similarities = self.compute_similarities(anchor, positive, negative)
-        loss = self.loss_fun(similarities)
-        acc = self.choice_accuracy(similarities)
+        loss, _, acc = self.loss_fun(similarities)
         return loss, acc
 
     def predict_step(self, one_hots: Tensor, batch_idx: int):
@@ -1,4 +1,4 @@
-from typing import Tuple
+from typing import Tuple, Union
 
 import torch
 import torch.nn as nn
@@ -12,9 +12,7 @@ class TripletLoss(nn.Module):
         self.temperature = temperature
 
     def logsumexp(self, dots: Tuple[Tensor]) -> Tensor:
-        return torch.log(
-            torch.sum(torch.exp(torch.stack(dots) / self.temperature), dim=0)
-        )
+        return torch.logsumexp(torch.stack(dots) / self.temperature, dim=0)
 
     def log_softmax(self, dots: Tuple[Tensor]) -> Tensor:
         return dots[0] / self.temperature - self.logsumexp(dots)
@@ -25,3 +23,44 @@ class TripletLoss(nn.Module):
     def forward(self, dots: Tuple[Tensor]):
         loss = self.cross_entropy_loss(dots)
         return loss
+
+
+class FusedTripletLoss(nn.Module):
+    """Cross-entropy, choices and choice accuracy for a batch of triplet similarities in a single pass.
+
+    The similarities are upcast to float32 (e.g., under bf16/float16 autocast) and the log-partition
+    function is computed with logsumexp, such that large unnormalized dot products cannot overflow.
+    Choices are the argmax over the three similarities or -1 for ties (counted as wrong choices).
+    """
+
+    def __init__(self, temperature: float = 1.0) -> None:
+        super(FusedTripletLoss, self).__init__()
+        self.temperature = temperature
+
+    @staticmethod
+    def get_ties(probas: Tensor) -> Tensor:
+        """Triplets with (at least) two identical probabilities or three probabilities that are equal up to two decimals."""
+        sorted_probas = torch.sort(probas, dim=1).values
+        duplicates = (sorted_probas[:, 1:] == sorted_probas[:, :-1]).any(dim=1)
+        rounded = probas.round(decimals=2)
+        uniform = (rounded == rounded[:, :1]).all(dim=1)
+        return duplicates | uniform
+
+    def forward(
+        self, similarities: Union[Tensor, Tuple[Tensor]]
+    ) -> Tuple[Tensor, Tensor, Tensor]:
+        if isinstance(similarities, (tuple, list)):
+            similarities = torch.stack(similarities, dim=-1)
+        logits = similarities.float() / self.temperature
+        log_z = torch.logsumexp(logits, dim=1, keepdim=True)
+        log_probas = logits - log_z
+        loss = -log_probas[:, 0].mean()
+        with torch.no_grad():
+            probas = log_probas.exp()
+            choices = torch.where(
+                self.get_ties(probas),
+                torch.full_like(probas[:, 0], -1, dtype=torch.long),
+                torch.argmax(logits, dim=1),
+            )
+            acc = (choices == 0).float().mean()
+        return loss, choices, acc
@@ -0,0 +1,179 @@
+import json
+import os
+import shutil
+import tempfile
+import warnings
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+Array = np.ndarray
+
+# original THINGS triplet files, stored in the order in which they are concatenated
+THINGS_SPLITS = {
+    "train": "train_90.npy",
+    "test": "test_10.npy",
+    "aligned": "correct_triplets.npy",
+}
+STORE_SUFFIX = ".store"
+META_FILE = "meta.json"
+TRIPLET_FILE = "triplets.npy"
+MASK_FILE = "aligned_mask.npy"
+
+
+def get_dtype(n_objects: int) -> np.dtype:
+    """Smallest unsigned integer type for object indices (uint16 for up to 65536 objects, e.g., THINGS and CIFAR)."""
+    return (
+        np.dtype(np.uint16)
+        if n_objects <= np.iinfo(np.uint16).max
+        else np.dtype(np.uint32)
+    )
+
+
+@dataclass
+class TripletStore:
+    """Compact, pre-concatenated and memory-mapped triplets with the boundaries of their splits.
+
+    Splits are contiguous slices of the memory-mapped array, i.e., they are views rather than copies.
+    Object indices should be cast to int64 where triplets become torch tensors.
+    """
+
+    triplets: Array
+    splits: Dict[str, Tuple[int, int]]
+    n_objects: int
+    aligned_mask: Optional[Array] = None
+
+    def __getitem__(self, split: str) -> Array:
+        start, stop = self.splits[split]
+        return self.triplets[start:stop]
+
+
+def get_row_keys(triplets: Array, n_objects: int) -> Array:
+    """Encode every triplet as a single integer (to match triplets across splits)."""
+    triplets = triplets.astype(np.int64)
+    return (triplets[:, 0] * n_objects + triplets[:, 1]) * n_objects + triplets[:, 2]
+
+
+def get_sources(files: Dict[str, str]) -> Dict[str, Dict[str, float]]:
+    return {
+        split: {
+            "file": os.path.basename(path),
+            "size": os.path.getsize(path),
+            "mtime": os.path.getmtime(path),
+        }
+        for split, path in files.items()
+    }
+
+
+def build_store(files: Dict[str, str], store_path: str) -> None:
+    """Concatenate triplet files (in the given order) into a compact store at <store_path>."""
+    arrays = {split: np.load(path) for split, path in files.items()}
+    n_objects = max(int(triplets.max()) + 1 for triplets in arrays.values())
+    splits, start = {}, 0
+    for split, triplets in arrays.items():
+        splits[split] = (start, start + triplets.shape[0])
+        start += triplets.shape[0]
+    if (
+        "train" in splits
+        and "test" in splits
+        and splits["train"][1] == splits["test"][0]
+    ):
+        # original train and test splits are adjacent and form the set of all triplets
+        splits["all"] = (splits["train"][0], splits["test"][1])
+    tmp_path = tempfile.mkdtemp(dir=os.path.dirname(store_path))
+    try:
+        triplets = np.lib.format.open_memmap(
+            os.path.join(tmp_path, TRIPLET_FILE),
+            mode="w+",
+            dtype=get_dtype(n_objects),
+            shape=(start, 3),
+        )
+        for split, array in arrays.items():
+            triplets[slice(*splits[split])] = array
+        triplets.flush()
+        if "aligned" in arrays and "all" in splits:
+            all_keys = get_row_keys(triplets[slice(*splits["all"])], n_objects)
+            aligned_keys = get_row_keys(arrays["aligned"], n_objects)
+            np.save(os.path.join(tmp_path, MASK_FILE), np.isin(all_keys, aligned_keys))
+        with open(os.path.join(tmp_path, META_FILE), "w") as f:
+            json.dump(
+                {
+                    "dtype": triplets.dtype.name,
+                    "n_objects": n_objects,
+                    "splits": splits,
+                    "sources": get_sources(files),
+                },
+                f,
+                indent=2,
+            )
+        del triplets
+        if os.path.isdir(store_path):
+            # replace a stale store
+            shutil.rmtree(store_path)
+        os.rename(tmp_path, store_path)
+    except OSError:
+        # another process has built the store concurrently
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        if not os.path.isdir(store_path):
+            raise
+
+
+def is_stale(files: Dict[str, str], store_path: str) -> bool:
+    meta_path = os.path.join(store_path, META_FILE)
+    if not os.path.isfile(meta_path):
+        return True
+    with open(meta_path, "r") as f:
+        meta = json.load(f)
+    return meta["sources"] != get_sources(files)
+
+
+def load_store(store_path: str, mmap_mode: str = "r") -> TripletStore:
+    with open(os.path.join(store_path, META_FILE), "r") as f:
+        meta = json.load(f)
+    mask_path = os.path.join(store_path, MASK_FILE)
+    return TripletStore(
+        triplets=np.load(os.path.join(store_path, TRIPLET_FILE), mmap_mode=mmap_mode),
+        splits={split: tuple(bounds) for split, bounds in meta["splits"].items()},
+        n_objects=meta["n_objects"],
+        aligned_mask=(
+            np.load(mask_path, mmap_mode=mmap_mode)
+            if os.path.isfile(mask_path)
+            else None
+        ),
+    )
+
+
+def get_store(files: Dict[str, str], store_path: str) -> TripletStore:
+    """Load a triplet store and (re)build it first if it is missing or older than its source files."""
+    if is_stale(files, store_path):
+        try:
+            build_store(files, store_path)
+        except OSError as error:
+            warnings.warn(
+                message=f"\nCould not write triplet store to <{store_path}>: {error}.\nLoading triplets into memory instead.\n",
+                category=UserWarning,
+            )
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                tmp_path = os.path.join(tmp_dir, os.path.basename(store_path))
+                build_store(files, tmp_path)
+                store = load_store(tmp_path, mmap_mode=None)
+            return store
+    return load_store(store_path)
+
+
+def load_things_triplets(root: str) -> TripletStore:
+    """Triplet store of THINGS with train, test, all (i.e., train and test) and aligned splits."""
+    triplet_dir = os.path.join(root, "triplets")
+    files = {
+        split: os.path.join(triplet_dir, file_name)
+        for split, file_name in THINGS_SPLITS.items()
+        if os.path.isfile(os.path.join(triplet_dir, file_name))
+    }
+    return get_store(files, os.path.join(triplet_dir, "things" + STORE_SUFFIX))
+
+
+def load_triplet_file(triplet_path: str) -> Array:
+    """Compact and memory-mapped triplets of a single triplet file (e.g., for CIFAR)."""
+    store_path = os.path.splitext(triplet_path)[0] + STORE_SUFFIX
+    return get_store({"all": triplet_path}, store_path)["all"]